@@ -13,14 +13,17 @@ from kidney_transplant_llm.postproc.schema import (
 
 def create_view_str(highlights='irae__highlights_donor',
                     sample='irae__sample_casedef_index',
-                    origin=NLP_DONOR_GPT_OSS_120B) -> str:
+                    origin=NLP_DONOR_GPT_OSS_120B,
+                    view=None) -> str:
     """
     :param sample: SQL Table name of sample CaseDef
     :param highlights: SQL Table name of highlights LLM
     :param origin: default GPT_OSS_120B
+    :param view: SQL view name, default `filetool.name_view(highlights, sample)`
     :return: str SELECT
     """
-    view = filetool.name_view(highlights, sample)
+    if view is None:
+        view = filetool.name_view(highlights, sample)
 
     sample_cols = [f'sample.{col}' for col in SAMPLE_COLS]
     sample_cols = '\n,'.join(sample_cols)
@@ -43,10 +46,11 @@ def create_view_str(highlights='irae__highlights_donor',
 
 def create_view_sql(highlights='irae__highlights_donor',
                     sample='irae__sample_casedef_index',
-                    origin=NLP_DONOR_GPT_OSS_120B) -> Path:
-
-    view = filetool.name_view(highlights, sample)
-    text_sql = create_view_str(highlights, sample, origin)
+                    origin=NLP_DONOR_GPT_OSS_120B,
+                    view=None) -> Path:
+    if view is None:
+        view = filetool.name_view(highlights, sample)
+    text_sql = create_view_str(highlights, sample, origin, view)
     file_sql = filetool.path_highlights(f'{view}.sql')
     with open(str(file_sql), 'w') as f:
         f.write(text_sql)
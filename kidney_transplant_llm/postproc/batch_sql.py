@@ -0,0 +1,206 @@
+import abc
+import argparse
+import csv
+import re
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+import pandas as pd
+from kidney_transplant_llm.postproc import athena, filetool
+from kidney_transplant_llm.postproc.schema import (
+    PIPELINES,
+    SAMPLES,
+    PIPELINE_ORIGINS,
+    SAMPLE_COLS)
+
+###############################################################################
+# Batch view SQL
+#
+# Every highlights x sample x origin combination gets its view SQL from
+# `athena.create_view_str`; statements are submitted through an Executor with
+# at most `concurrency` queries in flight, polled until they finish, and each
+# result is written to `filetool.path_highlights('{view}.csv')` as soon as it
+# completes.
+#
+# Executor is the pluggable part: submit(sql, view) -> query id,
+# poll(query id) -> QUEUED/RUNNING/SUCCEEDED/FAILED, fetch(query id, csv).
+# SQLiteExecutor is the local embedded stand-in, it runs the same SQL on
+# CSV exports of the highlights and sample tables.
+###############################################################################
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED'
+CONCURRENCY = 4
+POLL_SECONDS = 1.0
+
+class ViewJob(NamedTuple):
+    highlights: str
+    sample: str
+    origin: str
+    view: str
+
+def view_jobs(pipelines: List[str] = None, samples: List[str] = None) -> List[ViewJob]:
+    """
+    :return: every (highlights, sample, origin) combination of the pipelines
+    """
+    jobs = list()
+    for pipeline in pipelines or list(PIPELINES):
+        for sample in samples or list(SAMPLES):
+            for origin in PIPELINE_ORIGINS[pipeline]:
+                jobs.append(ViewJob(*filetool.resolve_view(pipeline, sample, origin)))
+    return jobs
+
+def create_unload_str(view: str, location: str) -> str:
+    """
+    :param location: s3:// prefix for the CSV export
+    :return: str UNLOAD of the view
+    """
+    return (f"UNLOAD (SELECT * FROM {view})\n"
+            f"TO '{location.rstrip('/')}/{view}/'\n"
+            f"WITH (format = 'TEXTFILE', field_delimiter = ',', compression = 'NONE');\n")
+
+class Executor(abc.ABC):
+    """
+    Interface of a SQL engine; see SQLiteExecutor for a local implementation.
+    """
+    @abc.abstractmethod
+    def submit(self, sql: str, view: str) -> str:
+        pass
+
+    @abc.abstractmethod
+    def poll(self, query_id: str) -> str:
+        pass
+
+    @abc.abstractmethod
+    def fetch(self, query_id: str, output_csv: Path) -> Path:
+        pass
+
+    def error(self, query_id: str) -> str:
+        return ''
+
+class SQLiteExecutor(Executor):
+    """
+    Local embedded SQL: the highlights and sample tables are loaded from CSV
+    into one SQLite file, each query runs in a worker thread on its own connection.
+    """
+    def __init__(self, tables: Dict[str, Path], db_path: Path = None, workers: int = CONCURRENCY):
+        """
+        :param tables: SQL table name -> CSV export, e.g. {'irae__sample_casedef_index': path_sample_index()}
+        """
+        self.db_path = Path(db_path or filetool.path_phi_dir() / 'local.sqlite')
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.db_path) as con:
+            for name, csv in tables.items():
+                pd.read_csv(csv).to_sql(name, con, if_exists='replace', index=False)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures: Dict[str, Future] = dict()
+
+    @staticmethod
+    def translate(sql: str) -> str:
+        """
+        Athena 'CREATE or replace view' -> SQLite 'DROP VIEW IF EXISTS; CREATE VIEW'.
+        ORDER BY columns are qualified with the sample table: Athena resolves them
+        as output columns, SQLite finds `subject_ref` in both tables and fails as ambiguous.
+        """
+        sql = re.sub(r'CREATE\s+or\s+replace\s+view\s+(\S+)',
+                     r'DROP VIEW IF EXISTS \1;\nCREATE VIEW \1', sql, flags=re.IGNORECASE)
+
+        def qualify(match: re.Match) -> str:
+            cols = [col.strip() for col in match.group(1).split(',')]
+            return 'ORDER BY ' + ', '.join(f'sample.{col}' if col in SAMPLE_COLS else col for col in cols)
+
+        return re.sub(r'ORDER BY\s+([^;\n]+)', qualify, sql, flags=re.IGNORECASE)
+
+    def _run(self, sql: str, view: str) -> list:
+        with sqlite3.connect(self.db_path, timeout=60) as con:
+            con.executescript(self.translate(sql))
+            cursor = con.execute(f'SELECT * FROM {view}')
+            return [tuple(col[0] for col in cursor.description)] + cursor.fetchall()
+
+    def submit(self, sql: str, view: str) -> str:
+        query_id = str(uuid.uuid4())
+        self._futures[query_id] = self._pool.submit(self._run, sql, view)
+        return query_id
+
+    def poll(self, query_id: str) -> str:
+        future = self._futures[query_id]
+        if future.running():
+            return RUNNING
+        if not future.done():
+            return QUEUED
+        return FAILED if future.exception() else SUCCEEDED
+
+    def error(self, query_id: str) -> str:
+        return str(self._futures[query_id].exception())
+
+    def fetch(self, query_id: str, output_csv: Path) -> Path:
+        rows = self._futures.pop(query_id).result()
+        with open(output_csv, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        return output_csv
+
+def run_batch(executor: Executor,
+              jobs: List[ViewJob],
+              concurrency: int = CONCURRENCY,
+              poll_seconds: float = POLL_SECONDS) -> List[Path]:
+    """
+    Submit the view SQL of every job with at most `concurrency` in flight.
+
+    :return: list of `{view}.csv` written, in completion order
+    """
+    pending, running, written, failed = list(jobs), dict(), list(), list()
+    while pending or running:
+        while pending and len(running) < concurrency:
+            job = pending.pop(0)
+            athena.create_view_sql(job.highlights, job.sample, job.origin, job.view)
+            sql = athena.create_view_str(job.highlights, job.sample, job.origin, job.view)
+            running[executor.submit(sql, job.view)] = job
+            print(f'[submit] {job.view}')
+
+        for query_id, job in list(running.items()):
+            state = executor.poll(query_id)
+            if state == SUCCEEDED:
+                output_csv = executor.fetch(query_id, filetool.path_highlights(f'{job.view}.csv'))
+                written.append(output_csv)
+                del running[query_id]
+                print(f'[done] {output_csv}')
+            elif state == FAILED:
+                failed.append(job.view)
+                del running[query_id]
+                print(f'[failed] {job.view}: {executor.error(query_id)}')
+        if running:
+            time.sleep(poll_seconds)
+    if failed:
+        raise RuntimeError(f'{len(failed)} view(s) failed: {failed}')
+    return written
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Build every view SQL and run it on a local SQL engine.')
+    parser.add_argument('--pipeline', nargs='+', choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument('--sample', nargs='+', choices=list(SAMPLES), default=list(SAMPLES))
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='seconds between polls')
+    parser.add_argument('--unload', default=None, help='s3:// prefix: also write {view}.unload.sql')
+    args = parser.parse_args(argv)
+
+    jobs = list()
+    for job in view_jobs(args.pipeline, args.sample):
+        if args.unload:
+            with open(filetool.path_highlights(f'{job.view}.unload.sql'), 'w') as f:
+                f.write(create_unload_str(job.view, args.unload))
+        tables = {job.highlights: filetool.path_highlights(f'{job.highlights}.csv'),
+                  job.sample: filetool.path_sample(f'{job.sample}.csv')}
+        missing = [str(csv) for csv in tables.values() if not csv.exists()]
+        if missing:
+            print(f'[skip] {job.view}: no local export {missing}')
+        else:
+            jobs.append(job)
+
+    tables = {job.highlights: filetool.path_highlights(f'{job.highlights}.csv') for job in jobs}
+    tables.update({job.sample: filetool.path_sample(f'{job.sample}.csv') for job in jobs})
+    executor = SQLiteExecutor(tables, workers=args.concurrency)
+    run_batch(executor, jobs, args.concurrency, args.poll)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+from pathlib import Path
+from typing import Dict
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool
+from kidney_transplant_llm.postproc.schema import (
+    SAMPLE_PRE,
+    SAMPLE_INDEX,
+    SAMPLE_POST,
+    SUBJECT_REF,
+    ENCOUNTER_REF,
+    DOCUMENT_REF,
+    SORT_BY_DATE,
+    ENC_ORDINAL,
+    DOC_ORDINAL)
+
+###############################################################################
+# Local builder for irae__sample_casedef_pre/index/post
+#
+# Input tables (CSV exports or DataFrames):
+#   encounters  subject_ref, encounter_ref, enc_period_start_day
+#   documents   subject_ref, encounter_ref (may be empty), documentreference_ref,
+#               doc_author_day, doc_date, doc_type_code, doc_type_display, doc_type_system
+#   index       subject_ref, index_date (one or more per subject)
+#
+# Notes are assigned to the pre/index/post window of the nearest index date
+# with sorted as-of joins, so the window definition can change without another
+# Athena cycle.
+###############################################################################
+INDEX_DATE = 'index_date'
+ENC_START = 'enc_period_start_day'
+DAYS_BEFORE_INDEX = 7
+DAYS_AFTER_INDEX = 30
+
+CASEDEF_COLS = ['group_name', SUBJECT_REF, ENCOUNTER_REF, DOCUMENT_REF,
+                ENC_ORDINAL, ENC_START, 'doc_author_day', 'doc_date',
+                SORT_BY_DATE, DOC_ORDINAL,
+                'doc_type_code', 'doc_type_display', 'doc_type_system']
+
+WINDOWS = {'pre': SAMPLE_PRE, 'index': SAMPLE_INDEX, 'post': SAMPLE_POST}
+
+def _dates(df: pd.DataFrame, cols: list) -> pd.DataFrame:
+    # one resolution for every column: merge_asof refuses keys of different units
+    return df.assign(**{col: pd.to_datetime(df[col], errors='coerce').astype('datetime64[ns]')
+                        for col in cols if col in df.columns})
+
+def attach_encounters(documents: pd.DataFrame, encounters: pd.DataFrame) -> pd.DataFrame:
+    """
+    Documents with an encounter_ref get its period start; documents without one
+    are attached to the subject's latest encounter starting on or before the note.
+    Orphans with no date, or dated before every encounter, keep a null encounter.
+    """
+    documents = _dates(documents, ['doc_author_day', 'doc_date'])
+    encounters = _dates(encounters, [ENC_START])[[SUBJECT_REF, ENCOUNTER_REF, ENC_START]]
+
+    linked = documents[documents[ENCOUNTER_REF].notna()].merge(
+        encounters.drop(columns=SUBJECT_REF), on=ENCOUNTER_REF, how='left')
+
+    orphans = documents[documents[ENCOUNTER_REF].isna()].drop(columns=ENCOUNTER_REF)
+    orphans = orphans.assign(_date=orphans['doc_date'].fillna(orphans['doc_author_day']))
+    undated = orphans[orphans['_date'].isna()].drop(columns='_date')
+    orphans = pd.merge_asof(orphans[orphans['_date'].notna()].sort_values('_date'),
+                            encounters.dropna(subset=[ENC_START]).sort_values(ENC_START),
+                            left_on='_date', right_on=ENC_START, by=SUBJECT_REF,
+                            direction='backward').drop(columns='_date')
+    return pd.concat([linked, orphans, undated], ignore_index=True)
+
+def assign_windows(notes: pd.DataFrame, index: pd.DataFrame,
+                   days_before: int = DAYS_BEFORE_INDEX,
+                   days_after: int = DAYS_AFTER_INDEX) -> pd.DataFrame:
+    """
+    :return: notes with index_date (nearest per subject) and group_name pre/index/post
+    """
+    index = _dates(index, [INDEX_DATE])[[SUBJECT_REF, INDEX_DATE]].dropna()
+    undated = notes[SORT_BY_DATE].isna()
+    if undated.any():
+        print(f'{undated.sum()} notes without any date are left out of every window')
+    notes = notes[~undated].sort_values(SORT_BY_DATE)
+    notes = pd.merge_asof(notes, index.sort_values(INDEX_DATE),
+                          left_on=SORT_BY_DATE, right_on=INDEX_DATE, by=SUBJECT_REF,
+                          direction='nearest')
+    notes = notes[notes[INDEX_DATE].notna()]
+    delta = (notes[SORT_BY_DATE] - notes[INDEX_DATE]).dt.days.to_numpy()
+    notes['group_name'] = np.select([delta < -days_before, delta > days_after], ['pre', 'post'], 'index')
+    return notes
+
+def add_ordinals(notes: pd.DataFrame) -> pd.DataFrame:
+    """
+    enc_period_ordinal: sequence of the encounter within (group_name, subject)
+    doc_ordinal:        sequence of the document within its encounter
+    Documents with a null encounter_ref share one encounter, ordered last.
+    """
+    notes = notes.sort_values(['group_name', SUBJECT_REF, ENC_START, ENCOUNTER_REF,
+                               SORT_BY_DATE, DOCUMENT_REF], kind='stable', ignore_index=True)
+    subject_key = notes['group_name'] + '|' + notes[SUBJECT_REF]
+    new_subject = subject_key.ne(subject_key.shift()).to_numpy()
+    # NaN != NaN: compare on a filled key so null encounters do not split
+    encounter_key = notes[ENCOUNTER_REF].fillna('').astype(str)
+    new_encounter = new_subject | encounter_key.ne(encounter_key.shift()).to_numpy()
+
+    enc_count = np.cumsum(new_encounter)
+    notes[ENC_ORDINAL] = enc_count - np.maximum.accumulate(np.where(new_subject, enc_count, 0)) + 1
+    doc_count = np.arange(len(notes))
+    notes[DOC_ORDINAL] = doc_count - np.maximum.accumulate(np.where(new_encounter, doc_count, 0)) + 1
+    return notes
+
+def build_casedef_df(encounters: pd.DataFrame,
+                     documents: pd.DataFrame,
+                     index: pd.DataFrame,
+                     days_before: int = DAYS_BEFORE_INDEX,
+                     days_after: int = DAYS_AFTER_INDEX) -> Dict[str, pd.DataFrame]:
+    """
+    :return: dict 'pre'/'index'/'post' -> casedef DataFrame in the pipeline's format
+    """
+    notes = attach_encounters(documents, encounters)
+    notes[SORT_BY_DATE] = notes['doc_date'].fillna(notes['doc_author_day']).fillna(notes[ENC_START])
+    notes = add_ordinals(assign_windows(notes, index, days_before, days_after))
+    for col in CASEDEF_COLS:
+        if col not in notes.columns:
+            notes[col] = None
+    for col in [ENC_START, 'doc_author_day', 'doc_date', SORT_BY_DATE]:
+        notes[col] = notes[col].dt.strftime('%Y-%m-%d')
+
+    notes = notes[CASEDEF_COLS]
+    ordered = [SUBJECT_REF, SORT_BY_DATE, ENC_ORDINAL, DOC_ORDINAL]
+    return {window: notes[notes['group_name'] == window].sort_values(ordered, kind='stable', ignore_index=True)
+            for window in WINDOWS}
+
+def build_casedef_csv(encounters_csv: Path | str,
+                      documents_csv: Path | str,
+                      index_csv: Path | str,
+                      days_before: int = DAYS_BEFORE_INDEX,
+                      days_after: int = DAYS_AFTER_INDEX) -> list[Path]:
+    """
+    Write the three casedef tables to `filetool.path_sample()`.
+
+    :return: list of Paths written
+    """
+    tables = build_casedef_df(pd.read_csv(encounters_csv),
+                              pd.read_csv(documents_csv),
+                              pd.read_csv(index_csv),
+                              days_before, days_after)
+    written = list()
+    for window, table in tables.items():
+        output_csv = filetool.path_sample(f'{WINDOWS[window]}.csv')
+        output_csv.parent.mkdir(parents=True, exist_ok=True)
+        table.to_csv(output_csv, index=False)
+        print(f'{output_csv} rows={len(table)}')
+        written.append(output_csv)
+    return written
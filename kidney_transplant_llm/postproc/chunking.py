@@ -0,0 +1,158 @@
+import re
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Tuple
+from pydantic import BaseModel
+from kidney_transplant_llm import pydantic_study_variables as study
+
+###############################################################################
+# Long note chunking
+#
+# Notes longer than the model context are split into overlapping windows that
+# end on a section, sentence or line boundary when one is near. The annotation
+# model runs on each chunk and the per-chunk results are merged into one
+# annotation for the note:
+#   has_mention and bool fields   OR (bool | None: None only if every chunk is None)
+#   spans                         union, in note order
+#   enum fields in ENUM_PRECEDENCE  a value beats the field default; between
+#                                 values, the first in the precedence order wins
+#   other enum / text fields      a value beats the field default; between
+#                                 values, most chunks wins, ties to the earliest
+# Span text is located in its chunk and reported as "start:end" offsets of the
+# original note, the format of the highlights `span` column.
+###############################################################################
+MAX_CHARS = 24_000
+OVERLAP_CHARS = 1_000
+
+# best boundary first; each pattern matches the text right after the boundary
+BOUNDARIES = [r'\n\s*\n', r'[.!?]\s+', r'\n', r'\s']
+
+Chunk = Tuple[int, str]
+
+# strongest evidence first: one chunk with a biopsy-proven rejection outranks
+# two chunks that only suspect it; members not listed are merged by majority
+CERTAINTY = ['BIOPSY_PROVEN', 'CONFIRMED', 'SUSPECTED']
+ENUM_PRECEDENCE = {
+    study.DSAPresent: CERTAINTY,
+    study.InfectionPresent: CERTAINTY,
+    study.ViralInfectionPresent: CERTAINTY,
+    study.BacterialInfectionPresent: CERTAINTY,
+    study.FungalInfectionPresent: CERTAINTY,
+    study.GraftRejectionPresent: CERTAINTY,
+    study.GraftFailurePresent: CERTAINTY,
+    study.PTLDPresent: CERTAINTY,
+    study.CancerPresent: CERTAINTY,
+    study.Serostatus: ['SEROPOSITIVE', 'SERONEGATIVE'],
+    study.RxCompliance: ['NON_COMPLIANT', 'PARTIALLY_COMPLIANT', 'COMPLIANT'],
+}
+
+def _cut(text: str, lo: int, hi: int, last: bool = True) -> int:
+    """
+    :return: position in (lo, hi] just after the last (or first) best boundary, `hi` if none
+    """
+    window = text[lo:hi]
+    for pattern in BOUNDARIES:
+        hits = list(re.finditer(pattern, window))
+        if hits:
+            return lo + hits[-1 if last else 0].end()
+    return hi
+
+def chunk_note(text: str,
+               max_chars: int = MAX_CHARS,
+               overlap: int = OVERLAP_CHARS) -> Iterator[Chunk]:
+    """
+    :param text: note text
+    :param max_chars: chunk size limit
+    :param overlap: characters repeated at the start of the next chunk
+    :return: generator of (offset in note, chunk text)
+    """
+    if overlap >= max_chars // 2:
+        raise ValueError(f'overlap {overlap} must be less than half of max_chars {max_chars}')
+    start = 0
+    while True:
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            end = _cut(text, end - max_chars // 4, end)
+        yield start, text[start:end]
+        if end >= len(text):
+            return
+        # restart `overlap` characters back, on a boundary if there is one
+        back = end - overlap
+        start = _cut(text, back, end, last=False)
+        start = start if start < end else back
+
+###############################################################################
+# Merge per-chunk annotations
+###############################################################################
+def span_offsets(chunk_start: int, chunk_text: str, span_texts: List[str]) -> List[Tuple[int, int]]:
+    """
+    :return: (start, end) in note coordinates of each span text found in the chunk
+    """
+    lower = chunk_text.lower()
+    offsets = list()
+    for span in span_texts:
+        pos = chunk_text.find(span)
+        if pos < 0:
+            pos = lower.find(span.lower())
+        if pos >= 0:
+            offsets.append((chunk_start + pos, chunk_start + pos + len(span)))
+    return offsets
+
+def merge_mentions(mention_cls: type[study.SpanAugmentedMention],
+                   mentions: List[study.SpanAugmentedMention]) -> study.SpanAugmentedMention:
+    """
+    :param mentions: results of the same mention field, one per chunk in note order
+    """
+    merged = dict(has_mention=any(m.has_mention for m in mentions),
+                  spans=list(dict.fromkeys(span for m in mentions for span in m.spans)))
+    for name, field in mention_cls.model_fields.items():
+        if name in study.SpanAugmentedMention.model_fields:
+            continue
+        values = [getattr(m, name) for m in mentions]
+        if field.annotation is bool:
+            merged[name] = any(values)
+            continue
+        if field.annotation == (bool | None):
+            known = [v for v in values if v is not None]
+            merged[name] = any(known) if known else field.default
+            continue
+        votes = Counter(v for v in values if v is not None and v != field.default)
+        order = ENUM_PRECEDENCE.get(field.annotation, [])
+        ranked = [v for v in votes if getattr(v, 'name', None) in order]
+        if ranked:
+            merged[name] = min(ranked, key=lambda v: order.index(v.name))
+        elif votes:
+            top = max(votes.values())
+            merged[name] = next(v for v in values if votes.get(v) == top)
+        else:
+            merged[name] = field.default
+    return mention_cls(**merged)
+
+def merge_chunks(model: type[BaseModel],
+                 results: List[Tuple[Chunk, BaseModel]]) -> Tuple[BaseModel, Dict[str, List[str]]]:
+    """
+    :param model: annotation model, e.g. KidneyTransplantDonorGroupAnnotation
+    :param results: ((offset, chunk text), annotation) per chunk in note order
+    :return: merged annotation, and per mention field the "start:end" note offsets of its spans
+    """
+    merged, offsets = dict(), dict()
+    for name, field in model.model_fields.items():
+        mentions = [getattr(annotation, name) for _, annotation in results]
+        merged[name] = merge_mentions(field.annotation, mentions)
+        found = set()
+        for (chunk_start, chunk_text), mention in zip((chunk for chunk, _ in results), mentions):
+            found.update(span_offsets(chunk_start, chunk_text, mention.spans))
+        offsets[name] = [f'{start}:{end}' for start, end in sorted(found)]
+    return model(**merged), offsets
+
+def annotate_note(text: str,
+                  model: type[BaseModel],
+                  extract: Callable[[str, type[BaseModel]], BaseModel],
+                  max_chars: int = MAX_CHARS,
+                  overlap: int = OVERLAP_CHARS) -> Tuple[BaseModel, Dict[str, List[str]]]:
+    """
+    Run `extract(chunk_text, model)` on each chunk of the note, one at a time, and merge.
+
+    :return: see `merge_chunks`
+    """
+    results = [(chunk, extract(chunk[1], model)) for chunk in chunk_note(text, max_chars, overlap)]
+    return merge_chunks(model, results)
@@ -0,0 +1,68 @@
+import argparse
+import sys
+from typing import List
+from kidney_transplant_llm.postproc import athena, filetool, schema
+
+###############################################################################
+# Fast-start CLI
+#
+# `sql`, `paths` and `schema` only need schema/filetool/athena, which import
+# no pandas or pydantic. `run` imports the DAG (and with it pandas and the
+# study variables) only when it is used.
+#
+#   python -m kidney_transplant_llm.postproc.cli sql --pipeline donor
+#   python -m kidney_transplant_llm.postproc.cli run --stage counts
+###############################################################################
+def _view_args(args) -> tuple:
+    return filetool.resolve_view(args.pipeline, args.sample, args.origin)
+
+def cmd_sql(args):
+    highlights, sample, origin, view = _view_args(args)
+    if args.write:
+        print(athena.create_view_sql(highlights, sample, origin, view))
+    else:
+        print(athena.create_view_str(highlights, sample, origin, view))
+
+def cmd_paths(args):
+    _, _, _, view = _view_args(args)
+    print(f'phi        {filetool.path_phi_dir()}')
+    print(f'samples    {filetool.path_sample("")}')
+    print(f'view csv   {filetool.path_highlights(f"{view}.csv")}')
+    print(f'pivot      {filetool.path_highlights(f"{view}.pivot.csv")}')
+    print(f'store      {filetool.path_store(f"{view}.pivot")}')
+
+def cmd_schema(args):
+    for title, names in [('samples', schema.SAMPLES),
+                         ('pipelines', schema.PIPELINES)]:
+        print(f'{title}:')
+        for key, value in names.items():
+            print(f'  {key:<14} {value}')
+    print('sample columns:   ' + ', '.join(schema.SAMPLE_COLS))
+    print('highlight columns: ' + ', '.join(schema.HIGHLIGHT_COLS))
+
+def main(argv: List[str] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['run']:
+        from kidney_transplant_llm.postproc import dag
+        return dag.main(argv[1:])
+
+    parser = argparse.ArgumentParser(description='Kidney transplant LLM post-processing.',
+                                     epilog='run [dag options]: run pipeline stages, see `run --help`')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, func, help_text in [('sql', cmd_sql, 'print the view SQL'),
+                                  ('paths', cmd_paths, 'print the paths of a view'),
+                                  ('schema', cmd_schema, 'list samples, pipelines and columns')]:
+        command = commands.add_parser(name, help=help_text)
+        command.set_defaults(func=func)
+        if name != 'schema':
+            command.add_argument('--pipeline', choices=list(schema.PIPELINES), default='donor')
+            command.add_argument('--sample', default=None, help='pre, index, post or a sample table')
+            command.add_argument('--origin', default=None)
+        if name == 'sql':
+            command.add_argument('--write', action='store_true', help='write {view}.sql')
+    commands.add_parser('run', help='run pipeline stages (imports pandas)')
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,11 @@
 import pandas as pd
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import vocab
 
 DIRICHLET_MIN_COUNT = 4
 
-# Main dataframe we start with is our term frequency counted df 
-df = pd.read_csv('data/irae/highlights/irae__highlights_donor_index.pivot.tf.csv')
-
 # For each column/subvalue type, we want a separate df for checking uniqueness and double counts
-subvalue_types = [
-    "Donor Relationship",
-    "Donor Type",
-    "Hla Match Quality",
-    "Hla Mismatch Count",
-    "Transplant Date",
-]
+subvalue_types = vocab.model_displays(study.KidneyTransplantDonorGroupAnnotation)
 
 def print_counts_info(df: pd.DataFrame, subvalue_types: list[str]):
     print('================ Counting Possible Autoprocessing Info ================')
@@ -53,5 +46,34 @@ def print_counts_info(df: pd.DataFrame, subvalue_types: list[str]):
             print(f'\t\tNumber of {subvalue} instances with count above Dirichlet min count: {len(set(ids_above_cutoff))}')
             print('--------------------------------------------------')
 
+def counts_info_df(df: pd.DataFrame, subvalue_types: list[str]) -> pd.DataFrame:
+    """
+    Same counts as `print_counts_info`, one row per subvalue type.
+
+    :param df: term frequency counted df (output of `cumulative.count_tf`)
+    :param subvalue_types: display names of the columns to check
+    :return: DataFrame with subject counts per subvalue type
+    """
+    unique_ids = df['subject_ref'].unique()
+    out_rows = list()
+    for subvalue in subvalue_types:
+        subvalue_df = df[df['column'] == subvalue]
+        counts = subvalue_df['subject_ref'].value_counts()
+        ones = counts[counts == 1].index
+        max_count = subvalue_df[subvalue_df['subject_ref'].isin(ones)].groupby('subject_ref')['count'].max()
+        out_rows.append({
+            'column': subvalue,
+            'subjects': len(unique_ids),
+            'subjects_with_value': len(counts),
+            'no_observations': len(unique_ids) - len(counts),
+            'discordant': int((counts > 1).sum()),
+            'exactly_one': len(ones),
+            'below_min_count': int((max_count < DIRICHLET_MIN_COUNT).sum()),
+            'above_min_count': int((max_count >= DIRICHLET_MIN_COUNT).sum()),
+        })
+    return pd.DataFrame(out_rows)
+
 if __name__ == '__main__':
-    print_counts_info(df, subvalue_types)
\ No newline at end of file
+    # Main dataframe we start with is our term frequency counted df
+    df = pd.read_csv('data/irae/highlights/irae__highlights_donor_index.pivot.tf.csv')
+    print_counts_info(df, subvalue_types)
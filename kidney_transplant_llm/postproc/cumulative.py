@@ -1,7 +1,9 @@
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from kidney_transplant_llm.postproc.schema import (
     SUBJECT_REF,
+    SORT_BY_DATE,
     SAMPLE_COLS)
 
 EXCLUDE_COLS = SAMPLE_COLS
@@ -9,8 +11,18 @@ EXCLUDE_VALS = []
 
 ###############################################################################
 # Term Frequency for each column
+#
+# Pivot cells are read as the text written in the pivot CSV (missing cells are
+# ''), so a value counts the same whatever types pandas would guess for the
+# file it comes from: a full pivot, a shard or an incremental delta.
 ###############################################################################
-def count_tf(parsed_csv:Path|str, stratifier:str = SUBJECT_REF, first=False) -> pd.DataFrame:
+def read_pivot(parsed_csv: Path | str, usecols: list = None) -> pd.DataFrame:
+    """
+    :return: pivot CSV as text, missing cells as ''
+    """
+    return pd.read_csv(parsed_csv, usecols=usecols, dtype=str, keep_default_na=False)
+
+def count_tf(parsed_csv:Path|str, stratifier:str = SUBJECT_REF, first=False, columns:list = None) -> pd.DataFrame:
     """
     Get Term Frequency for each CSV column, stratified by `stratifier`.
     From parsed_csv count the number of times (term frequency) of each column:value pair.
@@ -18,32 +30,38 @@ def count_tf(parsed_csv:Path|str, stratifier:str = SUBJECT_REF, first=False) ->
     :param parsed_csv: LLM output CSV
     :param stratifier: by PAITENT_ID or any supported column in the CSV
     :param first: only get the first hit (highest TF)
+    :param columns: only read and count these columns (see `vocab.model_displays`),
+                    default every column not in EXCLUDE_COLS
     :return: string output tsv
     """
-    df = pd.read_csv(parsed_csv)
+    if columns is not None:
+        header = pd.read_csv(parsed_csv, nrows=0).columns
+        df = read_pivot(parsed_csv, usecols=[stratifier] + [col for col in header if col in columns])
+    else:
+        df = read_pivot(parsed_csv)
     out_rows = list()
 
     for col in df.columns:
         print(f'#### column= {col}')
-        if col in EXCLUDE_COLS or ('_spans_' in col) or ('span'==col):
+        if col == stratifier or col in EXCLUDE_COLS or ('_spans_' in col) or ('span'==col):
             print(f'Skipping {col}')
             continue
 
-        df_filtered = df[df[col].notna() & ~df[col].isin(EXCLUDE_VALS)]
+        df_filtered = df[(df[col] != '') & ~df[col].isin(EXCLUDE_VALS)]
 
         if first:
             term_freq = (df_filtered
                          .groupby([stratifier, col])
                          .size()
                          .reset_index(name='cnt')
-                         .sort_values(by=[stratifier, 'cnt'], ascending=[True, False])
+                         .sort_values(by=[stratifier, 'cnt'], ascending=[True, False], kind='stable')
                          .groupby(stratifier, as_index=False)
                          .first())
         else:
             term_freq = (df_filtered.groupby([stratifier, col])
                          .size()
                          .reset_index(name='cnt')
-                         .sort_values(by=[stratifier, 'cnt'], ascending=[True, False]))
+                         .sort_values(by=[stratifier, 'cnt'], ascending=[True, False], kind='stable'))
 
         # Append structured rows
         for _, row in term_freq.iterrows():
@@ -54,3 +72,89 @@ def count_tf(parsed_csv:Path|str, stratifier:str = SUBJECT_REF, first=False) ->
                 "value": row[col]
             })
     return pd.DataFrame(out_rows)
+
+###############################################################################
+# Consensus: highest TF value for each column
+###############################################################################
+def consensus_tf(tf_df: pd.DataFrame, stratifier:str = SUBJECT_REF) -> pd.DataFrame:
+    """
+    Pick the most frequent value of each column for each `stratifier`.
+    Ties are flagged and resolved by the order `count_tf` produced.
+
+    :param tf_df: output of `count_tf`
+    :param stratifier: by PAITENT_ID or any supported column in the CSV
+    :return: DataFrame with one row per (stratifier, column)
+    """
+    ranked = tf_df.sort_values(by=[stratifier, 'column', 'count'],
+                               ascending=[True, True, False],
+                               kind='stable')
+    top = ranked.groupby([stratifier, 'column'], sort=False)['count'].transform('max')
+    n_top = (ranked['count'] == top).groupby([ranked[stratifier], ranked['column']]).transform('sum')
+    consensus = ranked.assign(tie=n_top > 1).drop_duplicates([stratifier, 'column'], keep='first')
+    return consensus.reset_index(drop=True)
+
+###############################################################################
+# As-of-date Term Frequency
+#
+# Running count of each (stratifier, column, value) over the date-sorted
+# notes, kept only at change points: one row per date the count grows. The
+# count as of date D is the row with the last date <= D, found by binary search.
+###############################################################################
+def count_tf_asof(parsed_csv:Path|str, stratifier:str = SUBJECT_REF, columns:list = None) -> pd.DataFrame:
+    """
+    :param parsed_csv: pivot CSV with `sort_by_date`
+    :param columns: only these columns, default every column not in EXCLUDE_COLS
+    :return: DataFrame(stratifier, column, value, date, count), sorted by
+             (stratifier, column, value, date); count is cumulative up to and including date
+    """
+    # read as text like `count_tf`: melting typed columns would upcast False/True to 0.0/1.0
+    df = read_pivot(parsed_csv)
+    value_cols = [col for col in df.columns
+                  if (columns is None or col in columns)
+                  and col not in EXCLUDE_COLS and col != stratifier and col != SORT_BY_DATE
+                  and '_spans_' not in col and col != 'span']
+    long = df.melt(id_vars=[stratifier, SORT_BY_DATE], value_vars=value_cols, var_name='column')
+    long = long[(long['value'] != '') & ~long['value'].isin(EXCLUDE_VALS)]
+    keys = [stratifier, 'column', 'value']
+    changes = (long.groupby(keys + [SORT_BY_DATE], sort=True)
+               .size()
+               .rename('count')
+               .reset_index()
+               .rename(columns={SORT_BY_DATE: 'date'}))
+    changes['count'] = changes.groupby(keys, sort=False)['count'].cumsum()
+    return changes
+
+def asof_tf(changes: pd.DataFrame, date, stratifier:str = SUBJECT_REF) -> pd.DataFrame:
+    """
+    Term Frequency as of `date`, same format as `count_tf`.
+
+    :param changes: output of `count_tf_asof`
+    :param date: one date for everyone, or a Series of dates indexed by `stratifier`
+                 (e.g. each subject's index date); subjects missing from it are dropped
+    :return: DataFrame(stratifier, count, column, value), keys without notes by `date` omitted
+    """
+    keys = [stratifier, 'column', 'value']
+    key_codes = changes.groupby(keys, sort=False).ngroup().to_numpy()
+    starts = np.flatnonzero(np.r_[True, key_codes[1:] != key_codes[:-1]])
+    days = pd.to_datetime(changes['date']).to_numpy().astype('datetime64[D]').astype('int64')
+
+    # changes are sorted by key then date: (key, day) sorts the same way as one int64
+    span = np.int64(days.max() - days.min() + 2) if len(days) else np.int64(1)
+    combined = key_codes.astype('int64') * span + (days - days.min() if len(days) else days)
+
+    first = changes.iloc[starts]
+    if isinstance(date, pd.Series):
+        query = pd.to_datetime(first[stratifier].map(date)).to_numpy()
+    else:
+        query = np.full(len(starts), pd.Timestamp(date).to_datetime64())
+    has_query = ~pd.isna(query)
+    query_days = query.astype('datetime64[D]').astype('int64') - (days.min() if len(days) else 0)
+    query_days = np.clip(query_days, -1, span - 1)
+
+    pos = np.searchsorted(combined, key_codes[starts].astype('int64') * span + query_days, side='right') - 1
+    found = has_query & (pos >= starts)
+    out = changes.iloc[pos[found]]
+    return pd.DataFrame({stratifier: out[stratifier].to_numpy(),
+                         'count': out['count'].to_numpy(),
+                         'column': out['column'].to_numpy(),
+                         'value': out['value'].to_numpy()})
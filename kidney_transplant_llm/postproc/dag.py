@@ -0,0 +1,303 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List
+import pandas as pd
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc.schema import (
+    PIPELINES,
+    SAMPLES,
+    SUBJECT_REF)
+from kidney_transplant_llm.postproc import (
+    athena,
+    filetool,
+    pivot_table,
+    cumulative,
+    counting_autoprocessable_patients,
+    dates,
+    exclusion,
+    features,
+    incremental,
+    quality,
+    sharding,
+    vocab)
+
+###############################################################################
+# Pipelines: PIPELINES and SAMPLES live in schema so the CLI can list them
+# without importing pandas
+###############################################################################
+# annotation models of each pipeline; pivot and TF only read their variables
+MODELS = {
+    'donor': (study.MultipleTransplantHistoryAnnotation, study.KidneyTransplantDonorGroupAnnotation),
+    'longitudinal': (study.KidneyTransplantLongitudinalAnnotation,),
+}
+
+DEFAULT_TARGETS = ['vocab', 'counts', 'consensus', 'dates']
+
+# stages that can run on one shard; the others run once on the merged outputs
+SHARD_STAGES = ['view', 'exclude', 'pivot', 'tf']
+
+@dataclass(frozen=True)
+class Job:
+    """
+    One (highlights, sample, origin) combination; every stage runs once per job.
+    """
+    highlights: str
+    sample: str
+    origin: str
+    view: str
+    shard: sharding.Shard = None
+    columns: tuple = None
+    gates: quality.Gates = None
+
+def make_job(pipeline: str, sample: str = None, origin: str = None, shard: sharding.Shard = None,
+             gates: quality.Gates = None) -> Job:
+    """
+    :param pipeline: key of PIPELINES
+    :param sample: 'pre', 'index', 'post' or a sample table name (default from pipeline)
+    :param origin: LLM origin (default from pipeline)
+    :param shard: (i, N) to process only the subjects of shard i
+    :param gates: data quality thresholds of the exclude and pivot stages, default `quality.Gates()`
+    :return: Job, view name only carries the origin when it is not the pipeline default;
+             columns are the sublabel_name of the pipeline's annotation models
+    """
+    highlights, sample, origin, view = filetool.resolve_view(pipeline, sample, origin)
+    columns = tuple(vocab.model_displays(*MODELS[pipeline]))
+    return Job(highlights, sample, origin, view, shard, columns, gates)
+
+###############################################################################
+# Stages: declared inputs/outputs are paths under filetool.path_highlights()
+###############################################################################
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    deps: tuple
+    inputs: Callable[[Job], List[Path]]
+    outputs: Callable[[Job], List[Path]]
+    run: Callable[[Job], None]
+
+def _path(job: Job, suffix: str) -> Path:
+    """
+    Outputs of a sharded job carry the shard tag; the view SQL and CSV are shared.
+    """
+    if job.shard is None or suffix in ('.sql', '.csv'):
+        return filetool.path_highlights(f'{job.view}{suffix}')
+    return filetool.path_highlights(f'{job.view}.{sharding.shard_tag(job.shard)}{suffix}')
+
+def run_view(job: Job):
+    athena.create_view_sql(job.highlights, job.sample, job.origin, job.view)
+
+def run_vocab(job: Job):
+    vocab.validate_csv(f'{job.view}.csv', origin=job.origin)
+
+def run_exclude(job: Job):
+    exclusion.excluded_csv(highlights_csv=f'{job.view}.csv', shard=job.shard, gates=job.gates)
+
+def run_pivot(job: Job):
+    exclude = exclusion.read_excluded(_path(job, '.excluded.csv'))
+    pivot_table.pivot_highlights_csv(highlights_csv=f'{job.view}.csv', exclude=exclude, shard=job.shard,
+                                     names=job.columns, gates=job.gates)
+    if job.shard is None:
+        incremental.mark_full_run(job.view, job.origin)
+
+def run_tf(job: Job):
+    output_df = cumulative.count_tf(_path(job, '.pivot.csv'), stratifier=SUBJECT_REF, columns=job.columns)
+    output_df.to_csv(_path(job, '.pivot.tf.csv'), index=False)
+
+def run_asof(job: Job):
+    output_df = cumulative.count_tf_asof(_path(job, '.pivot.csv'), stratifier=SUBJECT_REF, columns=job.columns)
+    output_df.to_csv(_path(job, '.pivot.tf.asof.csv'), index=False)
+
+def run_counts(job: Job):
+    tf_df = dates.collapse_dates_tf(pd.read_csv(_path(job, '.pivot.tf.csv')))
+    output_df = counting_autoprocessable_patients.counts_info_df(
+        tf_df, list(job.columns or counting_autoprocessable_patients.subvalue_types))
+    output_df.to_csv(_path(job, '.pivot.tf.counts.csv'), index=False)
+
+def run_dates(job: Job):
+    tf_df = pd.read_csv(_path(job, '.pivot.tf.csv'))
+    output_df = dates.consensus_dates(tf_df, stratifier=SUBJECT_REF)
+    output_df.to_csv(_path(job, '.pivot.tf.dates.csv'), index=False)
+
+def run_consensus(job: Job):
+    tf_df = pd.read_csv(_path(job, '.pivot.tf.csv'))
+    output_df = cumulative.consensus_tf(tf_df, stratifier=SUBJECT_REF)
+    output_df.to_csv(_path(job, '.pivot.tf.consensus.csv'), index=False)
+
+def run_features(job: Job):
+    tf_df = pd.read_csv(_path(job, '.pivot.tf.csv'))
+    features.save_features(tf_df, _path(job, '.pivot.tf.features').name)
+
+STAGES = {stage.name: stage for stage in [
+    Stage('view', (),
+          lambda job: [],
+          lambda job: [_path(job, '.sql')],
+          run_view),
+    # {view}.csv is the Athena export of the view SQL
+    Stage('vocab', ('view',),
+          lambda job: [_path(job, '.csv')],
+          lambda job: [_path(job, '.vocab.csv')],
+          run_vocab),
+    # exclusions are per subject, read from the donor views too
+    Stage('exclude', ('view',),
+          lambda job: [_path(job, '.csv')] + exclusion.cohort_csvs(),
+          lambda job: [_path(job, '.excluded.csv')],
+          run_exclude),
+    Stage('pivot', ('view', 'exclude'),
+          lambda job: [_path(job, '.csv'), _path(job, '.excluded.csv')],
+          lambda job: [_path(job, '.pivot.csv')],
+          run_pivot),
+    Stage('tf', ('pivot',),
+          lambda job: [_path(job, '.pivot.csv')],
+          lambda job: [_path(job, '.pivot.tf.csv')],
+          run_tf),
+    # change points of the running TF, query with cumulative.asof_tf
+    Stage('asof', ('pivot',),
+          lambda job: [_path(job, '.pivot.csv')],
+          lambda job: [_path(job, '.pivot.tf.asof.csv')],
+          run_asof),
+    Stage('counts', ('tf',),
+          lambda job: [_path(job, '.pivot.tf.csv')],
+          lambda job: [_path(job, '.pivot.tf.counts.csv')],
+          run_counts),
+    Stage('consensus', ('tf',),
+          lambda job: [_path(job, '.pivot.tf.csv')],
+          lambda job: [_path(job, '.pivot.tf.consensus.csv')],
+          run_consensus),
+    Stage('dates', ('tf',),
+          lambda job: [_path(job, '.pivot.tf.csv')],
+          lambda job: [_path(job, '.pivot.tf.dates.csv')],
+          run_dates),
+    Stage('features', ('tf',),
+          lambda job: [_path(job, '.pivot.tf.csv')],
+          lambda job: [filetool.path_store(_path(job, '.pivot.tf.features').name) / features.META_JSON],
+          run_features),
+]}
+
+def is_stale(stage: Stage, job: Job) -> bool:
+    """
+    :return: True if any output is missing or older than any input
+    """
+    outputs = stage.outputs(job)
+    if not all(p.exists() for p in outputs):
+        return True
+    inputs = [p for p in stage.inputs(job) if p.exists()]
+    if not inputs:
+        return False
+    return max(p.stat().st_mtime for p in inputs) > min(p.stat().st_mtime for p in outputs)
+
+###############################################################################
+# Scheduler
+###############################################################################
+def plan(jobs: List[Job], targets: List[str]) -> list:
+    """
+    Requested targets always run; their upstream stages only run when stale.
+
+    :param jobs: list of Job
+    :param targets: stage names to compute
+    :return: list of (stage_name, job) in dependency order
+    """
+    planned = list()
+
+    def visit(name: str, job: Job, requested: bool) -> bool:
+        if (name, job) in planned:
+            return True
+        stage = STAGES[name]
+        upstream = [visit(dep, job, False) for dep in stage.deps]
+        if requested or any(upstream) or is_stale(stage, job):
+            planned.append((name, job))
+            return True
+        return False
+
+    for job in jobs:
+        for target in targets:
+            visit(target, job, True)
+    return planned
+
+def run_stage(name: str, job: Job) -> str:
+    print(f'[{name}] {job.view}' + (f' {sharding.shard_tag(job.shard)}' if job.shard else ''))
+    STAGES[name].run(job)
+    return name
+
+def run(jobs: List[Job], targets: List[str], n_jobs: int = 1) -> list:
+    """
+    Run the planned stages. Stages of independent jobs (pipelines, samples,
+    origins) run concurrently in up to `n_jobs` processes.
+
+    :return: list of (stage_name, job) that completed
+    """
+    pending = plan(jobs, targets)
+    done, failed = list(), list()
+
+    def ready(node) -> bool:
+        name, job = node
+        return all((dep, job) not in pending and (dep, job) not in running.values()
+                   for dep in STAGES[name].deps)
+
+    def blocked(node) -> bool:
+        name, job = node
+        return any((dep, job) in failed for dep in STAGES[name].deps)
+
+    running = dict()
+    with ProcessPoolExecutor(max_workers=max(1, n_jobs)) as pool:
+        while pending or running:
+            for node in [n for n in pending if blocked(n)]:
+                print(f'[{node[0]}] {node[1].view} skipped, upstream failed')
+                pending.remove(node)
+                failed.append(node)
+            for node in [n for n in pending if ready(n)]:
+                pending.remove(node)
+                running[pool.submit(run_stage, *node)] = node
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                if future.exception() is not None:
+                    print(f'[{node[0]}] {node[1].view} failed: {future.exception()}')
+                    failed.append(node)
+                else:
+                    done.append(node)
+    if failed:
+        raise RuntimeError(f'{len(failed)} stage(s) failed or skipped')
+    return done
+
+###############################################################################
+# CLI
+###############################################################################
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Run kidney transplant LLM post-processing stages.')
+    parser.add_argument('--stage', nargs='+', choices=list(STAGES), default=None,
+                        help=f'target stage(s), default {DEFAULT_TARGETS} (tf with --shard); '
+                             'stale upstream stages are run as needed')
+    parser.add_argument('--pipeline', nargs='+', choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument('--origin', nargs='+', default=[None],
+                        help='LLM origin(s), default is the origin of each pipeline')
+    parser.add_argument('--sample', nargs='+', choices=list(SAMPLES), default=[None],
+                        help='sample period(s), default is the sample of each pipeline')
+    parser.add_argument('--jobs', type=int, default=1, help='number of parallel processes')
+    parser.add_argument('--shard', type=sharding.parse_shard, default=None,
+                        help='i/N: only subjects of shard i (0-based); merge with `sharding`')
+    parser.add_argument('--max-null-rate', nargs='+', default=None, metavar='COLUMN=RATE',
+                        help=f'data quality: largest null rate per column, default {quality.MAX_NULL_RATE}')
+    parser.add_argument('--min-rows', type=int, default=None,
+                        help=f'data quality: fewest rows in the view, default {quality.MIN_ROWS}')
+    parser.add_argument('--min-subjects', type=int, default=None,
+                        help=f'data quality: fewest subjects in the view, default {quality.MIN_SUBJECTS}')
+    args = parser.parse_args(argv)
+
+    if args.stage is None:
+        args.stage = ['tf'] if args.shard else DEFAULT_TARGETS
+    if args.shard and not set(args.stage) <= set(SHARD_STAGES):
+        parser.error(f'--shard only runs {SHARD_STAGES}, run the others after merging')
+
+    gates = quality.make_gates(args.max_null_rate, args.min_rows, args.min_subjects)
+    jobs = [make_job(pipeline, sample, origin, args.shard, gates)
+            for pipeline in args.pipeline
+            for sample in args.sample
+            for origin in args.origin]
+    return run(jobs, args.stage, args.jobs)
+
+if __name__ == '__main__':
+    main()
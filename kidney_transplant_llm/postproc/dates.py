@@ -0,0 +1,137 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF
+
+###############################################################################
+# Transplant date normalization
+#
+# `donor_transplant_date` is free text that should be YYYY-MM-DD. Variants of
+# the same day ('2019-3-5', '2019-03-05', '3/5/2019') are normalized to ISO;
+# partial ('2019-03') and impossible or implausible dates are rejected.
+###############################################################################
+DATE_COLUMNS = ['Transplant Date']
+MIN_YEAR = 1950
+DATE_TOLERANCE_DAYS = 3
+
+ISO_DATE = r'^\s*(?P<year>\d{4})[-/.](?P<month>\d{1,2})[-/.](?P<day>\d{1,2})\s*$'
+US_DATE = r'^\s*(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4})\s*$'
+
+def parse_dates(values: pd.Series, max_date: date | None = None) -> pd.Series:
+    """
+    :param values: free text dates
+    :param max_date: latest plausible date (default today)
+    :return: datetime64 Series, NaT where the text is not a full plausible date
+    """
+    text = values.astype('string')
+    parts = text.str.extract(ISO_DATE)
+    us = text.str.extract(US_DATE)
+    parts = parts.fillna(us[['year', 'month', 'day']])
+    parts = parts.apply(pd.to_numeric, errors='coerce').astype('float64')
+    parsed = pd.to_datetime(parts, errors='coerce')
+
+    max_date = pd.Timestamp(max_date or date.today())
+    plausible = (parsed.dt.year >= MIN_YEAR) & (parsed <= max_date)
+    return parsed.where(plausible)
+
+def normalize_dates(values: pd.Series, max_date: date | None = None) -> pd.Series:
+    """
+    :return: 'YYYY-MM-DD' strings, NaN where rejected
+    """
+    return parse_dates(values, max_date).dt.strftime('%Y-%m-%d')
+
+###############################################################################
+# Consensus date per subject
+###############################################################################
+def date_clusters(tf_dates: pd.DataFrame,
+                  stratifier: str = SUBJECT_REF,
+                  tolerance_days: int = DATE_TOLERANCE_DAYS) -> pd.DataFrame:
+    """
+    Group each subject's dates into clusters: a cluster starts at the earliest
+    date not yet clustered and takes the dates up to `tolerance_days` after it,
+    so a chain of close dates cannot stretch one cluster over months.
+
+    :param tf_dates: rows (stratifier, count, value) with parsed datetime `value`
+    :return: input sorted by (stratifier, value) with `cluster` (global id) and `cluster_date`,
+             the most counted date of the cluster (ties go to the earliest)
+    """
+    df = tf_dates.sort_values([stratifier, 'value'], kind='stable', ignore_index=True)
+    subject = pd.factorize(df[stratifier])[0]
+    days = pd.Series(df['value'].to_numpy(dtype='datetime64[D]').astype('int64'))
+
+    # one vectorized pass per cluster rank: every subject's earliest unassigned
+    # date opens its next cluster, which takes the dates within tolerance of it
+    rank = np.full(len(df), -1, dtype='int64')
+    r = 0
+    while (todo := rank < 0).any():
+        first = days[todo].groupby(subject[todo]).transform('min')
+        rank[np.flatnonzero(todo)[(days[todo] - first <= tolerance_days).to_numpy()]] = r
+        r += 1
+    start = np.r_[True, (subject[1:] != subject[:-1]) | (rank[1:] != rank[:-1])][:len(df)]
+    df['cluster'] = np.cumsum(start)
+
+    best = (df.sort_values(['cluster', 'count', 'value'], ascending=[True, False, True], kind='stable')
+              .drop_duplicates('cluster')
+              .set_index('cluster')['value'])
+    df['cluster_date'] = best.reindex(df['cluster']).to_numpy()
+    return df
+
+def consensus_dates(tf_df: pd.DataFrame,
+                    column: str = 'Transplant Date',
+                    stratifier: str = SUBJECT_REF,
+                    tolerance_days: int = DATE_TOLERANCE_DAYS) -> pd.DataFrame:
+    """
+    :param tf_df: output of `cumulative.count_tf`
+    :return: one row per subject: consensus date (cluster with the most mentions),
+             its count, total count, number of clusters and rejected values;
+             NaN date and 0 clusters when every value was rejected
+    """
+    dates = tf_df[tf_df['column'] == column]
+    parsed = parse_dates(dates['value'])
+    rejected = dates.loc[parsed.isna(), 'count'].groupby(dates[stratifier]).sum()
+
+    clusters = date_clusters(dates.assign(value=parsed)[parsed.notna()], stratifier, tolerance_days)
+    per_cluster = (clusters.groupby([stratifier, 'cluster'], sort=False)
+                   .agg(date=('cluster_date', 'first'), count=('count', 'sum'))
+                   .reset_index())
+    per_cluster = per_cluster.sort_values([stratifier, 'count', 'date'], ascending=[True, False, True], kind='stable')
+    consensus = per_cluster.groupby(stratifier, sort=False).agg(
+        date=('date', 'first'),
+        count=('count', 'first'),
+        total=('count', 'sum'),
+        clusters=('cluster', 'size'))
+    # subjects whose every date was rejected keep a row, with no date
+    subjects = pd.Index(sorted(dates[stratifier].unique()), name=stratifier)
+    consensus = consensus.reindex(subjects)
+    consensus[['count', 'total', 'clusters']] = consensus[['count', 'total', 'clusters']].fillna(0).astype('int64')
+    consensus['date'] = consensus['date'].dt.strftime('%Y-%m-%d')
+    consensus['rejected'] = rejected.reindex(consensus.index, fill_value=0)
+    return consensus.reset_index()
+
+def collapse_dates_tf(tf_df: pd.DataFrame,
+                      columns: list[str] = DATE_COLUMNS,
+                      stratifier: str = SUBJECT_REF,
+                      tolerance_days: int = DATE_TOLERANCE_DAYS) -> pd.DataFrame:
+    """
+    Replace the date values of the TF table by their normalized cluster date and
+    sum the counts, so near-duplicates are no longer counted as discordant.
+    Rejected dates are dropped.
+
+    :param tf_df: output of `cumulative.count_tf`
+    :return: TF table with the same columns
+    """
+    is_date = tf_df['column'].isin(columns)
+    parsed = parse_dates(tf_df.loc[is_date, 'value'])
+    dates = tf_df[is_date].assign(value=parsed)[parsed.notna()]
+
+    collapsed = list()
+    for column, column_df in dates.groupby('column'):
+        clusters = date_clusters(column_df, stratifier, tolerance_days)
+        collapsed.append(clusters
+                         .assign(value=clusters['cluster_date'].dt.strftime('%Y-%m-%d'))
+                         .groupby([stratifier, 'column', 'value'], as_index=False)['count'].sum())
+
+    out = pd.concat([tf_df[~is_date]] + collapsed, ignore_index=True)
+    out = out[tf_df.columns].sort_values([stratifier, 'column', 'count'],
+                                         ascending=[True, True, False], kind='stable')
+    return out.reset_index(drop=True)
@@ -0,0 +1,113 @@
+import argparse
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool
+from kidney_transplant_llm.postproc.schema import (
+    PIPELINES,
+    PIPELINE_ORIGINS,
+    SAMPLES,
+    DOCUMENT_REF,
+    NLP_ENSEMBLE)
+
+###############################################################################
+# Ensemble of origins
+#
+# For each (note, sublabel_name) every origin votes once for each value it
+# highlighted, with the origin's weight (default 1). The value with the
+# highest total wins; ties go to the value with more distinct supporting
+# spans, then to the first value in sort order. The rows of the winning value
+# are written as the view of the synthetic origin NLP_ENSEMBLE, so pivot, TF
+# and counting run on it like on any other origin:
+#   dag --origin irae__nlp_ensemble
+###############################################################################
+ORIGIN_COL = 'origin'
+NAME_COL = 'sublabel_name'
+VALUE_COL = 'sublabel_value'
+SPAN_COL = 'span'
+
+def vote_df(df: pd.DataFrame, weights: Dict[str, float] = None) -> pd.DataFrame:
+    """
+    :param df: view rows of several origins with an `origin` column
+    :param weights: origin -> vote weight, default 1 for every origin
+    :return: rows of the winning value per (note, sublabel_name), one per distinct span,
+             origin set to NLP_ENSEMBLE, plus `votes` (weighted) and `span_support`
+    """
+    weights = weights or dict()
+    note_codes, _ = pd.factorize(df[DOCUMENT_REF])
+    name_codes, names = pd.factorize(df[NAME_COL])
+    value_codes, values = pd.factorize(df[VALUE_COL].astype(str), sort=True)
+    origin_codes, origins = pd.factorize(df[ORIGIN_COL])
+    if SPAN_COL in df.columns:
+        span_codes, _ = pd.factorize(df[SPAN_COL].astype(str))
+    else:
+        span_codes = np.zeros(len(df), dtype='int64')
+
+    # group: (note, sublabel_name); candidate: (group, value)
+    group = note_codes.astype('int64') * len(names) + name_codes
+    candidate_codes, candidates = pd.factorize(group * len(values) + value_codes)
+    cand_group = candidates // len(values)
+    cand_value = candidates % len(values)
+
+    # one vote per (candidate, origin), weighted
+    origin_weight = np.array([weights.get(origin, 1.0) for origin in origins], dtype='float64')
+    voted = pd.unique(candidate_codes.astype('int64') * len(origins) + origin_codes)
+    votes = np.bincount(voted // len(origins), weights=origin_weight[voted % len(origins)],
+                        minlength=len(candidates))
+
+    # distinct spans supporting each candidate
+    n_spans = int(span_codes.max()) + 1 if len(span_codes) else 1
+    spans = pd.unique(candidate_codes.astype('int64') * n_spans + span_codes)
+    support = np.bincount(spans // n_spans, minlength=len(candidates))
+
+    # best candidate of each group: sort by group, -votes, -support, value
+    order = np.lexsort((cand_value, -support, -votes, cand_group))
+    first = np.r_[True, cand_group[order][1:] != cand_group[order][:-1]]
+    winner = np.zeros(len(candidates), dtype=bool)
+    winner[order[first]] = True
+
+    keep = winner[candidate_codes]
+    out = df[keep].copy()
+    out['votes'] = votes[candidate_codes[keep]]
+    out['span_support'] = support[candidate_codes[keep]]
+    out[ORIGIN_COL] = NLP_ENSEMBLE
+    subset = [col for col in df.columns if col != ORIGIN_COL]
+    return out.drop_duplicates(subset=subset).reset_index(drop=True)
+
+def ensemble_csv(pipeline: str = 'donor',
+                 sample: str = None,
+                 origins: List[str] = None,
+                 weights: Dict[str, float] = None) -> Path:
+    """
+    Vote over the view CSVs of `origins` and write the NLP_ENSEMBLE view CSV.
+
+    :param origins: default every origin of the pipeline (PIPELINE_ORIGINS)
+    :return: Path to the ensemble view CSV, e.g. 'irae__highlights_donor_index_ensemble.csv'
+    """
+    frames = list()
+    for origin in origins or PIPELINE_ORIGINS[pipeline]:
+        view = filetool.resolve_view(pipeline, sample, origin)[3]
+        frames.append(pd.read_csv(filetool.path_highlights(f'{view}.csv')).assign(**{ORIGIN_COL: origin}))
+    input_df = pd.concat(frames, ignore_index=True)
+
+    output_df = vote_df(input_df, weights)
+    columns = [col for col in frames[0].columns if col != ORIGIN_COL]
+    view = filetool.resolve_view(pipeline, sample, NLP_ENSEMBLE)[3]
+    output_csv = filetool.path_highlights(f'{view}.csv')
+    output_df[columns].to_csv(output_csv, index=False)
+    print(f'{output_csv}: {len(output_df)} rows from {len(input_df)}')
+    return output_csv
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Weighted vote of several origins as a synthetic origin.')
+    parser.add_argument('--pipeline', choices=list(PIPELINES), default='donor')
+    parser.add_argument('--sample', choices=list(SAMPLES), default=None)
+    parser.add_argument('--origin', nargs='+', default=None)
+    parser.add_argument('--weight', nargs='+', default=[], metavar='ORIGIN=WEIGHT')
+    args = parser.parse_args(argv)
+    weights = {origin: float(w) for origin, w in (item.split('=') for item in args.weight)}
+    ensemble_csv(args.pipeline, args.sample, args.origin, weights)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import filetool, spans
+from kidney_transplant_llm.postproc.schema import DOCUMENT_REF
+
+###############################################################################
+# Evaluation against gold annotations
+#
+# Gold (adjudicated Label Studio export) and predicted highlights are long
+# tables with documentreference_ref, sublabel_name, sublabel_value and
+# optionally span. Notes in either table are scored, so predictions on notes
+# with no gold mention count as false positives. A (note, label, value) triple
+# is a true positive when it is in both, otherwise FP or FN.
+#
+# Confidence intervals resample notes with replacement. Counts are kept as
+# (label x note) matrices so one resample is a matrix product with the note
+# weights; resamples are split in fixed chunks, each with its own seed from
+# SeedSequence(seed).spawn(), so results do not depend on the number of workers.
+###############################################################################
+N_BOOT = 1000
+SEED = 42
+ALPHA = 0.05
+CHUNK = 100
+
+NAME_COL = 'sublabel_name'
+VALUE_COL = 'sublabel_value'
+
+def labels() -> List[str]:
+    """
+    :return: display names of every KidneyTransplantMentionLabels entry
+    """
+    return [study.kidney_transplant_mention_ls_metadata[label]['display']
+            for label in study.KidneyTransplantMentionLabels]
+
+def _triples(df: pd.DataFrame) -> pd.DataFrame:
+    out = df[[DOCUMENT_REF, NAME_COL, VALUE_COL]].dropna()
+    out = out.assign(**{VALUE_COL: out[VALUE_COL].astype(str).str.strip().str.lower()})
+    return out.drop_duplicates(ignore_index=True)
+
+def align(gold_df: pd.DataFrame, pred_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    :return: one row per distinct (note, label, value) with `match` in tp/fp/fn
+    """
+    merged = _triples(gold_df).merge(_triples(pred_df), how='outer', indicator=True)
+    merged['match'] = merged.pop('_merge').map({'both': 'tp', 'right_only': 'fp', 'left_only': 'fn'})
+    return merged
+
+def count_matrices(aligned: pd.DataFrame, label_names: List[str], notes: pd.Index = None) -> tuple:
+    """
+    :param notes: every scored note, including those without any triple (default: notes of `aligned`)
+    :return: (notes, tp, fp, fn), each count matrix shaped (label, note)
+    """
+    notes = pd.Index(aligned[DOCUMENT_REF].unique() if notes is None else notes)
+    label_idx = pd.Index(label_names).get_indexer(aligned[NAME_COL])
+    note_idx = notes.get_indexer(aligned[DOCUMENT_REF])
+    keep = label_idx >= 0
+    matrices = list()
+    for match in ['tp', 'fp', 'fn']:
+        hit = keep & (aligned['match'] == match).to_numpy()
+        counts = np.zeros((len(label_names), len(notes)))
+        np.add.at(counts, (label_idx[hit], note_idx[hit]), 1)
+        matrices.append(counts)
+    return notes, *matrices
+
+def _scores(tp: np.ndarray, fp: np.ndarray, fn: np.ndarray) -> tuple:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = tp / (tp + fp)
+        recall = tp / (tp + fn)
+        f1 = 2 * tp / (2 * tp + fp + fn)
+    return precision, recall, f1
+
+def _bootstrap_chunk(tp, fp, fn, seed_seq: np.random.SeedSequence, n: int) -> np.ndarray:
+    """
+    :return: (n, 3, label) precision/recall/F1 for n resamples of notes
+    """
+    rng = np.random.default_rng(seed_seq)
+    n_notes = tp.shape[1]
+    draws = rng.integers(0, n_notes, size=(n, n_notes))
+    flat = (np.arange(n)[:, None] * n_notes + draws).ravel()
+    weights = np.bincount(flat, minlength=n * n_notes).reshape(n, n_notes).astype('float64')
+    return np.stack(_scores(weights @ tp.T, weights @ fp.T, weights @ fn.T), axis=1)
+
+def bootstrap(tp, fp, fn, n_boot: int = N_BOOT, seed: int = SEED, n_jobs: int = 1) -> np.ndarray:
+    """
+    :return: (n_boot, 3, label) bootstrap precision/recall/F1
+    """
+    sizes = [min(CHUNK, n_boot - start) for start in range(0, n_boot, CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if n_jobs <= 1:
+        chunks = [_bootstrap_chunk(tp, fp, fn, s, n) for s, n in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            chunks = list(pool.map(_bootstrap_chunk,
+                                   *zip(*[(tp, fp, fn, s, n) for s, n in zip(seeds, sizes)])))
+    return np.concatenate(chunks)
+
+def span_overlap(gold_df: pd.DataFrame, pred_df: pd.DataFrame) -> pd.Series:
+    """
+    For every gold span, the largest fraction of it covered by a predicted span
+    of the same label and note; averaged per label (0 if never covered).
+
+    :return: Series indexed by sublabel_name
+    """
+    gold = spans.spans_df(gold_df.assign(subject_ref=''), name_col=NAME_COL)
+    pred = spans.spans_df(pred_df.assign(subject_ref=''), name_col=NAME_COL)
+    cols = [DOCUMENT_REF, NAME_COL, 'start', 'end']
+    gold = gold[cols].astype({DOCUMENT_REF: str, NAME_COL: str}).reset_index(names='gold_id')
+    pred = pred[cols].astype({DOCUMENT_REF: str, NAME_COL: str})
+
+    pairs = gold.merge(pred, on=[DOCUMENT_REF, NAME_COL], suffixes=('', '_pred'))
+    inter = (np.minimum(pairs['end'], pairs['end_pred']) -
+             np.maximum(pairs['start'], pairs['start_pred'])).clip(lower=0)
+    covered = (inter / (pairs['end'] - pairs['start']).clip(lower=1)).groupby(pairs['gold_id']).max()
+    best = covered.reindex(gold['gold_id'], fill_value=0).to_numpy()
+    return pd.Series(best, index=gold[NAME_COL]).groupby(level=0).mean()
+
+def evaluate_df(gold_df: pd.DataFrame,
+                pred_df: pd.DataFrame,
+                n_boot: int = N_BOOT,
+                seed: int = SEED,
+                n_jobs: int = 1,
+                alpha: float = ALPHA) -> pd.DataFrame:
+    """
+    :return: one row per label: tp, fp, fn, precision, recall, F1 with bootstrap
+             (1 - alpha) percentile intervals, and span overlap
+    """
+    label_names = labels()
+    notes = pd.Index(pd.concat([gold_df[DOCUMENT_REF], pred_df[DOCUMENT_REF]]).dropna().unique())
+    notes, tp, fp, fn = count_matrices(align(gold_df, pred_df), label_names, notes)
+    point = _scores(tp.sum(axis=1), fp.sum(axis=1), fn.sum(axis=1))
+    boot = bootstrap(tp, fp, fn, n_boot, seed, n_jobs)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # labels absent from gold and predictions
+        lo, hi = np.nanpercentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+
+    out = pd.DataFrame({NAME_COL: label_names,
+                        'notes': len(notes),
+                        'tp': tp.sum(axis=1).astype(int),
+                        'fp': fp.sum(axis=1).astype(int),
+                        'fn': fn.sum(axis=1).astype(int)})
+    for i, metric in enumerate(['precision', 'recall', 'f1']):
+        out[metric] = point[i]
+        out[f'{metric}_lo'] = lo[i]
+        out[f'{metric}_hi'] = hi[i]
+    if spans.SPAN_COL in gold_df.columns and spans.SPAN_COL in pred_df.columns:
+        out['span_overlap'] = out[NAME_COL].map(span_overlap(gold_df, pred_df))
+    return out
+
+def evaluate_csv(gold_csv: Path | str,
+                 highlights_csv: str = 'irae__highlights_donor_index.csv',
+                 n_boot: int = N_BOOT,
+                 seed: int = SEED,
+                 n_jobs: int = 1) -> Path:
+    """
+    :return: Path to `{view}.eval.csv`
+    """
+    output_csv = filetool.path_highlights(highlights_csv.replace('.csv', '.eval.csv'))
+    out = evaluate_df(pd.read_csv(gold_csv),
+                      pd.read_csv(filetool.path_highlights(highlights_csv)),
+                      n_boot, seed, n_jobs)
+    print(out[[NAME_COL, 'tp', 'fp', 'fn', 'precision', 'recall', 'f1', 'f1_lo', 'f1_hi']].to_string(index=False))
+    out.to_csv(output_csv, index=False)
+    return output_csv
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Score LLM highlights against gold annotations.')
+    parser.add_argument('gold_csv')
+    parser.add_argument('highlights_csv')
+    parser.add_argument('--boot', type=int, default=N_BOOT)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--jobs', type=int, default=1)
+    args = parser.parse_args(argv)
+    evaluate_csv(args.gold_csv, args.highlights_csv, args.boot, args.seed, args.jobs)
+
+if __name__ == '__main__':
+    main()
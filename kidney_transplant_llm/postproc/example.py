@@ -10,7 +10,8 @@ from kidney_transplant_llm.postproc import (
     athena,
     filetool,
     pivot_table,
-    cumulative)
+    cumulative,
+    exclusion)
 
 def pipeline(highlights:str, sample:str, origin:str):
     view = filetool.name_view(highlights, sample)
@@ -21,13 +22,20 @@ def pipeline(highlights:str, sample:str, origin:str):
 
     print(f'Output: {output_sql}')
     print('######################################################################')
-    print('Step2: Pivot CSV sublabel_name --> as columns')
+    print('Step2: Exclude patients with history of multiple transplants')
     print(f'Input: {view}.csv')
-    output_csv = pivot_table.pivot_highlights_csv(highlights_csv=f'{view}.csv')
+    audit_csv = exclusion.excluded_csv(highlights_csv=f'{view}.csv')
+    exclude = exclusion.read_excluded(audit_csv)
+    print(audit_csv)
+
+    print('######################################################################')
+    print('Step3: Pivot CSV sublabel_name --> as columns')
+    print(f'Input: {view}.csv')
+    output_csv = pivot_table.pivot_highlights_csv(highlights_csv=f'{view}.csv', exclude=exclude)
     print(output_csv)
 
     print('######################################################################')
-    print('Step3: Rank LLM term frequency')
+    print('Step4: Rank LLM term frequency')
     input_csv = filetool.path_highlights(f'{view}.pivot.csv')
     output_csv = filetool.path_highlights(f'{view}.pivot.tf.csv')
     output_df = cumulative.count_tf(input_csv, stratifier=SUBJECT_REF)
@@ -0,0 +1,122 @@
+from pathlib import Path
+from typing import List
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool, sharding, quality
+from kidney_transplant_llm.postproc.schema import (
+    PIPELINES,
+    SAMPLES,
+    SUBJECT_REF,
+    DOCUMENT_REF,
+    SORT_BY_DATE,
+    TRUE_VALUES)
+
+###############################################################################
+# Cohort exclusion
+#
+# MultipleTransplantHistoryMention exists to exclude patients with a history
+# of multiple transplants. Excluded subjects are found from those highlights
+# (reading only the few columns needed) and removed before pivot and TF, so
+# their rows are never aggregated. An audit CSV records who and why.
+#
+# Exclusion is per subject, not per view: only the donor highlights carry the
+# label, so every view's audit also reads the exported donor views (any sample)
+# and the longitudinal view drops the same subjects as the donor view.
+###############################################################################
+EXCLUDE_LABEL = 'Multiple Transplant History'
+EXCLUDE_PIPELINES = ['donor']
+EXCLUDE_MIN_NOTES = 1
+CHUNKSIZE = 1_000_000
+
+def excluded_df(df: pd.DataFrame,
+                label: str = EXCLUDE_LABEL,
+                min_notes: int = EXCLUDE_MIN_NOTES) -> pd.DataFrame:
+    """
+    :param df: view rows with subject_ref, documentreference_ref, sort_by_date, sublabel_name, sublabel_value
+    :param label: sublabel_name whose true value excludes the subject
+    :param min_notes: minimum number of notes with a true value
+    :return: audit DataFrame, one row per excluded subject
+    """
+    hits = df[(df['sublabel_name'] == label) &
+              df['sublabel_value'].astype('string').str.lower().isin(TRUE_VALUES)]
+    audit = (hits.sort_values([SUBJECT_REF, SORT_BY_DATE], kind='stable')
+             .groupby(SUBJECT_REF)
+             .agg(notes=(DOCUMENT_REF, 'nunique'),
+                  mentions=(DOCUMENT_REF, 'size'),
+                  first_note=(DOCUMENT_REF, 'first'),
+                  first_date=(SORT_BY_DATE, 'first'))
+             .reset_index())
+    audit = audit[audit['notes'] >= min_notes]
+    audit.insert(1, 'reason', f'{label} = True')
+    return audit.reset_index(drop=True)
+
+def cohort_csvs() -> List[Path]:
+    """
+    :return: exported view CSVs of EXCLUDE_PIPELINES (every sample, default origin)
+    """
+    paths = [filetool.path_highlights(f'{filetool.name_view(PIPELINES[pipeline][0], sample)}.csv')
+             for pipeline in EXCLUDE_PIPELINES
+             for sample in SAMPLES.values()]
+    return [p for p in paths if p.exists()]
+
+def excluded_csv(highlights_csv: str = 'irae__highlights_donor_index.csv',
+                 shard: sharding.Shard = None,
+                 gates: quality.Gates = None,
+                 sources: List[Path] = None) -> Path:
+    """
+    :param highlights_csv: view CSV
+    :param shard: only subjects of this shard (i, N)
+    :param gates: data quality thresholds, default `quality.Gates()`
+    :param sources: other view CSVs whose excluded subjects also apply, default `cohort_csvs()`
+    :return: Path to the audit CSV `{view}.excluded.csv`
+    """
+    input_csv = filetool.path_highlights(highlights_csv)
+    output_name = sharding.shard_csv_name(highlights_csv, shard).replace('.csv', '.excluded.csv')
+    output_csv = filetool.path_highlights(output_name)
+    usecols = [SUBJECT_REF, DOCUMENT_REF, SORT_BY_DATE, 'sublabel_name', 'sublabel_value']
+    profiler = (gates or quality.Gates()).profiler(highlights_csv, required_cols=usecols)
+    frames = [read_csv_excluding(input_csv, shard=shard, usecols=usecols, profiler=profiler)]
+    profiler.finish()
+    for source in (cohort_csvs() if sources is None else sources):
+        if Path(source).resolve() != input_csv.resolve():
+            frames.append(read_csv_excluding(source, shard=shard, usecols=usecols, names=[EXCLUDE_LABEL]))
+    # donor samples overlap, count each highlight once
+    audit = excluded_df(pd.concat(frames, ignore_index=True).drop_duplicates())
+    print(f'Excluded {len(audit)} subjects ({EXCLUDE_LABEL})')
+    audit.to_csv(output_csv, index=False)
+    return output_csv
+
+def read_excluded(audit_csv: Path | str) -> set:
+    """
+    :return: set of excluded subject_ref, empty if there is no audit CSV
+    """
+    if not Path(audit_csv).exists():
+        return set()
+    return set(pd.read_csv(audit_csv, usecols=[SUBJECT_REF])[SUBJECT_REF])
+
+def read_csv_excluding(input_csv: Path | str,
+                       exclude: set = None,
+                       shard: sharding.Shard = None,
+                       usecols: list = None,
+                       chunksize: int = CHUNKSIZE,
+                       profiler: quality.Profiler = None,
+                       names: list = None) -> pd.DataFrame:
+    """
+    Read a CSV chunk by chunk, dropping the rows of excluded subjects (and of
+    subjects outside `shard`, and of sublabel_name not in `names`) as they are
+    read. Every row read, before any filter, is fed to `profiler`, which raises
+    on the first chunk that fails a data quality threshold.
+    """
+    if not exclude and shard is None and profiler is None and names is None:
+        return pd.read_csv(input_csv, usecols=usecols)
+    chunks = list()
+    for chunk in pd.read_csv(input_csv, usecols=usecols, chunksize=chunksize):
+        if profiler is not None:
+            profiler.update(chunk)
+        if names is not None:
+            chunk = chunk[chunk['sublabel_name'].isin(names)]
+        if shard is not None:
+            chunk = chunk[sharding.shard_mask(chunk[SUBJECT_REF], shard)]
+        if exclude:
+            chunk = chunk[~chunk[SUBJECT_REF].isin(exclude)]
+        chunks.append(chunk)
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,163 @@
+import json
+from pathlib import Path
+from typing import List
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF
+
+###############################################################################
+# Sparse feature matrix: subject x (variable=value) TF counts
+#
+# Stored in CSR form under `filetool.path_store()` as raw little-endian arrays
+#   indptr.bin   int64, rows + 1
+#   indices.bin  int32, column of each nonzero
+#   data.bin     int32, TF count of each nonzero
+#   rows.txt     subject_ref, one per line (row vocab)
+#   cols.txt     'variable=value', one per line (column vocab)
+# with the shape in meta.json. New subjects are appended to the end of every
+# file; existing rows and column indices never change, so there is no rebuild.
+# meta.json is written last and is the commit point: an append first truncates
+# every file back to the sizes it records, dropping any half-written tail.
+###############################################################################
+META_JSON = 'meta.json'
+INDPTR, INDICES, DATA = 'indptr.bin', 'indices.bin', 'data.bin'
+ROWS_TXT, COLS_TXT = 'rows.txt', 'cols.txt'
+SEPARATOR = '='
+
+def feature_names(tf_df: pd.DataFrame) -> pd.Series:
+    return tf_df['column'].astype(str) + SEPARATOR + tf_df['value'].astype(str)
+
+def tf_to_csr(tf_df: pd.DataFrame,
+              stratifier: str = SUBJECT_REF,
+              cols: List[str] = None) -> tuple:
+    """
+    :param tf_df: output of `cumulative.count_tf`
+    :param cols: existing column vocab; unseen features are appended after it
+    :return: (indptr, indices, data, rows, cols) with rows sorted by `stratifier`
+    """
+    cols = list(cols or [])
+    names = feature_names(tf_df)
+    col_index = pd.Index(cols)
+    col_codes = col_index.get_indexer(names)
+    new = pd.unique(names[col_codes < 0])
+    if len(new):
+        cols += list(new)
+        col_codes = pd.Index(cols).get_indexer(names)
+
+    row_codes, rows = pd.factorize(tf_df[stratifier].astype(str), sort=True)
+    counts = tf_df['count'].to_numpy()
+
+    # duplicate (row, col) pairs are summed, then entries sorted by row and column
+    width = max(len(cols), 1)
+    key = row_codes.astype('int64') * width + col_codes
+    uniq, inverse = np.unique(key, return_inverse=True)
+    data = np.bincount(inverse, weights=counts).astype('int32')
+    indices = (uniq % width).astype('int32')
+    indptr = np.zeros(len(rows) + 1, dtype='int64')
+    np.cumsum(np.bincount(uniq // width, minlength=len(rows)), out=indptr[1:])
+    return indptr, indices, data, list(rows), cols
+
+def _read_meta(artifact_dir: Path) -> dict:
+    with open(artifact_dir / META_JSON) as f:
+        return json.load(f)
+
+def _write_lines(path: Path, lines: List[str], mode: str):
+    with open(path, mode) as f:
+        f.writelines(f'{line}\n' for line in lines)
+
+def _read_lines(path: Path, count: int) -> List[str]:
+    return path.read_text().splitlines()[:count]
+
+def _truncate(artifact_dir: Path, meta: dict) -> tuple:
+    """
+    Cut every file back to the sizes in meta.json (undoes an interrupted append).
+    :return: (rows, cols) as recorded in meta.json
+    """
+    n_rows, n_cols = meta['shape']
+    for name, size in [(INDPTR, 8 * (n_rows + 1)), (INDICES, 4 * meta['nnz']), (DATA, 4 * meta['nnz'])]:
+        with open(artifact_dir / name, 'r+b') as f:
+            f.truncate(size)
+    rows = _read_lines(artifact_dir / ROWS_TXT, n_rows)
+    cols = _read_lines(artifact_dir / COLS_TXT, n_cols)
+    _write_lines(artifact_dir / ROWS_TXT, rows, 'w')
+    _write_lines(artifact_dir / COLS_TXT, cols, 'w')
+    return rows, cols
+
+def save_features(tf_df: pd.DataFrame, artifact: str, stratifier: str = SUBJECT_REF) -> Path:
+    """
+    :param artifact: name like 'irae__highlights_donor_index.pivot.tf.features'
+    :return: Path to the artifact directory
+    """
+    artifact_dir = filetool.path_store(artifact)
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+    indptr, indices, data, rows, cols = tf_to_csr(tf_df, stratifier)
+    indptr.astype('<i8').tofile(artifact_dir / INDPTR)
+    indices.astype('<i4').tofile(artifact_dir / INDICES)
+    data.astype('<i4').tofile(artifact_dir / DATA)
+    _write_lines(artifact_dir / ROWS_TXT, rows, 'w')
+    _write_lines(artifact_dir / COLS_TXT, cols, 'w')
+    with open(artifact_dir / META_JSON, 'w') as f:
+        json.dump({'shape': [len(rows), len(cols)], 'nnz': len(data)}, f)
+    print(f'{artifact}: {len(rows)} x {len(cols)}, {len(data)} nonzero')
+    return artifact_dir
+
+def append_features(tf_df: pd.DataFrame, artifact: str, stratifier: str = SUBJECT_REF) -> Path:
+    """
+    Append the rows of new subjects; subjects already in the matrix raise ValueError.
+    """
+    artifact_dir = filetool.path_store(artifact)
+    if not (artifact_dir / META_JSON).exists():
+        return save_features(tf_df, artifact, stratifier)
+    meta = _read_meta(artifact_dir)
+    old_rows, old_cols = _truncate(artifact_dir, meta)
+
+    seen = tf_df[stratifier].astype(str).isin(old_rows)
+    if seen.any():
+        raise ValueError(f'{seen.sum()} rows of subjects already in {artifact}, e.g. '
+                         f'{tf_df.loc[seen, stratifier].iloc[0]}')
+
+    indptr, indices, data, rows, cols = tf_to_csr(tf_df, stratifier, old_cols)
+    with open(artifact_dir / INDPTR, 'ab') as f:
+        (indptr[1:] + meta['nnz']).astype('<i8').tofile(f)
+    with open(artifact_dir / INDICES, 'ab') as f:
+        indices.astype('<i4').tofile(f)
+    with open(artifact_dir / DATA, 'ab') as f:
+        data.astype('<i4').tofile(f)
+    _write_lines(artifact_dir / ROWS_TXT, rows, 'a')
+    _write_lines(artifact_dir / COLS_TXT, cols[len(old_cols):], 'a')
+
+    meta = {'shape': [len(old_rows) + len(rows), len(cols)], 'nnz': meta['nnz'] + len(data)}
+    with open(artifact_dir / META_JSON, 'w') as f:
+        json.dump(meta, f)
+    print(f'{artifact}: appended {len(rows)} subjects, now {meta["shape"][0]} x {meta["shape"][1]}')
+    return artifact_dir
+
+def load_features(artifact: str, mmap=True) -> dict:
+    """
+    :return: dict indptr, indices, data (memory-mapped with `mmap`), rows, cols, shape
+    """
+    artifact_dir = filetool.path_store(artifact)
+    meta = _read_meta(artifact_dir)
+    n_rows, n_cols = meta['shape']
+
+    def read(name: str, dtype: str, count: int) -> np.ndarray:
+        if mmap and count:
+            return np.memmap(artifact_dir / name, dtype=dtype, mode='r', shape=(count,))
+        return np.fromfile(artifact_dir / name, dtype=dtype, count=count)
+
+    return {
+        'indptr': read(INDPTR, '<i8', n_rows + 1),
+        'indices': read(INDICES, '<i4', meta['nnz']),
+        'data': read(DATA, '<i4', meta['nnz']),
+        'rows': _read_lines(artifact_dir / ROWS_TXT, n_rows),
+        'cols': _read_lines(artifact_dir / COLS_TXT, n_cols),
+        'shape': (n_rows, n_cols),
+    }
+
+def to_scipy(features: dict):
+    """
+    :return: scipy.sparse.csr_matrix (scipy is only needed by the caller)
+    """
+    from scipy.sparse import csr_matrix
+    return csr_matrix((features['data'], features['indices'], features['indptr']), shape=features['shape'])
@@ -1,13 +1,18 @@
 import os
+from functools import cache
 from pathlib import Path
 from kidney_transplant_llm.postproc.schema import *
 
 ###############################################################################
 # build path to CSV
 ###############################################################################
-def path_phi_dir() -> Path | None:
+@cache
+def path_phi_dir() -> Path:
+    """
+    Resolved once per process; later changes to the environment are ignored.
+    """
     if 'LLM_PHI_DIR' not in os.environ:
-        print("LLM_PHI_DIR not defined in environment")
+        raise EnvironmentError("LLM_PHI_DIR not defined in environment")
     return Path(os.environ['LLM_PHI_DIR']) / 'irae'
 
 def path_sample_pre() -> Path | None:
@@ -24,3 +29,36 @@ def path_sample(sample_csv: str) -> Path | None:
 
 def path_highlights(highlights_csv='irae__highlights_donor.csv') -> Path | None:
         return path_phi_dir() / 'highlights' / highlights_csv
+
+def path_store(artifact: str) -> Path | None:
+    """
+    :param artifact: name of a stage output like 'irae__highlights_donor_index.pivot'
+    :return: directory holding the memory-mapped columns of this artifact
+    """
+    return path_phi_dir() / 'store' / artifact
+
+def path_usage(usage_csv: str) -> Path | None:
+    """
+    :param usage_csv: LLM usage output like 'run_2025_01_01.usage.csv'
+    """
+    return path_phi_dir() / 'usage' / usage_csv
+
+def path_run(run_file: str) -> Path | None:
+    """
+    :param run_file: extraction run file like 'run_2025_01_01.ledger.jsonl'
+    """
+    return path_phi_dir() / 'runs' / run_file
+
+def resolve_view(pipeline: str, sample: str = None, origin: str = None) -> tuple:
+    """
+    :param pipeline: key of PIPELINES
+    :param sample: 'pre', 'index', 'post' or a sample table name (default from pipeline)
+    :param origin: LLM origin (default from pipeline)
+    :return: (highlights, sample, origin, view), view name only carries the origin
+             when it is not the pipeline default
+    """
+    highlights, default_sample, default_origin = PIPELINES[pipeline]
+    sample = SAMPLES.get(sample, sample) or default_sample
+    origin = origin or default_origin
+    suffix = None if origin == default_origin else origin
+    return highlights, sample, origin, name_view(highlights, sample, suffix)
@@ -0,0 +1,71 @@
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+###############################################################################
+# Import time budget
+#
+# `python -X importtime` of the light entry points (SQL generation, paths,
+# schema listing, the CLI itself) in a fresh interpreter: each must load
+# within its budget and must not pull in pandas, numpy or pydantic.
+# Enforced by tests/test_importtime.py; also runs on its own:
+#
+#   python -m kidney_transplant_llm.postproc.importtime
+###############################################################################
+BUDGET_MS = {
+    'kidney_transplant_llm.postproc.schema': 50,
+    'kidney_transplant_llm.postproc.filetool': 100,
+    'kidney_transplant_llm.postproc.athena': 100,
+    'kidney_transplant_llm.postproc.cli': 150,
+}
+HEAVY = ['pandas', 'numpy', 'pydantic']
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\s*)(\S+)$')
+
+def measure(module: str) -> Dict:
+    """
+    :return: dict module, ms (cumulative import time of `module`), imported (all module names)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, env=dict(os.environ))
+    if result.returncode:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    cumulative_us, imported = 0, list()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imported.append(match.group(4))
+            if match.group(4) == module:
+                cumulative_us = int(match.group(2))
+    return {'module': module, 'ms': cumulative_us / 1000, 'imported': imported}
+
+def check(budget_ms: Dict[str, float] = None, heavy: List[str] = None) -> List[str]:
+    """
+    :return: list of violations, empty if every module is within budget
+    """
+    budget_ms = BUDGET_MS if budget_ms is None else budget_ms
+    heavy = HEAVY if heavy is None else heavy
+    violations = list()
+    for module, budget in budget_ms.items():
+        report = measure(module)
+        loaded = sorted({name for name in report['imported'] if name.split('.')[0] in heavy})
+        status = 'ok'
+        if report['ms'] > budget:
+            status = 'over budget'
+            violations.append(f"{module}: {report['ms']:.1f} ms > {budget} ms")
+        if loaded:
+            status = 'heavy imports'
+            violations.append(f"{module}: imports {', '.join(n for n in loaded if '.' not in n)}")
+        print(f"{module:<45} {report['ms']:8.1f} ms  (budget {budget} ms)  {status}")
+    return violations
+
+def main():
+    violations = check()
+    if violations:
+        print('\n'.join(violations), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import json
+from pathlib import Path
+from typing import List
+import pandas as pd
+from kidney_transplant_llm.postproc import (
+    filetool,
+    pivot_table,
+    cumulative,
+    exclusion,
+    quality,
+    sharding,
+    spans,
+    store,
+    timeline)
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    DOCUMENT_REF,
+    SORT_BY_DATE,
+    SAMPLE_COLS,
+    PIPELINES,
+    SAMPLES)
+
+###############################################################################
+# Incremental refresh
+#
+# `{view}.watermark.json` records, per origin, the latest sort_by_date already
+# counted and the documents of that date. A refresh reads the new view export
+# and keeps only rows past the mark (or on the mark date from unseen
+# documents), pivots only those rows, and adds their term counts to
+# `{view}.pivot.tf.csv`: counts are summed per (subject_ref, column, value) for
+# the touched subjects, other subjects' rows are kept as they are.
+#
+# The other pivot stage outputs are rewritten to match a full run: the audit
+# is rebuilt with the cohort exclusions (`exclusion.excluded_csv`, donor views
+# included), the new notes' pivot rows are merged into `{view}.pivot.csv`, and
+# its timeline index, store, spans and profile are written again. Subjects
+# newly excluded are dropped from every output.
+#
+# Notes that arrive with a date before the mark are not picked up; run the
+# full pipeline when a backfill changes history.
+###############################################################################
+KEYS = [SUBJECT_REF, 'column', 'value']
+
+def path_watermark(view: str) -> Path:
+    return filetool.path_highlights(f'{view}.watermark.json')
+
+def read_watermark(view: str, origin: str) -> dict:
+    """
+    :return: {'sort_by_date': str, 'documents': [...]}, empty if never refreshed
+    """
+    path = path_watermark(view)
+    if not path.exists():
+        return dict()
+    with open(path) as f:
+        return json.load(f).get(origin, dict())
+
+def write_watermark(view: str, origin: str, mark: dict):
+    path = path_watermark(view)
+    marks = json.loads(path.read_text()) if path.exists() else dict()
+    marks[origin] = mark
+    path.write_text(json.dumps(marks, indent=2))
+
+def next_watermark(df: pd.DataFrame, mark: dict) -> dict:
+    """
+    :return: watermark after counting the rows of `df` on top of `mark`
+    """
+    if df.empty:
+        return mark
+    last = str(df[SORT_BY_DATE].max())
+    documents = set(df.loc[df[SORT_BY_DATE].astype(str) == last, DOCUMENT_REF].astype(str))
+    if mark.get(SORT_BY_DATE) == last:
+        documents |= set(mark.get('documents', []))
+    return {SORT_BY_DATE: last, 'documents': sorted(documents)}
+
+def delta_rows(df: pd.DataFrame, mark: dict) -> pd.DataFrame:
+    """
+    :return: rows past the watermark
+    """
+    if not mark:
+        return df
+    dates = df[SORT_BY_DATE].astype(str)
+    newer = dates > mark[SORT_BY_DATE]
+    same_day = (dates == mark[SORT_BY_DATE]) & ~df[DOCUMENT_REF].astype(str).isin(mark['documents'])
+    return df[newer | same_day]
+
+def view_watermark(view_csv: Path | str, until: str = None) -> dict:
+    """
+    Watermark of the raw highlights, every note counts, including those of
+    excluded subjects and of labels a stage does not read.
+
+    :param until: only rows up to this sort_by_date
+    """
+    df = pd.read_csv(view_csv, usecols=[DOCUMENT_REF, SORT_BY_DATE], dtype=str, keep_default_na=False)
+    if until is not None:
+        df = df[df[SORT_BY_DATE] <= until]
+    return next_watermark(df, dict())
+
+def mark_full_run(view: str, origin: str):
+    """
+    Record the watermark of a full run, from the highlights it read.
+    """
+    write_watermark(view, origin, view_watermark(filetool.path_highlights(f'{view}.csv')))
+
+def bootstrap_watermark(view: str) -> dict:
+    """
+    Watermark of a full run made before watermarks were recorded: the raw
+    highlights up to the last date of its pivot. Notes of that date exported
+    after the full run are taken as counted.
+    """
+    pivot_csv = filetool.path_highlights(f'{view}.pivot.csv')
+    if not pivot_csv.exists():
+        return dict()
+    last = pd.read_csv(pivot_csv, usecols=[SORT_BY_DATE], dtype=str)[SORT_BY_DATE].max()
+    return view_watermark(filetool.path_highlights(f'{view}.csv'), until=last)
+
+###############################################################################
+# Additive TF merge
+###############################################################################
+def sort_tf(tf_df: pd.DataFrame, column_order: List[str]) -> pd.DataFrame:
+    """
+    Order of `cumulative.count_tf`: by column, then subject, then count (descending), then value.
+    """
+    order = tf_df['column'].map({col: i for i, col in enumerate(column_order)}).fillna(len(column_order))
+    return (tf_df.assign(_order=order, _value=tf_df['value'].astype(str))
+            .sort_values(['_order', SUBJECT_REF, 'count', '_value'], ascending=[True, True, False, True],
+                         kind='stable')
+            .drop(columns=['_order', '_value'])
+            .reset_index(drop=True))
+
+def read_tf(tf_csv: Path | str) -> pd.DataFrame:
+    """
+    TF CSV with values as text, the way `cumulative.count_tf` reads them
+    """
+    tf_df = pd.read_csv(tf_csv, dtype=str, keep_default_na=False)
+    return tf_df.astype({'count': 'int64'})
+
+def merge_tf(old_tf: pd.DataFrame, delta_tf: pd.DataFrame, drop_subjects: set = None) -> pd.DataFrame:
+    """
+    :param old_tf: see `read_tf`
+    :param delta_tf: `cumulative.count_tf` of the delta pivot
+    :return: TF with the delta counts added; only subjects in `delta_tf` are re-aggregated
+    """
+    drop_subjects = drop_subjects or set()
+    old_tf = old_tf[~old_tf[SUBJECT_REF].isin(drop_subjects)]
+    delta_tf = delta_tf[~delta_tf[SUBJECT_REF].isin(drop_subjects)]
+    touched = old_tf[SUBJECT_REF].isin(delta_tf[SUBJECT_REF].unique())
+    summed = (pd.concat([old_tf[touched], delta_tf], ignore_index=True)
+              .groupby(KEYS, as_index=False, sort=False)['count'].sum())
+    column_order = list(dict.fromkeys(list(old_tf['column']) + list(delta_tf['column'])))
+    return sort_tf(pd.concat([old_tf[~touched], summed[old_tf.columns]], ignore_index=True), column_order)
+
+def first_tf(tf_df: pd.DataFrame, old_first: pd.DataFrame = None, subjects: set = None) -> pd.DataFrame:
+    """
+    Highest TF value per (subject, column), like `count_tf(first=True)`;
+    with `old_first`, only `subjects` are recomputed.
+    """
+    if old_first is not None and subjects is not None:
+        keep = old_first[~old_first[SUBJECT_REF].isin(subjects) & old_first[SUBJECT_REF].isin(tf_df[SUBJECT_REF])]
+        tf_df = tf_df[tf_df[SUBJECT_REF].isin(subjects)]
+    else:
+        keep = None
+    top = (tf_df.sort_values([SUBJECT_REF, 'column', 'count'], ascending=[True, True, False], kind='stable')
+           .drop_duplicates([SUBJECT_REF, 'column']))
+    out = top if keep is None else pd.concat([keep, top], ignore_index=True)
+    return sort_tf(out, list(dict.fromkeys(tf_df['column'])))
+
+###############################################################################
+# Refresh one view
+###############################################################################
+def refresh(pipeline: str = 'donor', sample: str = None, origin: str = None,
+            gates: quality.Gates = None) -> Path:
+    """
+    :param gates: data quality thresholds, checked on the whole view as in a full run
+    :return: Path to the updated `{view}.pivot.tf.csv`
+    """
+    from kidney_transplant_llm.postproc import dag
+    job = dag.make_job(pipeline, sample, origin, gates=gates)
+    view_csv = filetool.path_highlights(f'{job.view}.csv')
+    pivot_csv = filetool.path_highlights(f'{job.view}.pivot.csv')
+    tf_csv = filetool.path_highlights(f'{job.view}.pivot.tf.csv')
+    first_csv = filetool.path_highlights(f'{job.view}.pivot.tf.first.csv')
+    audit_csv = filetool.path_highlights(f'{job.view}.excluded.csv')
+
+    mark = read_watermark(job.view, job.origin) or bootstrap_watermark(job.view)
+    header = pd.read_csv(view_csv, nrows=0).columns
+    usecols = [col for col in header if col in SAMPLE_COLS + ['sublabel_name', 'sublabel_value', spans.SPAN_COL]]
+    view_df = pd.read_csv(view_csv, usecols=usecols, dtype={DOCUMENT_REF: str, SORT_BY_DATE: str})
+    profiler = (job.gates or quality.Gates()).profiler(f'{job.view}.csv')
+    profiler.update(view_df)
+    profiler.finish()
+
+    # exclusions are per subject: the audit is rebuilt from this view and the donor views
+    excluded_before = exclusion.read_excluded(audit_csv)
+    exclusion.excluded_csv(f'{job.view}.csv', gates=job.gates)
+    excluded = exclusion.read_excluded(audit_csv)
+    drop = excluded - excluded_before
+
+    new_rows = delta_rows(view_df, mark)
+    delta = new_rows[new_rows['sublabel_name'].isin(job.columns) & ~new_rows[SUBJECT_REF].isin(excluded)]
+    print(f'{job.view}: {len(delta)} new rows after {mark.get(SORT_BY_DATE)}, {len(drop)} subjects newly excluded')
+    if delta.empty and not drop:
+        write_watermark(job.view, job.origin, next_watermark(new_rows, mark))
+        return tf_csv
+
+    delta_pivot_csv = filetool.path_highlights(f'{job.view}.pivot.delta.csv')
+    pivot_table.pivot_highlights_df(delta, aggfunc=pivot_table.MAJORITY,
+                                    policies=pivot_table.SUBLABEL_POLICIES).to_csv(delta_pivot_csv, index=False)
+    delta_tf = cumulative.count_tf(delta_pivot_csv, stratifier=SUBJECT_REF, columns=job.columns)
+    if delta_tf.empty:
+        delta_tf = pd.DataFrame(columns=[SUBJECT_REF, 'count', 'column', 'value'])
+
+    old_tf = read_tf(tf_csv) if tf_csv.exists() else delta_tf.iloc[:0]
+    tf_df = merge_tf(old_tf, delta_tf, drop_subjects=drop)
+    tf_df.to_csv(tf_csv, index=False)
+
+    old_first = read_tf(first_csv) if first_csv.exists() else None
+    touched = set(delta_tf[SUBJECT_REF]) | drop if old_first is not None else None
+    first_tf(tf_df, old_first, touched).to_csv(first_csv, index=False)
+
+    # pivot stage outputs, as `pivot_table.pivot_highlights_csv` writes them
+    frames = [cumulative.read_pivot(delta_pivot_csv)]
+    if pivot_csv.exists():
+        old_pivot = cumulative.read_pivot(pivot_csv)
+        frames.insert(0, old_pivot[~old_pivot[SUBJECT_REF].isin(drop)])
+    sharding.merge_pivot_frames(frames).to_csv(pivot_csv, index=False)
+    timeline.build_index(pivot_csv)
+    store.save_df(pd.read_csv(pivot_csv), pivot_csv.name.removesuffix('.csv'))
+    if spans.SPAN_COL in view_df.columns:
+        kept = view_df[view_df['sublabel_name'].isin(job.columns) & ~view_df[SUBJECT_REF].isin(excluded)]
+        spans.save_spans(kept, pivot_csv.name.replace('.pivot.csv', '.spans'))
+    profiler.save(pivot_csv.with_suffix('.profile.json'))
+
+    write_watermark(job.view, job.origin, next_watermark(new_rows, mark))
+    return tf_csv
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Add the term counts of new notes to an existing run.')
+    parser.add_argument('--pipeline', choices=list(PIPELINES), default='donor')
+    parser.add_argument('--sample', choices=list(SAMPLES), default=None)
+    parser.add_argument('--origin', default=None)
+    args = parser.parse_args(argv)
+    refresh(args.pipeline, args.sample, args.origin)
+
+if __name__ == '__main__':
+    main()
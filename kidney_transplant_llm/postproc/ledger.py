@@ -0,0 +1,136 @@
+import hashlib
+import io
+import json
+import os
+import time
+from typing import List
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool
+from kidney_transplant_llm.postproc.schema import DOCUMENT_REF
+
+###############################################################################
+# Run ledger
+#
+# Append-only JSONL log of completed extraction work, one line per
+# (documentreference_ref, model, annotation class). Lines are fsync'ed in
+# batches, so a crash loses at most the last batch, which is then redone.
+#
+# Resuming reads `{run}.ledger.idx.npz`: the sorted SHA-256 digests of every
+# finished key and the byte offset of the log they cover. Only the log past
+# that offset is parsed, so startup is a single array load even for tens of
+# millions of entries. A partial last line left by a crash is truncated.
+#
+# Lookups compare the full 32-byte digest, never a truncated hash, so two
+# different keys cannot be mistaken for each other.
+###############################################################################
+BATCH = 1000
+INTERVAL_SECONDS = 5.0
+MODEL = 'model'
+GROUP = 'group'
+
+def _digest_keys(notes: pd.Series, model: pd.Series | str, group: pd.Series | str) -> np.ndarray:
+    """
+    :return: SHA-256 digest of each 'note|model|group' key, dtype S32
+    """
+    keys = notes.astype(str) + '|' + model + '|' + group
+    return np.array([hashlib.sha256(key.encode()).digest() for key in keys], dtype='S32')
+
+def _parse(lines: bytes) -> pd.DataFrame:
+    if not lines:
+        return pd.DataFrame(columns=[DOCUMENT_REF, MODEL, GROUP])
+    return pd.read_json(io.BytesIO(lines), lines=True, dtype=str)
+
+class Ledger:
+    """
+    with Ledger('run_2025_01_01') as ledger:
+        for note in ledger.pending(notes, model, group):
+            ...
+            ledger.record(note, model, group)
+    """
+    def __init__(self, run: str, batch: int = BATCH, interval: float = INTERVAL_SECONDS):
+        self.log_path = filetool.path_run(f'{run}.ledger.jsonl')
+        self.index_path = filetool.path_run(f'{run}.ledger.idx.npz')
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch = batch
+        self.interval = interval
+        self.finished = self._scan()
+        self._file = open(self.log_path, 'ab')
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def _scan(self) -> np.ndarray:
+        """
+        :return: sorted digests of finished keys; log and index are brought in sync
+        """
+        self.log_path.touch()
+        size = self.log_path.stat().st_size
+        digests, offset = np.empty(0, dtype='S32'), 0
+        if self.index_path.exists():
+            with np.load(self.index_path) as index:
+                # an index of 64-bit hashes (older runs) is rebuilt from the log
+                if 'digests' in index and int(index['offset']) <= size:
+                    digests, offset = index['digests'], int(index['offset'])
+
+        with open(self.log_path, 'rb+') as f:
+            f.seek(offset)
+            tail = f.read()
+            complete = tail.rfind(b'\n') + 1
+            if complete < len(tail):
+                f.truncate(offset + complete)
+        if complete:
+            entries = _parse(tail[:complete])
+            digests = np.union1d(digests, _digest_keys(entries[DOCUMENT_REF], entries[MODEL], entries[GROUP]))
+            self._save_index(digests, offset + complete)
+        print(f'{self.log_path.name}: {len(digests)} finished')
+        return digests
+
+    def _save_index(self, digests: np.ndarray, offset: int):
+        tmp = self.index_path.with_suffix('.tmp.npz')
+        np.savez(tmp, digests=digests, offset=np.int64(offset))
+        os.replace(tmp, self.index_path)
+
+    ###########################################################################
+    # Query and record
+    ###########################################################################
+    def is_finished(self, notes: List[str], model: str, group: str) -> np.ndarray:
+        """
+        :return: bool array, True where (note, model, group) is in the ledger
+        """
+        digests = _digest_keys(pd.Series(notes, dtype='object'), model, group)
+        pos = np.searchsorted(self.finished, digests).clip(max=max(len(self.finished) - 1, 0))
+        return (self.finished[pos] == digests) if len(self.finished) else np.zeros(len(digests), dtype=bool)
+
+    def pending(self, notes: List[str], model: str, group: str) -> List[str]:
+        """
+        :return: notes not yet finished for this model and annotation class
+        """
+        done = self.is_finished(notes, model, group)
+        return [note for note, finished in zip(notes, done) if not finished]
+
+    def record(self, note: str, model: str, group: str):
+        line = json.dumps({DOCUMENT_REF: note, MODEL: model, GROUP: group}) + '\n'
+        self._file.write(line.encode())
+        self._unsynced += 1
+        if self._unsynced >= self.batch or time.monotonic() - self._synced_at >= self.interval:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self):
+        """
+        Sync the log and fold the new entries into the index.
+        """
+        self.sync()
+        self._file.close()
+        self.finished = self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
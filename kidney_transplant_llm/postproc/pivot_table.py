@@ -1,14 +1,34 @@
+import numpy as np
 import pandas as pd
+from pandas.api.extensions import take
 from pathlib import Path
-from typing import List, Optional
-from kidney_transplant_llm.postproc import filetool
+from typing import Dict, List, Optional
+from kidney_transplant_llm.postproc import filetool, store, spans, timeline, exclusion, sharding, quality
 from kidney_transplant_llm.postproc.schema import (
     SUBJECT_REF,
     ENCOUNTER_REF,
     DOCUMENT_REF,
     SORT_BY_DATE,
     ENC_ORDINAL,
-    DOC_ORDINAL)
+    DOC_ORDINAL,
+    SAMPLE_COLS,
+    TRUE_VALUES,
+    FALSE_VALUES)
+
+###############################################################################
+# Aggregation policies, resolving duplicate (index, sublabel_name) pairs
+###############################################################################
+FIRST = 'first'         # first row in view order (sorted by date and ordinals)
+MAJORITY = 'majority'   # most frequent value, ties go to the first seen
+ANY = 'any'             # True if any row is true
+
+POLICIES = [FIRST, MAJORITY, ANY]
+
+# sublabel_name -> policy, everything else uses MAJORITY; ANY is for boolean sublabels only
+SUBLABEL_POLICIES = {
+    'Transplant Date': FIRST,
+    'Multiple Transplant History': ANY,
+}
 
 def pivot_highlights_df(
     df: pd.DataFrame,
@@ -16,6 +36,7 @@ def pivot_highlights_df(
     name_col: str = "sublabel_name",
     value_col: str = "sublabel_value",
     aggfunc: str = "first",
+    policies: Optional[Dict[str, str]] = None,
 ) -> pd.DataFrame:
     """
     Pivot a long sublabel table into a wide format where each sublabel_name
@@ -42,13 +63,18 @@ def pivot_highlights_df(
         Column name that contains the sublabel values (cell values).
     aggfunc : str or callable, default "first"
         Aggregation function to resolve duplicates for a given (index, name_col)
-        pair. Common options: "first", "max", "min", "last", etc.
+        pair. One of POLICIES uses the fast kernel `pivot_policies_df`; any
+        other pandas aggfunc ("max", "min", "last", etc.) uses `pivot_table`.
+    policies : dict, optional
+        sublabel_name -> policy overriding `aggfunc` per sublabel,
+        e.g. SUBLABEL_POLICIES.
 
     Returns
     -------
     pd.DataFrame
         Wide-format DataFrame with index_cols plus one column per distinct
-        sublabel_name.
+        sublabel_name. With the fast kernel, `wide.attrs['conflicts']` holds
+        the number of resolved conflicts per sublabel_name.
     """
     if index_cols is None:
         index_cols = [
@@ -60,6 +86,9 @@ def pivot_highlights_df(
             DOC_ORDINAL
         ]
 
+    if aggfunc in POLICIES:
+        return pivot_policies_df(df, index_cols, name_col, value_col, aggfunc, policies)
+
     wide = (
         df.pivot_table(
             index=index_cols,
@@ -72,9 +101,125 @@ def pivot_highlights_df(
     wide.columns.name = None
     return wide
 
-def pivot_highlights_csv(highlights_csv:str = 'irae__highlights_donor_index.csv') -> Path:
+def pivot_policies_df(
+    df: pd.DataFrame,
+    index_cols: List[str],
+    name_col: str = "sublabel_name",
+    value_col: str = "sublabel_value",
+    default_policy: str = FIRST,
+    policies: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Pivot kernel: group ids are assigned once, rows are stably sorted by group
+    (keeping view order inside each group), and every policy is resolved with
+    array operations on the group boundaries instead of groupby-aggregate.
+
+    :return: wide DataFrame, same layout as `pandas.pivot_table`
+    """
+    policies = policies or dict()
+    df = df[df[value_col].notna()].dropna(subset=index_cols)
+    if df.empty:
+        wide = pd.DataFrame(columns=index_cols)
+        wide.attrs['conflicts'] = dict()
+        return wide
+
+    row_id = df.groupby(index_cols, sort=True).ngroup().to_numpy()
+    name_codes, names = pd.factorize(df[name_col], sort=True)
+    value_codes, values = pd.factorize(df[value_col])
+
+    # ANY only applies to sublabels whose values are all boolean text, e.g. not
+    # 'Deceased' when it carries a deceased_date; those keep `default_policy`
+    is_bool = pd.Series(values.astype(str)).str.lower().isin(TRUE_VALUES + FALSE_VALUES).to_numpy()
+    bool_name = np.ones(len(names), dtype=bool)
+    np.logical_and.at(bool_name, name_codes, is_bool[value_codes])
+
+    # one group per (index row, sublabel_name), sorted once
+    group = row_id.astype('int64') * len(names) + name_codes
+    order = np.argsort(group, kind='stable')
+    group, value_codes = group[order], value_codes[order]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    group_name_code = group[starts] % len(names)
+
+    # distinct (group, value) pairs, in order of first appearance within each group
+    pair_order = np.lexsort((value_codes, group))
+    pair_group, pair_value = group[pair_order], value_codes[pair_order]
+    pair_starts = np.flatnonzero(np.r_[True, (pair_group[1:] != pair_group[:-1]) |
+                                             (pair_value[1:] != pair_value[:-1])])
+    pair_count = np.diff(np.r_[pair_starts, len(pair_order)])
+    pair_first = pair_order[pair_starts]
+    pair_index = np.searchsorted(group[starts], pair_group[pair_starts])
+    n_distinct = np.bincount(pair_index, minlength=len(starts))
+
+    name_policy = np.array([policies.get(name, default_policy) for name in names], dtype=object)
+    name_policy[(name_policy == ANY) & ~bool_name] = default_policy
+    policy = name_policy[group_name_code]
+
+    # resolved value code per group, FIRST is the first row of each group
+    resolved = value_codes[starts]
+
+    mask = policy == MAJORITY
+    if mask.any():
+        best = np.lexsort((pair_first, -pair_count, pair_index))
+        best = best[np.r_[True, pair_index[best][1:] != pair_index[best][:-1]]]
+        resolved = np.where(mask, pair_value[pair_starts][best], resolved)
+
+    mask = policy == ANY
+    if mask.any():
+        is_true = pd.Series(values.astype(str)).str.lower().isin(TRUE_VALUES).to_numpy()
+        any_true = np.maximum.reduceat(is_true[value_codes], starts)
+
+    # wide columns are filled directly, one array per sublabel_name
+    n_rows = row_id.max() + 1 if len(row_id) else 0
+    first_row = np.unique(row_id, return_index=True)[1]
+    wide = df[index_cols].iloc[first_row].reset_index(drop=True)
+    cell_row = group[starts] // len(names)
+    for name_code, name in enumerate(names):
+        mask = group_name_code == name_code
+        if name_policy[name_code] == ANY:
+            column = np.full(n_rows, np.nan, dtype=object)
+            column[cell_row[mask]] = any_true[mask]
+            wide[name] = column
+        else:
+            column = np.full(n_rows, -1, dtype='int64')
+            column[cell_row[mask]] = resolved[mask]
+            wide[name] = take(values.array, column, allow_fill=True)
+
+    conflicts = np.bincount(group_name_code, weights=n_distinct > 1, minlength=len(names))
+    wide.attrs['conflicts'] = {name: int(n) for name, n in zip(names, conflicts)}
+    return wide
+
+def pivot_highlights_csv(highlights_csv:str = 'irae__highlights_donor_index.csv',
+                         exclude: set = None,
+                         shard: sharding.Shard = None,
+                         names: list = None,
+                         gates: quality.Gates = None) -> Path:
+    """
+    :param highlights_csv: view CSV
+    :param exclude: subject_ref to drop while reading, see `exclusion`
+    :param shard: only subjects of this shard (i, N), see `sharding`
+    :param names: only pivot these sublabel_name (see `vocab.model_displays`), default all
+    :param gates: data quality thresholds, checked on every row of the view before filtering
+    :return: Path to `{view}.pivot.csv` (or `{view}.shard{i}of{N}.pivot.csv`)
+    """
     input_csv = filetool.path_highlights(highlights_csv)
-    output_csv = Path(str(input_csv).replace('.csv', '.pivot.csv'))
-    output_df = pivot_highlights_df(pd.read_csv(input_csv))
+    output_name = sharding.shard_csv_name(highlights_csv, shard).replace('.csv', '.pivot.csv')
+    output_csv = filetool.path_highlights(output_name)
+    header = pd.read_csv(input_csv, nrows=0).columns
+    usecols = [col for col in header if col in SAMPLE_COLS + ['sublabel_name', 'sublabel_value', spans.SPAN_COL]]
+    profiler = (gates or quality.Gates()).profiler(highlights_csv)
+    input_df = exclusion.read_csv_excluding(input_csv, exclude, shard, usecols=usecols,
+                                            profiler=profiler, names=names)
+    profiler.finish()
+    profiler.save(output_csv.with_suffix('.profile.json'))
+    output_df = pivot_highlights_df(input_df,
+                                    aggfunc=MAJORITY,
+                                    policies=SUBLABEL_POLICIES)
+    for name, n in output_df.attrs['conflicts'].items():
+        if n:
+            print(f'{name}: {n} conflicts resolved by {SUBLABEL_POLICIES.get(name, MAJORITY)}')
     output_df.to_csv(output_csv, index=False)
+    timeline.build_index(output_csv)
+    store.save_df(output_df, output_csv.name.removesuffix('.csv'))
+    if spans.SPAN_COL in input_df.columns:
+        spans.save_spans(input_df, output_csv.name.replace('.pivot.csv', '.spans'))
     return output_csv
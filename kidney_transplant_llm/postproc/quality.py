@@ -0,0 +1,181 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    ENCOUNTER_REF,
+    DOCUMENT_REF,
+    SORT_BY_DATE,
+    SAMPLE_COLS)
+
+###############################################################################
+# Data quality profile
+#
+# Bad Athena exports (missing origin -> empty view, empty join, null
+# sort_by_date) are caught while the view is read, chunk by chunk, before
+# pivot and TF run. One pass collects null rates, approximate distinct counts
+# of the ref columns (HyperLogLog), value histograms per sublabel_name and the
+# distribution of rows per subject. The profile covers every row of the view,
+# before the exclusion, shard and sublabel_name filters drop any.
+#
+# Thresholds are defaults; `Gates` overrides them per run, e.g. from the DAG CLI:
+#   dag --max-null-rate sort_by_date=0.01 --min-subjects 100
+###############################################################################
+REF_COLS = [SUBJECT_REF, ENCOUNTER_REF, DOCUMENT_REF]
+REQUIRED_COLS = SAMPLE_COLS + ['sublabel_name', 'sublabel_value']
+
+# column -> largest accepted null rate; checked after every chunk
+MAX_NULL_RATE = {
+    SUBJECT_REF: 0.0,
+    DOCUMENT_REF: 0.0,
+    SORT_BY_DATE: 0.0,
+    'sublabel_name': 0.0,
+    'origin': 0.0,
+}
+MIN_ROWS = 1
+MIN_SUBJECTS = 1
+
+HLL_PRECISION = 14
+
+class DataQualityError(ValueError):
+    pass
+
+@dataclass(frozen=True)
+class Gates:
+    """
+    Thresholds of a run; `max_null_rate` holds (column, rate) pairs so a Job stays hashable.
+    """
+    max_null_rate: tuple = tuple(MAX_NULL_RATE.items())
+    min_rows: int = MIN_ROWS
+    min_subjects: int = MIN_SUBJECTS
+
+    def profiler(self, name: str, required_cols: List[str] = None) -> 'Profiler':
+        return Profiler(name, dict(self.max_null_rate), self.min_rows, self.min_subjects, required_cols)
+
+def make_gates(null_rates: List[str] = None, min_rows: int = None, min_subjects: int = None) -> Gates:
+    """
+    :param null_rates: 'column=rate' overrides of MAX_NULL_RATE, e.g. ['sort_by_date=0.01']
+    :return: Gates, defaults for everything not given
+    """
+    max_null_rate = dict(MAX_NULL_RATE)
+    for item in null_rates or []:
+        col, _, rate = item.partition('=')
+        if not rate:
+            raise ValueError(f'expected column=rate, got {item!r}')
+        max_null_rate[col] = float(rate)
+    return Gates(tuple(max_null_rate.items()),
+                 MIN_ROWS if min_rows is None else min_rows,
+                 MIN_SUBJECTS if min_subjects is None else min_subjects)
+
+class HyperLogLog:
+    """
+    Distinct count sketch: 2**precision registers, ~0.8% error at precision 14.
+    """
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.p = precision
+        self.registers = np.zeros(1 << precision, dtype='uint8')
+
+    def add(self, values: pd.Series):
+        hashed = pd.util.hash_pandas_object(values.dropna().astype(str), index=False).to_numpy()
+        idx = (hashed >> np.uint64(64 - self.p)).astype('int64')
+        rest = hashed & np.uint64((1 << (64 - self.p)) - 1)
+        bit_length = np.frexp(rest.astype('float64'))[1]
+        rank = (64 - self.p - bit_length + 1).astype('uint8')
+        np.maximum.at(self.registers, idx, rank)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype('float64')))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+class Profiler:
+    """
+    profiler = Profiler('irae__highlights_donor_index')
+    for chunk in chunks:
+        profiler.update(chunk)   # raises DataQualityError as soon as a threshold fails
+    profiler.finish()
+    """
+    def __init__(self, name: str,
+                 max_null_rate: Dict[str, float] = None,
+                 min_rows: int = MIN_ROWS,
+                 min_subjects: int = MIN_SUBJECTS,
+                 required_cols: List[str] = None):
+        self.name = name
+        self.max_null_rate = MAX_NULL_RATE if max_null_rate is None else max_null_rate
+        self.min_rows = min_rows
+        self.min_subjects = min_subjects
+        self.required_cols = REQUIRED_COLS if required_cols is None else required_cols
+        self.rows = 0
+        self.nulls = pd.Series(dtype='int64')
+        self.sketches = {col: HyperLogLog() for col in REF_COLS}
+        self.values = None
+        self.subject_rows = pd.Series(dtype='int64')
+
+    def _fail(self, message: str):
+        raise DataQualityError(f'{self.name}: {message}')
+
+    def update(self, chunk: pd.DataFrame):
+        if self.rows == 0:
+            missing = [col for col in self.required_cols if col not in chunk.columns]
+            if missing:
+                self._fail(f'missing columns {missing}')
+        self.rows += len(chunk)
+        self.nulls = self.nulls.add(chunk.isna().sum(), fill_value=0).astype('int64')
+        for col, sketch in self.sketches.items():
+            if col in chunk.columns:
+                sketch.add(chunk[col])
+        if {'sublabel_name', 'sublabel_value'} <= set(chunk.columns):
+            counts = chunk.groupby(['sublabel_name', 'sublabel_value'], dropna=False).size()
+            self.values = counts if self.values is None else self.values.add(counts, fill_value=0).astype('int64')
+        if SUBJECT_REF in chunk.columns:
+            self.subject_rows = self.subject_rows.add(chunk[SUBJECT_REF].value_counts(), fill_value=0).astype('int64')
+        self._check_nulls()
+
+    def _check_nulls(self):
+        if not self.rows:
+            return
+        for col, limit in self.max_null_rate.items():
+            if col in self.nulls.index and self.nulls[col] / self.rows > limit:
+                self._fail(f'null rate of {col} {self.nulls[col] / self.rows:.2%} > {limit:.2%}')
+
+    def finish(self) -> dict:
+        """
+        Check the thresholds that need the whole input.
+
+        :return: profile, see `profile`
+        """
+        if self.rows < self.min_rows:
+            self._fail(f'{self.rows} rows < {self.min_rows}, empty export or join?')
+        if len(self.subject_rows) < self.min_subjects:
+            self._fail(f'{len(self.subject_rows)} subjects < {self.min_subjects}')
+        return self.profile()
+
+    def profile(self) -> dict:
+        per_subject = self.subject_rows.to_numpy()
+        quantiles = [0, 0.5, 0.9, 0.99, 1]
+        histogram = dict()
+        for (name, value), n in ([] if self.values is None else self.values.items()):
+            histogram.setdefault(str(name), dict())[str(value)] = int(n)
+        return {
+            'name': self.name,
+            'rows': self.rows,
+            'null_rate': {col: round(n / self.rows, 6) if self.rows else None
+                          for col, n in self.nulls.items()},
+            'distinct': {col: sketch.count() for col, sketch in self.sketches.items()},
+            'subjects': len(per_subject),
+            'rows_per_subject': dict(zip([f'q{int(q * 100)}' for q in quantiles],
+                                         np.quantile(per_subject, quantiles).tolist() if len(per_subject) else [])),
+            'values': histogram,
+        }
+
+    def save(self, profile_json: Path | str) -> Path:
+        with open(profile_json, 'w') as f:
+            json.dump(self.profile(), f, indent=2)
+        return Path(profile_json)
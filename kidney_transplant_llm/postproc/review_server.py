@@ -0,0 +1,157 @@
+import argparse
+import json
+import re
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool, store, spans, timeline
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    DOCUMENT_REF)
+
+###############################################################################
+# Local chart review service
+#
+# Read-only JSON over the postproc outputs of one or more views:
+#   GET /views
+#   GET /patients/{subject_ref}/timeline?view=...
+#   GET /patients/{subject_ref}/tf?view=...
+#   GET /tf?view=...&column=Donor Type
+#   GET /spans?view=...&note=DocumentReference/UUID
+#   GET /discordant?view=...&column=Donor Type
+#
+# Patient timelines come from the timeline index and are kept in an LRU cache;
+# TF tables and discordant patient lists are indexed once per view. Missing
+# outputs answer 404, outputs that do not parse answer 422. A view whose
+# pivot or TF file changed on disk (a rerun) is loaded again on next use.
+###############################################################################
+CACHE_SIZE = 1024
+
+# a view is a file name stem under path_highlights(), never a path
+VIEW_NAME = re.compile(r'\w[\w.]*')
+
+def output_version(view: str) -> tuple:
+    """
+    :return: mtime of the pivot and TF files of the view, 0 when missing
+    """
+    paths = [filetool.path_highlights(f'{view}{suffix}') for suffix in ('.pivot.csv', '.pivot.tf.csv')]
+    return tuple(p.stat().st_mtime_ns if p.exists() else 0 for p in paths)
+
+class ViewData:
+    """
+    Precomputed indexes over the outputs of one view, built on first use.
+    """
+    def __init__(self, view: str):
+        self.view = view
+        self.version = output_version(view)
+        self.pivot_csv = filetool.path_highlights(f'{view}.pivot.csv')
+        tf_df = pd.read_csv(filetool.path_highlights(f'{view}.pivot.tf.csv'))
+        missing = {SUBJECT_REF, 'column'} - set(tf_df.columns)
+        if missing:
+            raise ValueError(f'{view}.pivot.tf.csv has no column {sorted(missing)}')
+        self.tf_by_column = {col: df for col, df in tf_df.groupby('column')}
+        self.tf_by_subject = {sid: df for sid, df in tf_df.groupby(SUBJECT_REF)}
+        n_values = tf_df.groupby(['column', SUBJECT_REF]).size()
+        self.discordant = {col: sorted(n[n > 1].index.get_level_values(SUBJECT_REF))
+                           for col, n in n_values.groupby(level='column')}
+        spans_artifact = f'{view}.spans'
+        self.spans = spans.load_spans(spans_artifact) if store.exists(spans_artifact) else None
+
+_views = dict()
+_views_lock = threading.Lock()
+
+def get_view(view: str) -> ViewData:
+    """
+    Views load outside the lock, so one slow view does not stall requests for
+    the others; two requests may both load it, the last one stored wins.
+    """
+    data = _views.get(view)
+    if data is None or data.version != output_version(view):
+        data = ViewData(view)
+        with _views_lock:
+            _views[view] = data
+    return data
+
+@lru_cache(maxsize=CACHE_SIZE)
+def patient_timeline(view: str, subject_ref: str, version: tuple) -> list:
+    """
+    :param version: `ViewData.version`, so a rebuilt pivot is never answered from the cache
+    """
+    return records(timeline.lookup(get_view(view).pivot_csv, subject_ref))
+
+def records(df: pd.DataFrame) -> list:
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+###############################################################################
+# Routes
+###############################################################################
+def route(path: str, query: dict):
+    """
+    :return: (status, JSON-serializable body)
+    """
+    parts = [unquote(p) for p in path.strip('/').split('/') if p]
+    if parts == ['views']:
+        return 200, sorted(_views)
+
+    view = query.get('view')
+    if not view:
+        return 400, {'error': 'missing ?view='}
+    if not VIEW_NAME.fullmatch(view):
+        return 400, {'error': f'invalid view name {view!r}'}
+    data = get_view(view)
+
+    if len(parts) >= 3 and parts[0] == 'patients':
+        # subject_ref contains a '/', e.g. Patient/UUID
+        subject_ref = '/'.join(parts[1:-1])
+        if parts[-1] == 'timeline':
+            return 200, patient_timeline(view, subject_ref, data.version)
+        if parts[-1] == 'tf':
+            return 200, records(data.tf_by_subject.get(subject_ref, pd.DataFrame()))
+    if parts == ['tf']:
+        return 200, records(data.tf_by_column.get(query.get('column'), pd.DataFrame()))
+    if parts == ['discordant']:
+        return 200, data.discordant.get(query.get('column'), [])
+    if parts == ['spans']:
+        if data.spans is None:
+            return 404, {'error': f'no spans stored for {view}'}
+        note = data.spans[data.spans[DOCUMENT_REF] == query.get('note')]
+        return 200, records(note)
+    return 404, {'error': f'unknown path {path}'}
+
+class ReviewHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            status, body = route(url.path, query)
+        except (FileNotFoundError, KeyError) as e:
+            status, body = 404, {'error': str(e)}
+        except ValueError as e:
+            # pandas ParserError / EmptyDataError, bad encoding
+            status, body = 422, {'error': f'cannot read outputs: {e}'}
+        payload = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def serve(host: str = '127.0.0.1', port: int = 8765, views: list = None):
+    """
+    :param views: views to index before accepting requests (others load on first use)
+    """
+    for view in views or []:
+        get_view(view)
+    server = ThreadingHTTPServer((host, port), ReviewHandler)
+    print(f'Serving chart review on http://{host}:{port}')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local chart review service over postproc outputs.')
+    parser.add_argument('--view', nargs='*', default=[], help='views to preload, e.g. irae__highlights_donor_index')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.view)
@@ -0,0 +1,277 @@
+import argparse
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Tuple
+import pandas as pd
+from pydantic import BaseModel, create_model
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import filetool
+from kidney_transplant_llm.postproc.schema import (
+    DOCUMENT_REF,
+    PIPELINES,
+    SAMPLES)
+
+###############################################################################
+# Rule extractor for HLA and CMV/EBV serostatus
+#
+# These fields are usually written in regular forms, the ones the field
+# descriptions ask the LLM to look for: "0/6 mismatch", "6 antigen mismatch",
+# "CMV D+/R-", "donor EBV IgG negative". Compiled patterns fill the mention
+# objects directly, with the matched text as spans and a confidence:
+#   HIGH    explicit form, e.g. "CMV D+/R-", "2/6 mismatch"
+#   MEDIUM  looser form, e.g. "6/6 match", "EBV IgG negative" (taken as recipient)
+# Patterns run from most to least specific; text matched by one pattern is
+# masked for the next, so "donor CMV IgG positive" is not read again as a
+# recipient "CMV IgG positive". Different values for one field in a note are a
+# conflict and the field is left to the LLM.
+#
+# `annotate_note` asks the LLM only for the fields the rules did not fill at
+# THRESHOLD; `agreement_df` compares rules with past LLM output per label.
+###############################################################################
+HIGH = 0.95
+MEDIUM = 0.7
+THRESHOLD = 0.9
+
+MISMATCH = 'donor_hla_mismatch_count_mention'
+QUALITY = 'donor_hla_match_quality_mention'
+SEROSTATUS = {
+    ('donor', 'cmv'): 'donor_serostatus_cmv_mention',
+    ('donor', 'ebv'): 'donor_serostatus_ebv_mention',
+    ('recipient', 'cmv'): 'recipient_serostatus_cmv_mention',
+    ('recipient', 'ebv'): 'recipient_serostatus_ebv_mention',
+}
+RULE_FIELDS = [MISMATCH, QUALITY] + list(SEROSTATUS.values())
+
+NUMBER = r'(?P<n>[0-6]|zero|one|two|three|four|five|six)'
+WORDS = {'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6}
+SIGN = r'(?P<sign>\+|-|pos(?:itive)?|neg(?:ative)?|seropositive|seronegative)'
+SEROLOGY = r'(?:igg|ab|antibod(?:y|ies)|serology|serostatus|status)'
+
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile(pattern, re.IGNORECASE)
+
+# (pattern, confidence); `n` is the mismatch count, `m` the match count
+HLA_PATTERNS = [
+    (_compile(rf'\b{NUMBER}\s*(?:/|of|out of)\s*6\s*(?:hla\s*)?(?:antigen\s*)?mis-?match(?:es|ed)?\b'), HIGH),
+    (_compile(rf'\b{NUMBER}[\s-]*(?:hla\s*)?antigen[\s-]*mis-?match(?:es|ed)?\b'), HIGH),
+    (_compile(r'\b(?P<m>[0-6])\s*/\s*6\s*(?:hla\s*)?(?:antigen\s*)?match(?:ed)?\b'), MEDIUM),
+    (_compile(rf'\b{NUMBER}\s*hla\s*mis-?match(?:es|ed)?\b'), HIGH),
+    (_compile(rf'\b{NUMBER}\s*mis-?match(?:es|ed)?\b'), MEDIUM),
+]
+QUALITY_PATTERNS = [
+    (_compile(r'\b(?P<q>well|moderately|poorly)[\s-]+matched\b'), MEDIUM),
+]
+QUALITY_WORDS = {'well': study.DonorHlaMatchQuality.WELL,
+                 'moderately': study.DonorHlaMatchQuality.MODERATE,
+                 'poorly': study.DonorHlaMatchQuality.POOR}
+# (pattern, confidence); `who` is donor/recipient when the pattern does not say
+SERO_PATTERNS = [
+    (_compile(rf'\b(?P<virus>cmv|ebv)\s*(?:{SEROLOGY}\s*)?[:=]?\s*\(?\s*D\s*(?P<d>\+|-|pos|neg)\s*[/,]?\s*R\s*(?P<r>\+|-|pos|neg)'), HIGH),
+    (_compile(rf'\b(?P<who>donor|recipient)(?:\'s)?\s+(?P<virus>cmv|ebv)\s*(?:{SEROLOGY}\s*)?(?:is\s+|was\s+|:\s*)?{SIGN}(?!\w)'), HIGH),
+    (_compile(rf'\b(?P<virus>cmv|ebv)\s*(?P<who>D|R)\s*(?P<sign>\+|-)(?![\w/])'), HIGH),
+    (_compile(rf'\b(?P<virus>cmv|ebv)\s*{SEROLOGY}\s*(?:is\s+|was\s+|:\s*)?{SIGN}(?!\w)'), MEDIUM),
+]
+
+class Hit(NamedTuple):
+    field: str
+    value: str
+    confidence: float
+    span: str
+
+class RuleMention(NamedTuple):
+    mention: study.SpanAugmentedMention
+    confidence: float
+
+def _mask(text: str, match: re.Match) -> str:
+    return text[:match.start()] + ' ' * (match.end() - match.start()) + text[match.end():]
+
+def _sero(sign: str) -> str:
+    positive = sign.lower() in ('+', 'pos', 'positive', 'seropositive')
+    return study.Serostatus.SEROPOSITIVE if positive else study.Serostatus.SERONEGATIVE
+
+def _quality(count: int) -> str:
+    if count <= 1:
+        return study.DonorHlaMatchQuality.WELL
+    if count <= 4:
+        return study.DonorHlaMatchQuality.MODERATE
+    return study.DonorHlaMatchQuality.POOR
+
+def find_hits(text: str) -> List[Hit]:
+    """
+    :return: every rule match in the note, most specific patterns first
+    """
+    hits = list()
+    masked = text
+    for pattern, confidence in HLA_PATTERNS:
+        for match in pattern.finditer(masked):
+            groups = match.groupdict()
+            if groups.get('n') is not None:
+                n = groups['n'].lower()
+                count = WORDS[n] if n in WORDS else int(n)
+            else:
+                count = 6 - int(groups['m'])
+            span = text[match.start():match.end()]
+            hits.append(Hit(MISMATCH, study.DonorHlaMismatchCount(str(count)), confidence, span))
+            hits.append(Hit(QUALITY, _quality(count), confidence, span))
+            masked = _mask(masked, match)
+    for pattern, confidence in QUALITY_PATTERNS:
+        for match in pattern.finditer(masked):
+            span = text[match.start():match.end()]
+            hits.append(Hit(QUALITY, QUALITY_WORDS[match['q'].lower()], confidence, span))
+            masked = _mask(masked, match)
+    for pattern, confidence in SERO_PATTERNS:
+        for match in pattern.finditer(masked):
+            groups = match.groupdict()
+            virus = groups['virus'].lower()
+            span = text[match.start():match.end()]
+            if groups.get('d') is not None:
+                signs = [('donor', groups['d']), ('recipient', groups['r'])]
+            else:
+                who = (groups.get('who') or 'recipient').lower()
+                signs = [({'d': 'donor', 'r': 'recipient'}.get(who, who), groups['sign'])]
+            for who, sign in signs:
+                hits.append(Hit(SEROSTATUS[(who, virus)], _sero(sign), confidence, span))
+            masked = _mask(masked, match)
+    return hits
+
+def extract_rules(text: str) -> Dict[str, RuleMention]:
+    """
+    :return: mention field name -> (filled mention, confidence), conflicting fields left out
+    """
+    mentions = study.KidneyTransplantAnnotation.model_fields
+    by_field: Dict[str, List[Hit]] = dict()
+    for hit in find_hits(text):
+        by_field.setdefault(hit.field, list()).append(hit)
+
+    out = dict()
+    for field, hits in by_field.items():
+        if len({hit.value for hit in hits}) > 1:
+            continue
+        mention_cls = mentions[field].annotation
+        value_name = next(name for name in mention_cls.model_fields
+                          if name not in study.SpanAugmentedMention.model_fields)
+        mention = mention_cls(has_mention=True,
+                              spans=list(dict.fromkeys(hit.span for hit in hits)),
+                              **{value_name: hits[0].value})
+        out[field] = RuleMention(mention, max(hit.confidence for hit in hits))
+    return out
+
+###############################################################################
+# Fast path: skip the LLM for fields the rules fill with high confidence
+###############################################################################
+def remaining_model(model: type[BaseModel], skip: List[str]) -> type[BaseModel] | None:
+    """
+    :return: `model` without the `skip` fields, None if no field is left
+    """
+    fields = {name: (field.annotation, field) for name, field in model.model_fields.items() if name not in skip}
+    if not fields:
+        return None
+    return create_model(model.__name__, __doc__=model.__doc__, **fields)
+
+def annotate_note(text: str,
+                  model: type[BaseModel],
+                  extract: Callable[[str, type[BaseModel]], BaseModel],
+                  threshold: float = THRESHOLD) -> Tuple[BaseModel, List[str]]:
+    """
+    :param extract: LLM call `extract(text, model)`, e.g. wrapped by `usage.UsageRecorder.track`
+    :return: annotation, and the fields filled by rules (not asked to the LLM)
+    """
+    rules = {field: rule for field, rule in extract_rules(text).items()
+             if field in model.model_fields and rule.confidence >= threshold}
+    values = {field: rule.mention for field, rule in rules.items()}
+    reduced = remaining_model(model, list(rules))
+    if reduced is not None:
+        llm = extract(text, reduced)
+        values.update({name: getattr(llm, name) for name in reduced.model_fields})
+    return model(**values), list(rules)
+
+###############################################################################
+# Agreement with past LLM output
+###############################################################################
+def _display(field: str) -> str:
+    return study.kidney_transplant_mention_ls_metadata[study.KidneyTransplantMentionLabels(field)]['display']
+
+def rules_df(notes_df: pd.DataFrame, text_col: str = 'text') -> pd.DataFrame:
+    """
+    :param notes_df: documentreference_ref and note text
+    :return: long rows like the view: documentreference_ref, sublabel_name, sublabel_value, confidence, span
+    """
+    rows = list()
+    for note, text in zip(notes_df[DOCUMENT_REF], notes_df[text_col].fillna('')):
+        for field, rule in extract_rules(text).items():
+            value = next(getattr(rule.mention, name) for name in type(rule.mention).model_fields
+                         if name not in study.SpanAugmentedMention.model_fields)
+            rows.append((note, _display(field), str(value), rule.confidence, ' | '.join(rule.mention.spans)))
+    return pd.DataFrame(rows, columns=[DOCUMENT_REF, 'sublabel_name', 'sublabel_value', 'confidence', 'span'])
+
+def _value_keys(values: pd.Series) -> pd.Series:
+    """
+    Enum value or name, lowercase, as one key per member
+    """
+    names = dict()
+    for enum in (study.DonorHlaMismatchCount, study.DonorHlaMatchQuality, study.Serostatus):
+        names.update({member.value.lower(): member.name.lower() for member in enum})
+    lower = values.astype(str).str.strip().str.lower()
+    return lower.map(names).fillna(lower)
+
+def agreement_df(rule_df: pd.DataFrame, llm_df: pd.DataFrame, threshold: float = THRESHOLD) -> pd.DataFrame:
+    """
+    Per label and confidence tier, on notes with both a rule and an LLM value:
+    how often the rule value is one of the LLM values.
+
+    :param rule_df: see `rules_df`
+    :param llm_df: view rows of the same notes
+    :return: sublabel_name, tier, notes, agree, agreement, llm_missing (rule fired, LLM has no value)
+    """
+    keys = [DOCUMENT_REF, 'sublabel_name']
+    rule = rule_df.assign(key=_value_keys(rule_df['sublabel_value']),
+                          tier=(rule_df['confidence'] >= threshold).map({True: 'high', False: 'medium'}))
+    llm = llm_df[llm_df['sublabel_name'].isin(rule['sublabel_name'].unique())]
+    llm = llm.assign(key=_value_keys(llm['sublabel_value']))[keys + ['key']].drop_duplicates()
+
+    labelled = rule.merge(llm[keys].drop_duplicates(), on=keys, how='left', indicator=True)
+    rule['llm'] = (labelled['_merge'] == 'both').to_numpy()
+    rule['agree'] = rule.merge(llm, on=keys + ['key'], how='left', indicator=True)['_merge'].eq('both').to_numpy()
+
+    grouped = rule.groupby(['sublabel_name', 'tier'])
+    out = pd.DataFrame({'notes': grouped['llm'].sum(),
+                        'agree': grouped['agree'].sum(),
+                        'llm_missing': grouped['llm'].size() - grouped['llm'].sum()})
+    out['agreement'] = (out['agree'] / out['notes'].where(out['notes'] > 0)).round(4)
+    return out.reset_index()[['sublabel_name', 'tier', 'notes', 'agree', 'agreement', 'llm_missing']]
+
+def agreement_csv(notes_csv: Path | str,
+                  pipeline: str = 'donor',
+                  sample: str = None,
+                  origin: str = None,
+                  threshold: float = THRESHOLD) -> Path:
+    """
+    :param notes_csv: note text export with documentreference_ref and text
+    :return: Path to `{view}.rules.agreement.csv`, rule rows saved as `{view}.rules.csv`
+    """
+    view = filetool.resolve_view(pipeline, sample, origin)[3]
+    notes_df = pd.read_csv(notes_csv)
+    llm_df = pd.read_csv(filetool.path_highlights(f'{view}.csv'),
+                         usecols=[DOCUMENT_REF, 'sublabel_name', 'sublabel_value'])
+    llm_df = llm_df[llm_df[DOCUMENT_REF].isin(notes_df[DOCUMENT_REF])]
+    rule_df = rules_df(notes_df)
+    rule_df.to_csv(filetool.path_highlights(f'{view}.rules.csv'), index=False)
+
+    output_df = agreement_df(rule_df, llm_df, threshold)
+    output_csv = filetool.path_highlights(f'{view}.rules.agreement.csv')
+    output_df.to_csv(output_csv, index=False)
+    print(output_df.to_string(index=False))
+    return output_csv
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Rule extractor agreement with past LLM output.')
+    parser.add_argument('notes_csv', help='documentreference_ref,text export of the notes')
+    parser.add_argument('--pipeline', choices=list(PIPELINES), default='donor')
+    parser.add_argument('--sample', choices=list(SAMPLES), default=None)
+    parser.add_argument('--origin', default=None)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+    agreement_csv(args.notes_csv, args.pipeline, args.sample, args.origin, args.threshold)
+
+if __name__ == '__main__':
+    main()
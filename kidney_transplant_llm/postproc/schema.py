@@ -12,6 +12,29 @@ NLP_GPT_OSS_120B= 'irae__nlp_gpt_oss_120b'
 NLP_DONOR_GPT_OSS_120B = 'irae__nlp_donor_gpt_oss_120b'
 NLP_DONOR_GPT_4o = 'irae__nlp_donor_gpt4o'
 
+# synthetic origin: weighted vote of several origins, see `ensemble`
+NLP_ENSEMBLE = 'irae__nlp_ensemble'
+
+###############################################################################
+# PIPELINES: highlights table and its default sample / origin
+###############################################################################
+PIPELINES = {
+    'donor': ('irae__highlights_donor', SAMPLE_INDEX, NLP_DONOR_GPT_OSS_120B),
+    'longitudinal': ('irae__highlights_longitudinal', SAMPLE_POST, NLP_GPT_OSS_120B),
+}
+
+SAMPLES = {
+    'pre': SAMPLE_PRE,
+    'index': SAMPLE_INDEX,
+    'post': SAMPLE_POST,
+}
+
+# every origin written to each pipeline's highlights table
+PIPELINE_ORIGINS = {
+    'donor': [NLP_DONOR_GPT_OSS_120B, NLP_DONOR_GPT_4o],
+    'longitudinal': [NLP_GPT_OSS_120B],
+}
+
 ###############################################################################
 # COLUMNS
 ###############################################################################
@@ -28,6 +51,10 @@ SAMPLE_COLS = [SUBJECT_REF, ENCOUNTER_REF, DOCUMENT_REF,
 
 HIGHLIGHT_COLS = ['sublabel_name', 'sublabel_value', 'span']
 
+# sublabel_value text of boolean fields that counts as true
+TRUE_VALUES = ['true', '1', 'yes']
+FALSE_VALUES = ['false', '0', 'no']
+
 ###############################################################################
 # irae__highlights
 ###############################################################################
@@ -56,11 +83,15 @@ HIGHLIGHT_COLS = ['sublabel_name', 'sublabel_value', 'span']
 # doc_type_display    	doc_type
 # doc_type_system     	doc_type
 
-def name_view(highlights:str, sample:str) -> str:
+def name_view(highlights:str, sample:str, origin:str = None) -> str:
     """
-    :return: str view name like 'irae__highlights_donor_index'
+    :param origin: optional, only needed when several origins share one highlights table
+    :return: str view name like 'irae__highlights_donor_index' or 'irae__highlights_donor_index_donor_gpt4o'
     """
     sample_period = sample.replace('irae__sample_casedef_', '')
-    return highlights + '_' + sample_period
+    view = highlights + '_' + sample_period
+    if origin:
+        view += '_' + origin.replace('irae__nlp_', '')
+    return view
 
 
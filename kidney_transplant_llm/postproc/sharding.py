@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import json
+from pathlib import Path
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool, store, timeline
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    DOCUMENT_REF,
+    ENC_ORDINAL,
+    DOC_ORDINAL,
+    SAMPLE_COLS)
+
+###############################################################################
+# Sharded runs
+#
+# Shard i of N (0 <= i < N) processes only the subjects whose stable hash of
+# subject_ref falls in it and writes shard-tagged outputs next to the view:
+#   {view}.shard{i}of{N}.pivot.csv, {view}.shard{i}of{N}.pivot.tf.csv, ...
+# `merge_view` combines them into the files of a single-node run; subjects are
+# disjoint across shards, so pivot and TF merge by concatenation followed by
+# the same ordering a single-node run produces. Shard files are read as text
+# so every cell is written back exactly as the shard wrote it;
+# `compare_outputs` checks the merged files byte for byte against a
+# single-node run.
+###############################################################################
+MERGED_SUFFIXES = ['.excluded.csv', '.pivot.csv', '.pivot.tf.csv']
+Shard = Tuple[int, int]
+
+def parse_shard(text: str) -> Shard:
+    """
+    :param text: 'i/N', e.g. '0/4'
+    :return: (i, N)
+    """
+    i, n = (int(part) for part in text.split('/'))
+    if not 0 <= i < n:
+        raise ValueError(f'shard {text} must satisfy 0 <= i < N')
+    return i, n
+
+def shard_tag(shard: Shard) -> str:
+    return f'shard{shard[0]}of{shard[1]}'
+
+def shard_csv_name(csv_name: str, shard: Shard | None) -> str:
+    """
+    :return: 'view.csv' -> 'view.shard0of4.csv' (unchanged if shard is None)
+    """
+    if shard is None:
+        return csv_name
+    return csv_name.replace('.csv', f'.{shard_tag(shard)}.csv', 1)
+
+def shard_of(subjects: pd.Series, n: int) -> np.ndarray:
+    """
+    Stable across processes and machines: pandas hashes with a fixed key.
+    """
+    hashed = pd.util.hash_pandas_object(subjects.astype(str), index=False).to_numpy()
+    return (hashed % np.uint64(n)).astype('int64')
+
+def shard_mask(subjects: pd.Series, shard: Shard) -> np.ndarray:
+    return shard_of(subjects, shard[1]) == shard[0]
+
+###############################################################################
+# Merge and checksum
+###############################################################################
+def checksum(path: Path | str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _shard_paths(view: str, n: int, suffix: str) -> List[Path]:
+    return [filetool.path_highlights(f'{view}.{shard_tag((i, n))}{suffix}') for i in range(n)]
+
+def _read_text(path: Path) -> pd.DataFrame:
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+def _sort_key(col: pd.Series) -> pd.Series:
+    """
+    Ordinals sort as numbers, like the typed pivot index of a single-node run.
+    """
+    return pd.to_numeric(col) if col.name in (ENC_ORDINAL, DOC_ORDINAL) else col
+
+def merge_pivot_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Pivot rows are ordered by the pivot index columns, and the wide columns
+    by sublabel_name, exactly as `pivot_table.pivot_policies_df` orders them.
+
+    :param frames: pivot tables read as text (see `_read_text`) with disjoint notes
+    """
+    index_cols = [col for col in frames[0].columns if col in SAMPLE_COLS]
+    names = sorted({col for df in frames for col in df.columns if col not in index_cols})
+    merged = (pd.concat(frames, ignore_index=True)
+              .fillna('')
+              .sort_values(index_cols, kind='stable', ignore_index=True, key=_sort_key))
+    return merged[index_cols + names]
+
+def merge_pivot(view: str, n: int) -> Path:
+    merged = merge_pivot_frames([_read_text(p) for p in _shard_paths(view, n, '.pivot.csv')])
+    output_csv = filetool.path_highlights(f'{view}.pivot.csv')
+    merged.to_csv(output_csv, index=False)
+    timeline.build_index(output_csv)
+    store.save_df(pd.read_csv(output_csv), f'{view}.pivot')
+
+    shard_spans = [f'{view}.{shard_tag((i, n))}.spans' for i in range(n)]
+    if all(store.exists(artifact) for artifact in shard_spans):
+        spans_df = pd.concat([store.load_df(a, mmap=False) for a in shard_spans], ignore_index=True)
+        for col in [SUBJECT_REF, DOCUMENT_REF, 'sublabel_name']:
+            spans_df[col] = spans_df[col].astype(str)
+        spans_df = spans_df.sort_values([DOCUMENT_REF, 'start'], kind='stable', ignore_index=True)
+        store.save_df(spans_df, f'{view}.spans')
+    return output_csv
+
+def merge_tf(view: str, n: int) -> Path:
+    """
+    TF rows are grouped by column in pivot column order, then sorted by
+    subject, count (descending) and value, as `cumulative.count_tf` orders them.
+    """
+    merged = pd.concat([_read_text(p) for p in _shard_paths(view, n, '.pivot.tf.csv')],
+                       ignore_index=True)
+    pivot_cols = pd.read_csv(filetool.path_highlights(f'{view}.pivot.csv'), nrows=0).columns
+    column_order = merged['column'].map({col: i for i, col in enumerate(pivot_cols)})
+    merged = (merged.assign(_order=column_order, _count=merged['count'].astype('int64'))
+              .sort_values(['_order', SUBJECT_REF, '_count', 'value'], ascending=[True, True, False, True],
+                           kind='stable')
+              .drop(columns=['_order', '_count']))
+
+    output_csv = filetool.path_highlights(f'{view}.pivot.tf.csv')
+    merged.to_csv(output_csv, index=False)
+    return output_csv
+
+def merge_excluded(view: str, n: int) -> Path:
+    merged = pd.concat([_read_text(p) for p in _shard_paths(view, n, '.excluded.csv')],
+                       ignore_index=True)
+    output_csv = filetool.path_highlights(f'{view}.excluded.csv')
+    merged.sort_values(SUBJECT_REF, kind='stable').to_csv(output_csv, index=False)
+    return output_csv
+
+def merge_view(view: str, n: int) -> Path:
+    """
+    Merge the shard outputs of one view and write a manifest `{view}.merge.json`
+    with the sha256 of every merged file and of the shard files it came from.
+
+    :return: Path to the manifest
+    """
+    manifest = dict()
+    for suffix, merge in zip(MERGED_SUFFIXES, [merge_excluded, merge_pivot, merge_tf]):
+        shards = _shard_paths(view, n, suffix)
+        missing = [str(p) for p in shards if not p.exists()]
+        if missing:
+            raise FileNotFoundError(f'missing shard outputs: {missing}')
+        output = merge(view, n)
+        manifest[output.name] = {
+            'sha256': checksum(output),
+            'shards': {p.name: checksum(p) for p in shards},
+        }
+        print(f'{output.name} {manifest[output.name]["sha256"]}')
+
+    manifest_json = filetool.path_highlights(f'{view}.merge.json')
+    with open(manifest_json, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_json
+
+def verify_merge(view: str) -> bool:
+    """
+    :return: True if the merged files still match the checksums in the manifest
+    """
+    with open(filetool.path_highlights(f'{view}.merge.json')) as f:
+        manifest = json.load(f)
+    return all(checksum(filetool.path_highlights(name)) == entry['sha256']
+               for name, entry in manifest.items())
+
+def compare_outputs(view: str, reference_dir: Path | str) -> dict:
+    """
+    Equivalence with a single-node run: byte comparison of each merged file
+    with the file of the same name in `reference_dir`.
+
+    :param reference_dir: highlights folder of a single-node run of the same view
+    :return: dict merged file name -> True if identical
+    """
+    result = dict()
+    for suffix in MERGED_SUFFIXES:
+        name = f'{view}{suffix}'
+        reference = Path(reference_dir) / name
+        result[name] = reference.exists() and checksum(filetool.path_highlights(name)) == checksum(reference)
+    return result
+
+###############################################################################
+# CLI: merge shard outputs, then compute the downstream stages once
+###############################################################################
+def main(argv: List[str] = None):
+    from kidney_transplant_llm.postproc import dag
+
+    parser = argparse.ArgumentParser(description='Merge sharded post-processing outputs.')
+    parser.add_argument('--shards', type=int, required=True, help='number of shards N')
+    parser.add_argument('--pipeline', nargs='+', choices=list(dag.PIPELINES), default=list(dag.PIPELINES))
+    parser.add_argument('--origin', nargs='+', default=[None])
+    parser.add_argument('--sample', nargs='+', choices=list(dag.SAMPLES), default=[None])
+    parser.add_argument('--stage', nargs='*', default=['counts', 'consensus', 'dates'],
+                        help='stages to run on the merged outputs')
+    parser.add_argument('--compare', default=None,
+                        help='highlights folder of a single-node run: fail unless the merged files are identical')
+    args = parser.parse_args(argv)
+
+    jobs = [dag.make_job(pipeline, sample, origin)
+            for pipeline in args.pipeline
+            for sample in args.sample
+            for origin in args.origin]
+    for job in jobs:
+        merge_view(job.view, args.shards)
+        if args.compare:
+            different = [name for name, same in compare_outputs(job.view, args.compare).items() if not same]
+            if different:
+                raise SystemExit(f'merged outputs differ from the single-node run: {different}')
+        for stage in args.stage:
+            dag.run_stage(stage, job)
+
+if __name__ == '__main__':
+    main()
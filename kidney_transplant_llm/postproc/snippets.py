@@ -0,0 +1,156 @@
+import argparse
+from typing import Iterable, List, Mapping
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import spans, store
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    DOCUMENT_REF)
+
+###############################################################################
+# Evidence snippet dictionary
+#
+# Copy-forwarded notes repeat the same evidence text ("CMV D+/R-", "living
+# related donor") across many rows. Each distinct snippet is stored once in a
+# dictionary; rows keep an int32 `snippet_id`. The rows are sorted by
+# snippet_id, so "which notes cite this exact snippet" is a dictionary lookup
+# plus a binary search:
+#   index = SnippetIndex.encode(snippets_df)
+#   index.notes('CMV D+/R-')
+#
+# Snippets are evidence text: `SpanAugmentedMention.spans` (`mention_snippets`)
+# or the note text sliced by the highlights `span` positions (`span_snippets`).
+# The view only carries the positions, not the note text, so the pivot stage
+# does not build a snippet index; build it where the notes are read.
+###############################################################################
+SNIPPET_ID = 'snippet_id'
+TEXT_COL = 'text'
+FIELD_COL = 'field'
+
+def mention_snippets(annotations: Iterable[tuple]) -> pd.DataFrame:
+    """
+    :param annotations: (subject_ref, documentreference_ref, annotation) per note,
+                        annotation e.g. KidneyTransplantDonorGroupAnnotation
+    :return: one row per span text: subject_ref, documentreference_ref, field, text
+    """
+    rows = list()
+    for subject, note, annotation in annotations:
+        for name in type(annotation).model_fields:
+            mention = getattr(annotation, name)
+            if isinstance(mention, study.SpanAugmentedMention):
+                rows.extend((subject, note, name, span) for span in mention.spans)
+    return pd.DataFrame(rows, columns=[SUBJECT_REF, DOCUMENT_REF, FIELD_COL, TEXT_COL])
+
+def span_snippets(highlights_df: pd.DataFrame,
+                  notes: Mapping[str, str],
+                  note_col: str = DOCUMENT_REF,
+                  name_col: str = 'sublabel_name') -> pd.DataFrame:
+    """
+    :param highlights_df: highlights or view rows with a `span` column of "start:end" positions
+    :param notes: note text by documentreference_ref; rows of other notes are skipped
+    :return: one row per span: subject_ref, documentreference_ref, field, text
+    """
+    offsets = spans.parse_spans(highlights_df[spans.SPAN_COL])
+    rows = highlights_df.iloc[offsets['row'].to_numpy()]
+    texts = [notes[note][start:end] if note in notes else None
+             for note, start, end in zip(rows[note_col], offsets['start'], offsets['end'])]
+    out = pd.DataFrame({
+        SUBJECT_REF: rows[SUBJECT_REF].to_numpy(),
+        note_col: rows[note_col].to_numpy(),
+        FIELD_COL: rows[name_col].to_numpy(),
+        TEXT_COL: texts,
+    })
+    return out[out[TEXT_COL].notna()].reset_index(drop=True)
+
+class SnippetIndex:
+    """
+    Distinct snippet texts and the rows that cite them, sorted by snippet_id.
+    """
+    def __init__(self, snippets: pd.Index, refs: pd.DataFrame):
+        self.snippets = snippets
+        self.refs = refs
+        self._ids = refs[SNIPPET_ID].to_numpy()
+
+    @classmethod
+    def encode(cls, df: pd.DataFrame, text_col: str = TEXT_COL) -> 'SnippetIndex':
+        """
+        :param df: rows with a snippet text column, see `mention_snippets`
+        :param text_col: column of evidence text to encode
+        """
+        df = df[df[text_col].notna()]
+        codes, snippets = pd.factorize(df[text_col].astype(str))
+        refs = df.drop(columns=text_col).assign(**{SNIPPET_ID: codes.astype('int32')})
+        for col in refs.columns:
+            if col != SNIPPET_ID:
+                refs[col] = refs[col].astype('category')
+        refs = refs.sort_values(SNIPPET_ID, kind='stable').reset_index(drop=True)
+        return cls(pd.Index(snippets, dtype=object), refs)
+
+    def ids(self, texts: List[str]) -> np.ndarray:
+        """
+        :return: snippet_id of each text, -1 if never cited
+        """
+        return self.snippets.get_indexer(texts)
+
+    def text(self, ids) -> np.ndarray:
+        return self.snippets.to_numpy()[ids]
+
+    def rows(self, text: str) -> pd.DataFrame:
+        """
+        :return: rows citing exactly `text`
+        """
+        snippet_id = self.ids([text])[0]
+        if snippet_id < 0:
+            return self.refs.iloc[:0]
+        lo, hi = np.searchsorted(self._ids, [snippet_id, snippet_id + 1])
+        return self.refs.iloc[lo:hi]
+
+    def notes(self, text: str, note_col: str = DOCUMENT_REF) -> List[str]:
+        """
+        :return: notes citing exactly `text`
+        """
+        return list(self.rows(text)[note_col].drop_duplicates())
+
+    def counts(self, note_col: str = DOCUMENT_REF) -> pd.DataFrame:
+        """
+        :return: snippet text, rows and distinct notes citing it, most cited first
+        """
+        grouped = self.refs.groupby(SNIPPET_ID)
+        out = pd.DataFrame({'rows': grouped.size(), 'notes': grouped[note_col].nunique()})
+        out.insert(0, TEXT_COL, self.text(out.index.to_numpy()))
+        return out.sort_values(['notes', 'rows'], ascending=False, kind='stable').reset_index(drop=True)
+
+    def decode(self, text_col: str = TEXT_COL) -> pd.DataFrame:
+        """
+        :return: refs with the snippet text column restored
+        """
+        return self.refs.assign(**{text_col: self.text(self._ids)}).drop(columns=SNIPPET_ID)
+
+    def save(self, artifact: str):
+        """
+        Store as '{artifact}.snippets' (text, once each) and '{artifact}.snippet_refs'.
+        """
+        store.save_df(pd.DataFrame({TEXT_COL: self.snippets}), f'{artifact}.snippets')
+        store.save_df(self.refs, f'{artifact}.snippet_refs')
+
+    @classmethod
+    def load(cls, artifact: str) -> 'SnippetIndex':
+        snippets = store.load_df(f'{artifact}.snippets')[TEXT_COL]
+        refs = store.load_df(f'{artifact}.snippet_refs')
+        return cls(pd.Index(snippets.astype(object), dtype=object), refs)
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Notes citing an exact evidence snippet.')
+    parser.add_argument('artifact', help="name used in SnippetIndex.save, e.g. 'irae__highlights_donor_index'")
+    parser.add_argument('text', nargs='?', default=None, help='snippet text, default list the most cited')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args(argv)
+    index = SnippetIndex.load(args.artifact)
+    if args.text is None:
+        print(index.counts().head(args.top).to_string(index=False))
+    else:
+        print(index.rows(args.text).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import store
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    DOCUMENT_REF)
+
+###############################################################################
+# Span offsets
+#
+# The highlights `span` column holds character positions as text, one or more
+# "start:end" pairs (any non-digit separators are accepted, e.g. "12-40" or
+# "[[12, 40], [51, 60]]"). They are parsed once into int32 arrays so evidence
+# can be compared per note without parsing strings again.
+###############################################################################
+SPAN_COL = 'span'
+SPAN_PAIR = r'(\d+)\D+?(\d+)'
+
+def parse_spans(span: pd.Series) -> pd.DataFrame:
+    """
+    :param span: text column of character positions
+    :return: DataFrame(row, start, end) int32, `row` is the position in `span`
+    """
+    pairs = span.reset_index(drop=True).astype('string').str.extractall(SPAN_PAIR)
+    return pd.DataFrame({
+        'row': pairs.index.get_level_values(0).to_numpy(dtype='int32'),
+        'start': pairs[0].to_numpy(dtype='int32'),
+        'end': pairs[1].to_numpy(dtype='int32'),
+    })
+
+def spans_df(highlights_df: pd.DataFrame,
+             note_col: str = DOCUMENT_REF,
+             name_col: str = 'sublabel_name') -> pd.DataFrame:
+    """
+    :param highlights_df: highlights or view rows with a `span` column
+    :return: one row per span: subject, note, sublabel_name (categorical), start, end (int32)
+    """
+    offsets = parse_spans(highlights_df[SPAN_COL])
+    rows = highlights_df.iloc[offsets['row'].to_numpy()]
+    out = pd.DataFrame({
+        SUBJECT_REF: rows[SUBJECT_REF].astype('category').array,
+        note_col: rows[note_col].astype('category').array,
+        name_col: rows[name_col].astype('category').array,
+        'start': offsets['start'].to_numpy(dtype='int32'),
+        'end': offsets['end'].to_numpy(dtype='int32'),
+    })
+    return out.sort_values([note_col, 'start'], kind='stable').reset_index(drop=True)
+
+def save_spans(highlights_df: pd.DataFrame, artifact: str):
+    """
+    Store spans next to the pivot output, e.g. artifact '{view}.spans'.
+    """
+    return store.save_df(spans_df(highlights_df), artifact)
+
+def load_spans(artifact: str) -> pd.DataFrame:
+    return store.load_df(artifact)
+
+###############################################################################
+# Queries per note
+###############################################################################
+def _pairs(spans: pd.DataFrame, name_a: str, name_b: str,
+           note_col: str, name_col: str) -> pd.DataFrame:
+    """
+    :return: every (a, b) span pair that shares a note
+    """
+    cols = [note_col, 'start', 'end']
+    a = spans.loc[spans[name_col] == name_a, cols]
+    b = spans.loc[spans[name_col] == name_b, cols]
+    return a.merge(b, on=note_col, suffixes=('_a', '_b'))
+
+def overlaps(spans: pd.DataFrame, name_a: str, name_b: str,
+             note_col: str = DOCUMENT_REF, name_col: str = 'sublabel_name') -> pd.Series:
+    """
+    Does the evidence of `name_a` overlap the evidence of `name_b`?
+    Example: overlaps(spans, 'Donor Type', 'Donor Relationship')
+
+    :return: bool Series indexed by note, only notes that have both sublabels
+    """
+    pairs = _pairs(spans, name_a, name_b, note_col, name_col)
+    hit = (pairs['start_a'] < pairs['end_b']) & (pairs['start_b'] < pairs['end_a'])
+    return hit.groupby(pairs[note_col], observed=True).any()
+
+def contains(spans: pd.DataFrame, outer: str, inner: str,
+             note_col: str = DOCUMENT_REF, name_col: str = 'sublabel_name') -> pd.Series:
+    """
+    Is some evidence of `inner` fully inside evidence of `outer`?
+
+    :return: bool Series indexed by note, only notes that have both sublabels
+    """
+    pairs = _pairs(spans, outer, inner, note_col, name_col)
+    hit = (pairs['start_a'] <= pairs['start_b']) & (pairs['end_b'] <= pairs['end_a'])
+    return hit.groupby(pairs[note_col], observed=True).any()
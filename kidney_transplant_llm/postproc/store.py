@@ -0,0 +1,107 @@
+import json
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool
+
+###############################################################################
+# Artifact store
+#
+# Each stage output is saved as a directory of NumPy column files under
+# `filetool.path_store()`. Text columns are dictionary encoded (int32 codes +
+# vocab in meta.json) so every column is a fixed width array that can be
+# memory-mapped: several processes opening the same pivot table share the
+# OS page cache instead of each parsing its own pandas copy of the CSV.
+# Bool columns with missing values (object True/False/NaN, as the ANY policy
+# writes them) are int8 codes -1/0/1 and load as pandas nullable 'boolean'.
+###############################################################################
+META_JSON = 'meta.json'
+
+def _column_file(col_idx: int) -> str:
+    return f'col_{col_idx:04d}.npy'
+
+def _is_nullable_bool(series: pd.Series) -> bool:
+    if isinstance(series.dtype, pd.BooleanDtype):
+        return True
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'boolean'
+
+def save_df(df: pd.DataFrame, artifact: str) -> Path:
+    """
+    :param df: stage output, for example the pivot table
+    :param artifact: name like 'irae__highlights_donor_index.pivot'
+    :return: Path to the artifact directory
+    """
+    artifact_dir = filetool.path_store(artifact)
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+    columns = list()
+
+    for col_idx, col in enumerate(df.columns):
+        series = df[col]
+        entry = {'name': col, 'file': _column_file(col_idx)}
+
+        if _is_nullable_bool(series):
+            values = np.where(series.isna(), -1, series.fillna(False).astype(bool)).astype('int8')
+            entry['kind'] = 'boolean'
+        elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            if series.isna().any():
+                values = series.to_numpy(dtype='float64', na_value=np.nan)
+            else:
+                values = series.to_numpy()
+            entry['kind'] = 'numeric'
+        else:
+            codes, vocab = pd.factorize(series, use_na_sentinel=True)
+            values = codes.astype('int32')
+            entry['kind'] = 'category'
+            entry['vocab'] = [str(v) for v in vocab]
+
+        np.save(artifact_dir / entry['file'], values, allow_pickle=False)
+        columns.append(entry)
+
+    with open(artifact_dir / META_JSON, 'w') as f:
+        json.dump({'rows': len(df), 'columns': columns}, f, indent=2)
+    return artifact_dir
+
+def load_df(artifact: str, columns: Optional[List[str]] = None, mmap=True) -> pd.DataFrame:
+    """
+    Open a stored artifact. With `mmap` the numeric columns and category codes
+    are read-only views on the files, not copies.
+
+    :param artifact: name used in `save_df`
+    :param columns: only load these columns (default all)
+    :param mmap: memory-map column files instead of reading them
+    :return: DataFrame, text columns as pandas Categorical, bool columns with
+             missing values as pandas 'boolean'
+    """
+    artifact_dir = filetool.path_store(artifact)
+    with open(artifact_dir / META_JSON) as f:
+        meta = json.load(f)
+
+    mmap_mode = 'r' if mmap else None
+    data = dict()
+    for entry in meta['columns']:
+        if columns is not None and entry['name'] not in columns:
+            continue
+        values = np.load(artifact_dir / entry['file'], mmap_mode=mmap_mode, allow_pickle=False)
+        if entry['kind'] == 'category':
+            dtype = pd.CategoricalDtype(entry['vocab'])
+            values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        elif entry['kind'] == 'boolean':
+            values = pd.arrays.BooleanArray(values == 1, values < 0)
+        data[entry['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+def exists(artifact: str) -> bool:
+    return (filetool.path_store(artifact) / META_JSON).exists()
+
+def csv_to_store(input_csv: Path | str, artifact: Optional[str] = None) -> Path:
+    """
+    Convert an existing CSV output (e.g. `{view}.pivot.csv`) into the store.
+
+    :param input_csv: CSV path
+    :param artifact: default is the CSV file name without '.csv'
+    :return: Path to the artifact directory
+    """
+    if artifact is None:
+        artifact = Path(input_csv).name.removesuffix('.csv')
+    return save_df(pd.read_csv(input_csv), artifact)
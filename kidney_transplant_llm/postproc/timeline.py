@@ -0,0 +1,97 @@
+import csv
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+import pandas as pd
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    SORT_BY_DATE)
+
+###############################################################################
+# Patient timeline index
+#
+# The Athena view is ordered by subject_ref, sort_by_date, ordinals and the
+# pivot keeps that order, so each patient is one contiguous block of lines in
+# `{view}.pivot.csv`. The index stores the row and byte range of every block
+# in `{view}.pivot.idx.csv` so one timeline is a seek + small read.
+###############################################################################
+def path_index(pivot_csv: Path | str) -> Path:
+    return Path(str(pivot_csv).replace('.csv', '.idx.csv'))
+
+def build_index(pivot_csv: Path | str) -> Path:
+    """
+    Stream the CSV once, recording the offset (`f.tell()`) where each subject's block starts.
+
+    :param pivot_csv: subject-sorted CSV, e.g. `{view}.pivot.csv`
+    :return: Path to the index CSV
+    """
+    runs = list()
+    seen = set()
+    with open(pivot_csv, 'rb') as f:
+        header = next(csv.reader([f.readline().decode()]))
+        col = header.index(SUBJECT_REF)
+        row, last = 0, None
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if line.count(b'"') % 2:
+                raise ValueError(f'{pivot_csv} has multi-line records, cannot index by line')
+            subject = next(csv.reader([line.decode()]))[col]
+            if subject != last:
+                if subject in seen:
+                    raise ValueError(f'{pivot_csv} is not sorted by {SUBJECT_REF}')
+                seen.add(subject)
+                runs.append((subject, row, offset))
+                last = subject
+            row += 1
+        end = f.tell()
+
+    index_df = pd.DataFrame(runs, columns=[SUBJECT_REF, 'row_start', 'byte_start'])
+    index_df.insert(2, 'row_stop', index_df['row_start'].shift(-1, fill_value=row).astype('int64'))
+    index_df['byte_stop'] = index_df['byte_start'].shift(-1, fill_value=end).astype('int64')
+    index_csv = path_index(pivot_csv)
+    index_df.to_csv(index_csv, index=False)
+    _load_index.cache_clear()
+    _header.cache_clear()
+    return index_csv
+
+def load_index(pivot_csv: Path | str) -> dict:
+    """
+    :return: dict subject_ref -> (byte_start, byte_stop), cached per file until the index is rebuilt
+    """
+    return _load_index(str(pivot_csv), path_index(pivot_csv).stat().st_mtime_ns)
+
+@lru_cache(maxsize=16)
+def _load_index(pivot_csv: str, mtime_ns: int) -> dict:
+    index_df = pd.read_csv(path_index(pivot_csv), dtype={SUBJECT_REF: str})
+    return dict(zip(index_df[SUBJECT_REF],
+                    zip(index_df['byte_start'].tolist(), index_df['byte_stop'].tolist())))
+
+@lru_cache(maxsize=16)
+def _header(pivot_csv: str, mtime_ns: int) -> bytes:
+    with open(pivot_csv, 'rb') as f:
+        return f.readline()
+
+def lookup(pivot_csv: Path | str, subject_ref: str) -> pd.DataFrame:
+    """
+    All pivot rows of one patient, in date order, read from just that byte range.
+
+    :param pivot_csv: indexed CSV, e.g. `{view}.pivot.csv`
+    :param subject_ref: Patient/UUID
+    :return: DataFrame, empty if the patient is not in the index
+    """
+    byte_range = load_index(pivot_csv).get(subject_ref)
+    header = _header(str(pivot_csv), Path(pivot_csv).stat().st_mtime_ns)
+    if byte_range is None:
+        return pd.read_csv(BytesIO(header))
+
+    byte_start, byte_stop = byte_range
+    with open(pivot_csv, 'rb') as f:
+        f.seek(byte_start)
+        chunk = f.read(byte_stop - byte_start)
+    timeline = pd.read_csv(BytesIO(header + chunk))
+    if SORT_BY_DATE in timeline.columns:
+        timeline = timeline.sort_values(SORT_BY_DATE, kind='stable', ignore_index=True)
+    return timeline
@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+from kidney_transplant_llm.postproc import filetool
+
+###############################################################################
+# Token, latency and cost accounting per annotation group
+#
+# Every extraction call for a *GroupAnnotation model (or the full
+# KidneyTransplantAnnotation) is recorded with its origin, prompt/completion
+# tokens, latency and retries. The per-run summary answers which group drives
+# LLM spend or latency; schema size is reported next to it because the JSON
+# schema of the response model is sent with every call.
+###############################################################################
+PERCENTILES = [50, 90, 99]
+LATENCY_BINS = np.geomspace(0.1, 600, 25)
+TOKEN_BINS = np.geomspace(16, 262_144, 25)
+
+# origin -> (USD per 1M prompt tokens, USD per 1M completion tokens)
+PRICES: Dict[str, Tuple[float, float]] = dict()
+
+@dataclass
+class Call:
+    group: str
+    origin: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    retries: int = 0
+    ok: bool = False
+
+CALL_DTYPES = {'group': str, 'origin': str, 'prompt_tokens': 'int64', 'completion_tokens': 'int64',
+               'latency': 'float64', 'retries': 'int64', 'ok': bool}
+
+def schema_size(model: type[BaseModel]) -> dict:
+    """
+    :return: number of mention fields and size in bytes of the JSON schema sent with each call
+    """
+    return {'fields': len(model.model_fields),
+            'schema_bytes': len(json.dumps(model.model_json_schema()))}
+
+def _usage_tokens(response) -> Tuple[int, int]:
+    """
+    :return: (prompt, completion) tokens from an OpenAI style `response.usage`, (0, 0) if absent
+    """
+    usage = getattr(response, 'usage', None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get('usage')
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get('prompt_tokens', 0) or 0, usage.get('completion_tokens', 0) or 0
+    return getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0
+
+class UsageRecorder:
+    """
+    Thread safe collector of Call records for one run.
+    """
+    def __init__(self, run: str):
+        self.run = run
+        self.calls: List[Call] = list()
+        self.schemas: Dict[str, dict] = dict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, model: type[BaseModel], origin: str):
+        """
+        Time one extraction call; the caller sets tokens and retries on the yielded Call.
+
+            with recorder.measure(study.KidneyTransplantDonorGroupAnnotation, origin) as call:
+                response = client.parse(...)
+                call.prompt_tokens, call.completion_tokens = ...
+        """
+        group = model.__name__
+        if group not in self.schemas:
+            self.schemas[group] = schema_size(model)
+        call = Call(group, origin)
+        start = time.perf_counter()
+        try:
+            yield call
+            call.ok = True
+        finally:
+            call.latency = time.perf_counter() - start
+            with self._lock:
+                self.calls.append(call)
+
+    def track(self, extract: Callable, model: type[BaseModel], origin: str,
+              *args, max_retries: int = 2, **kwargs):
+        """
+        Call `extract(*args, **kwargs)`, retrying on exceptions, and record tokens
+        from the response's `usage`. Latency covers all attempts.
+
+        :return: response of the last attempt
+        """
+        with self.measure(model, origin) as call:
+            for attempt in range(max_retries + 1):
+                try:
+                    response = extract(*args, **kwargs)
+                    break
+                except Exception:
+                    if attempt == max_retries:
+                        raise
+                    call.retries += 1
+            call.prompt_tokens, call.completion_tokens = _usage_tokens(response)
+        return response
+
+    ###########################################################################
+    # Aggregation
+    ###########################################################################
+    def calls_df(self) -> pd.DataFrame:
+        with self._lock:
+            rows = [asdict(call) for call in self.calls]
+        # typed even with no calls, so the aggregations work on an empty run
+        return pd.DataFrame(rows, columns=list(Call.__annotations__)).astype(CALL_DTYPES)
+
+    def summary_df(self, prices: Dict[str, Tuple[float, float]] = None) -> pd.DataFrame:
+        """
+        :param prices: origin -> (USD per 1M prompt tokens, USD per 1M completion tokens), default PRICES
+        :return: one row per (group, origin) with calls, errors, retries, token totals,
+                 latency percentiles, schema size and cost (NaN for unpriced origins)
+        """
+        prices = PRICES if prices is None else prices
+        df = self.calls_df()
+        grouped = df.groupby(['group', 'origin'])
+        summary = grouped.agg(calls=('ok', 'size'),
+                              errors=('ok', lambda ok: int((~ok).sum())),
+                              retries=('retries', 'sum'),
+                              prompt_tokens=('prompt_tokens', 'sum'),
+                              completion_tokens=('completion_tokens', 'sum'),
+                              latency_total=('latency', 'sum'))
+        for p in PERCENTILES:
+            summary[f'latency_p{p}'] = grouped['latency'].quantile(p / 100)
+        summary = summary.reset_index().astype({'errors': 'int64'})
+
+        for key in ['fields', 'schema_bytes']:
+            summary[key] = summary['group'].map(lambda group: self.schemas.get(group, {}).get(key)).astype('Int64')
+
+        price = summary['origin'].map(lambda origin: prices.get(origin, (np.nan, np.nan)))
+        prompt_price = price.map(lambda p: p[0]).astype('float64')
+        completion_price = price.map(lambda p: p[1]).astype('float64')
+        summary['cost_usd'] = (summary['prompt_tokens'] * prompt_price +
+                               summary['completion_tokens'] * completion_price) / 1e6
+        summary['tokens_per_field'] = (summary['prompt_tokens'] + summary['completion_tokens']) / (
+            summary['calls'] * summary['fields'])
+        return summary.sort_values('latency_total', ascending=False, ignore_index=True)
+
+    def histogram_df(self) -> pd.DataFrame:
+        """
+        :return: long table (group, origin, metric, bin_lo, bin_hi, count) of latency
+                 and total token histograms on log-spaced bins
+        """
+        df = self.calls_df().assign(tokens=lambda d: d['prompt_tokens'] + d['completion_tokens'])
+        rows = list()
+        for (group, origin), group_df in df.groupby(['group', 'origin']):
+            for metric, bins in [('latency', LATENCY_BINS), ('tokens', TOKEN_BINS)]:
+                counts, edges = np.histogram(group_df[metric].clip(bins[0], bins[-1]), bins=bins)
+                rows.append(pd.DataFrame({'group': group, 'origin': origin, 'metric': metric,
+                                          'bin_lo': edges[:-1], 'bin_hi': edges[1:], 'count': counts}))
+        return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+
+    def save(self, prices: Dict[str, Tuple[float, float]] = None) -> Path:
+        """
+        Write `{run}.usage.csv` (summary), `{run}.usage.calls.csv` and `{run}.usage.hist.csv`.
+
+        :return: Path to the summary CSV
+        """
+        output_csv = filetool.path_usage(f'{self.run}.usage.csv')
+        output_csv.parent.mkdir(parents=True, exist_ok=True)
+        summary = self.summary_df(prices)
+        summary.to_csv(output_csv, index=False)
+        self.calls_df().to_csv(output_csv.with_suffix('.calls.csv'), index=False)
+        self.histogram_df().to_csv(output_csv.with_suffix('.hist.csv'), index=False)
+        print(summary[['group', 'origin', 'calls', 'prompt_tokens', 'completion_tokens',
+                       'latency_p50', 'latency_p99', 'cost_usd']].to_string(index=False))
+        return output_csv
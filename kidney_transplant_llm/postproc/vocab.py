@@ -0,0 +1,172 @@
+from enum import StrEnum
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import filetool
+from kidney_transplant_llm.postproc.schema import TRUE_VALUES, FALSE_VALUES
+
+###############################################################################
+# Vocabulary of sublabel_value for each sublabel_name
+#
+# sublabel_name is the Label Studio `display` string of a mention label, e.g.
+# 'Donor Type' -> donor_type_mention -> DonorTypeMention.donor_type: DonorType.
+# Allowed values are the enum values and names (plus TRUE_VALUES/FALSE_VALUES
+# for boolean fields). Labels with free text fields (dates) have no vocabulary.
+# Values are checked case-insensitively, and integral numbers without the
+# '.0' pandas adds ('1.0' -> '1'), the way exclusion and pivot_table read them.
+###############################################################################
+BOOL_VOCAB = TRUE_VALUES + FALSE_VALUES
+
+def annotation_models() -> List[type]:
+    """
+    :return: every *Annotation model in pydantic_study_variables
+    """
+    return [obj for name, obj in vars(study).items()
+            if name.endswith('Annotation') and isinstance(obj, type) and issubclass(obj, BaseModel)]
+
+def mention_classes() -> Dict[str, type]:
+    """
+    :return: dict mention field name (e.g. 'donor_type_mention') -> Mention class
+    """
+    mentions = dict()
+    for model in annotation_models():
+        for field_name, field in model.model_fields.items():
+            mentions[field_name] = field.annotation
+    return mentions
+
+def value_fields(mention: type) -> dict:
+    """
+    :return: fields of a Mention beyond has_mention/spans
+    """
+    return {name: field for name, field in mention.model_fields.items()
+            if name not in study.SpanAugmentedMention.model_fields}
+
+def label_vocab(mention: type) -> Optional[List[str]]:
+    """
+    :return: allowed sublabel_value strings, None if the mention has free text
+    """
+    vocab = list()
+    for field in value_fields(mention).values():
+        annotation = field.annotation
+        if isinstance(annotation, type) and issubclass(annotation, StrEnum):
+            vocab += [member.value for member in annotation] + [member.name for member in annotation]
+        elif annotation is bool or annotation == (bool | None):
+            vocab += BOOL_VOCAB
+        else:
+            return None
+    return list(dict.fromkeys(vocab))
+
+def display_vocab() -> Dict[str, List[str]]:
+    """
+    :return: dict sublabel_name (display string) -> allowed values, validated labels only
+    """
+    mentions = mention_classes()
+    vocab = dict()
+    for label, meta in study.kidney_transplant_mention_ls_metadata.items():
+        allowed = label_vocab(mentions[label.value])
+        if allowed is not None:
+            vocab[meta['display']] = allowed
+    return vocab
+
+def model_displays(*models: type) -> List[str]:
+    """
+    Columns a stage needs for the given annotation models, e.g.
+    model_displays(study.KidneyTransplantDonorGroupAnnotation) -> ['Transplant Date', 'Donor Type', ...]
+
+    :return: sublabel_name display strings of the models' mention fields, in field order
+    """
+    displays = list()
+    for model in models:
+        for field_name in model.model_fields:
+            label = study.KidneyTransplantMentionLabels(field_name)
+            displays.append(study.kidney_transplant_mention_ls_metadata[label]['display'])
+    return list(dict.fromkeys(displays))
+
+###############################################################################
+# Validation
+###############################################################################
+def oov_mask(df: pd.DataFrame,
+             name_col: str = 'sublabel_name',
+             value_col: str = 'sublabel_value',
+             vocab: Optional[Dict[str, List[str]]] = None) -> np.ndarray:
+    """
+    :return: bool array, True where sublabel_value is not in the vocabulary of its sublabel_name
+    """
+    name_codes, names = pd.factorize(df[name_col])
+    return _oov_codes(name_codes, names, df[value_col], vocab or display_vocab())
+
+def normalize_values(values: pd.Index) -> pd.Index:
+    """
+    :return: stripped lowercase text, integral numbers without a decimal part
+    """
+    text = pd.Series(values.astype(str)).str.strip().str.lower()
+    return pd.Index(text.str.replace(r'^(-?\d+)\.0*$', r'\1', regex=True), dtype=object)
+
+def _oov_codes(name_codes: np.ndarray, names: pd.Index, value: pd.Series, vocab: dict) -> np.ndarray:
+    """
+    Values are converted to categorical codes once; only the distinct
+    (sublabel_name, sublabel_value) pairs are checked against the vocabulary.
+    """
+    vocab = {name: set(normalize_values(pd.Index(allowed))) for name, allowed in vocab.items()}
+    value_codes, values = pd.factorize(value)
+    values = normalize_values(values)
+
+    # one code per distinct (name, value) pair; value code 0 is NA
+    stride = len(values) + 1
+    pair_codes, pairs = pd.factorize(name_codes.astype('int64') * stride + value_codes + 1)
+
+    def is_oov(pair: int) -> bool:
+        name, value_code = names[pair // stride], pair % stride - 1
+        return name in vocab and value_code >= 0 and values[value_code] not in vocab[name]
+
+    pair_oov = np.array([is_oov(pair) for pair in pairs], dtype=bool)
+    return pair_oov[pair_codes] & (name_codes >= 0)
+
+def validate_df(df: pd.DataFrame,
+                origin: Optional[str] = None,
+                origin_col: str = 'origin',
+                name_col: str = 'sublabel_name',
+                value_col: str = 'sublabel_value') -> pd.DataFrame:
+    """
+    Out-of-vocabulary rates per origin and per variable, counted on codes.
+
+    :param df: highlights or view rows
+    :param origin: origin of all rows, when `df` has no `origin_col`
+    :return: DataFrame(origin, sublabel_name, rows, oov, oov_rate)
+    """
+    vocab = display_vocab()
+    name_codes, names = pd.factorize(df[name_col])
+    oov = _oov_codes(name_codes, names, df[value_col], vocab)
+
+    if origin_col in df.columns:
+        origin_codes, origins = pd.factorize(df[origin_col])
+    else:
+        origin_codes, origins = np.zeros(len(df), dtype='int64'), pd.Index([origin])
+
+    checked = np.isin(name_codes, np.flatnonzero(names.isin(list(vocab))))
+    key = origin_codes[checked].astype('int64') * len(names) + name_codes[checked]
+    rows = np.bincount(key, minlength=len(origins) * len(names))
+    n_oov = np.bincount(key, weights=oov[checked], minlength=len(origins) * len(names))
+
+    present = np.flatnonzero(rows)
+    report = pd.DataFrame({
+        origin_col: origins.take(present // len(names)),
+        name_col: names.take(present % len(names)),
+        'rows': rows[present],
+        'oov': n_oov[present].astype('int64'),
+    })
+    report['oov_rate'] = report['oov'] / report['rows']
+    return report.sort_values([origin_col, name_col], ignore_index=True)
+
+def validate_csv(highlights_csv: str = 'irae__highlights_donor_index.csv', origin: Optional[str] = None):
+    input_csv = filetool.path_highlights(highlights_csv)
+    output_csv = filetool.path_highlights(highlights_csv.replace('.csv', '.vocab.csv'))
+    header = pd.read_csv(input_csv, nrows=0).columns
+    usecols = [col for col in ['origin', 'sublabel_name', 'sublabel_value'] if col in header]
+    report = validate_df(pd.read_csv(input_csv, usecols=usecols), origin)
+    for _, row in report[report['oov'] > 0].iterrows():
+        print(f"{row['origin']} {row['sublabel_name']}: {row['oov']} of {row['rows']} values out of vocabulary")
+    report.to_csv(output_csv, index=False)
+    return output_csv
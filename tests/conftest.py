@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from kidney_transplant_llm.postproc import filetool
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    ENCOUNTER_REF,
+    DOCUMENT_REF,
+    SORT_BY_DATE,
+    ENC_ORDINAL,
+    DOC_ORDINAL)
+
+VIEW = 'irae__highlights_donor_index'
+
+@pytest.fixture
+def phi_dir(tmp_path, monkeypatch):
+    """
+    LLM_PHI_DIR in a temporary directory, with the highlights and store folders.
+    """
+    monkeypatch.setenv('LLM_PHI_DIR', str(tmp_path))
+    filetool.path_phi_dir.cache_clear()
+    filetool.path_highlights('').mkdir(parents=True)
+    filetool.path_store('').mkdir(parents=True)
+    yield tmp_path
+    filetool.path_phi_dir.cache_clear()
+
+def make_view_df(n_subjects: int = 40, seed: int = 0) -> pd.DataFrame:
+    """
+    Synthetic donor view: a few notes per subject over several days, with
+    text, boolean and numeric sublabels, labels missing from some notes and
+    repeated (conflicting) highlights.
+    """
+    rng = np.random.default_rng(seed)
+    rows = list()
+    for subject in range(n_subjects):
+        for doc in range(rng.integers(1, 5)):
+            date = f'2020-01-{rng.integers(1, 10):02d}'
+            note = (f'Patient/{subject:04d}', f'Encounter/{subject}-{doc}', f'DocumentReference/{subject}-{doc}',
+                    date, doc, 1)
+            for _ in range(rng.integers(1, 3)):
+                start = int(rng.integers(0, 500))
+                span = f'{start}:{start + int(rng.integers(3, 30))}'
+                labels = [('Donor Type', rng.choice(['LIVING', 'DECEASED'])),
+                          ('Hla Mismatch Count', str(rng.integers(0, 3))),
+                          ('Multiple Transplant History', rng.choice(['False', 'False', 'False', 'True'])),
+                          ('Transplant Date', f'2019-0{rng.integers(1, 4)}-01')]
+                # notes do not mention every label
+                rows.extend(note + label + (span,) for label in labels if rng.random() < 0.7)
+    columns = [SUBJECT_REF, ENCOUNTER_REF, DOCUMENT_REF, SORT_BY_DATE, ENC_ORDINAL, DOC_ORDINAL,
+               'sublabel_name', 'sublabel_value', 'span']
+    return pd.DataFrame(rows, columns=columns).sort_values([SUBJECT_REF, SORT_BY_DATE], kind='stable')
+
+@pytest.fixture
+def view_df() -> pd.DataFrame:
+    return make_view_df()
+
+@pytest.fixture
+def view_csv(phi_dir, view_df):
+    path = filetool.path_highlights(f'{VIEW}.csv')
+    view_df.to_csv(path, index=False)
+    return path
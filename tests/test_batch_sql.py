@@ -0,0 +1,24 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import batch_sql, filetool
+from kidney_transplant_llm.postproc.schema import NLP_DONOR_GPT_OSS_120B, SAMPLE_COLS
+
+def test_sqlite_runs_view_on_highlights_schema(view_csv, view_df, tmp_path):
+    sample_df = view_df[SAMPLE_COLS].drop_duplicates()
+    # irae__highlights has its own subject_ref, see schema.py
+    highlights_df = pd.DataFrame({'note_ref': view_df['documentreference_ref'],
+                                  'subject_ref': view_df['subject_ref'],
+                                  'origin': NLP_DONOR_GPT_OSS_120B,
+                                  'sublabel_name': view_df['sublabel_name'],
+                                  'sublabel_value': view_df['sublabel_value'],
+                                  'span': view_df['span']})
+    tables = {'irae__highlights_donor': tmp_path / 'highlights.csv',
+              'irae__sample_casedef_index': tmp_path / 'sample.csv'}
+    highlights_df.to_csv(tables['irae__highlights_donor'], index=False)
+    sample_df.to_csv(tables['irae__sample_casedef_index'], index=False)
+
+    executor = batch_sql.SQLiteExecutor(tables, db_path=tmp_path / 'local.sqlite', workers=2)
+    written = batch_sql.run_batch(executor, batch_sql.view_jobs(['donor'], ['index'])[:1], poll_seconds=0.01)
+    output_df = pd.read_csv(written[0])
+    expected = view_df.drop_duplicates().sort_values(SAMPLE_COLS[:1] + ['sort_by_date'], kind='stable')
+    assert len(output_df) == len(expected)
+    assert list(output_df['subject_ref']) == list(expected['subject_ref'])
@@ -0,0 +1,45 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import casedef
+from kidney_transplant_llm.postproc.schema import (
+    SUBJECT_REF,
+    ENCOUNTER_REF,
+    DOCUMENT_REF,
+    ENC_ORDINAL,
+    DOC_ORDINAL)
+
+ENCOUNTERS = pd.DataFrame({SUBJECT_REF: ['P/1', 'P/1'],
+                           ENCOUNTER_REF: ['E/1', 'E/2'],
+                           casedef.ENC_START: ['2020-01-10', '2020-01-20']})
+INDEX = pd.DataFrame({SUBJECT_REF: ['P/1'], casedef.INDEX_DATE: ['2020-01-15']})
+
+def documents(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=[SUBJECT_REF, ENCOUNTER_REF, DOCUMENT_REF, 'doc_author_day', 'doc_date'])
+
+def test_orphans_attach_to_latest_encounter():
+    docs = documents([['P/1', 'E/1', 'D/1', '2020-01-10', None],
+                      ['P/1', None, 'D/2', '2020-01-12', None],
+                      ['P/1', None, 'D/3', None, '2020-01-21']])
+    notes = casedef.attach_encounters(docs, ENCOUNTERS).set_index(DOCUMENT_REF)
+    assert notes[ENCOUNTER_REF].to_dict() == {'D/1': 'E/1', 'D/2': 'E/1', 'D/3': 'E/2'}
+
+def test_undated_orphan_is_kept_and_reported(capsys):
+    docs = documents([['P/1', 'E/1', 'D/1', '2020-01-10', None],
+                      ['P/1', None, 'D/2', None, None]])
+    notes = casedef.attach_encounters(docs, ENCOUNTERS)
+    assert sorted(notes[DOCUMENT_REF]) == ['D/1', 'D/2']
+    assert notes.loc[notes[DOCUMENT_REF] == 'D/2', ENCOUNTER_REF].isna().all()
+
+    tables = casedef.build_casedef_df(ENCOUNTERS, docs, INDEX)
+    assert tables['index'][DOCUMENT_REF].tolist() == ['D/1']
+    assert '1 notes without any date' in capsys.readouterr().out
+
+def test_null_encounters_share_one_ordinal():
+    # both orphans predate every encounter, so neither gets an encounter_ref
+    docs = documents([['P/1', None, 'D/1', '2020-01-08', None],
+                      ['P/1', None, 'D/2', '2020-01-09', None],
+                      ['P/1', 'E/1', 'D/3', '2020-01-10', None],
+                      ['P/1', 'E/1', 'D/4', '2020-01-11', None],
+                      ['P/1', 'E/2', 'D/5', '2020-01-20', None]])
+    table = casedef.build_casedef_df(ENCOUNTERS, docs, INDEX)['index'].set_index(DOCUMENT_REF)
+    assert table[ENC_ORDINAL].to_dict() == {'D/1': 3, 'D/2': 3, 'D/3': 1, 'D/4': 1, 'D/5': 2}
+    assert table[DOC_ORDINAL].to_dict() == {'D/1': 1, 'D/2': 2, 'D/3': 1, 'D/4': 2, 'D/5': 1}
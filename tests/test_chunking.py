@@ -0,0 +1,46 @@
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import chunking
+
+def test_optional_bool_ors():
+    mentions = [study.DeceasedMention(deceased=value) for value in (True, False, False)]
+    assert chunking.merge_mentions(study.DeceasedMention, mentions).deceased is True
+    mentions = [study.DeceasedMention(deceased=value) for value in (None, False, None)]
+    assert chunking.merge_mentions(study.DeceasedMention, mentions).deceased is False
+    mentions = [study.DeceasedMention(deceased=None) for _ in range(2)]
+    assert chunking.merge_mentions(study.DeceasedMention, mentions).deceased is None
+
+def test_enum_precedence():
+    present = study.GraftRejectionPresent
+    mentions = [study.GraftRejectionMention(graft_rejection=value)
+                for value in (present.CONFIRMED, present.SUSPECTED, present.SUSPECTED, present.NONE_OF_THE_ABOVE)]
+    merged = chunking.merge_mentions(study.GraftRejectionMention, mentions)
+    assert merged.graft_rejection == present.CONFIRMED
+    mentions.append(study.GraftRejectionMention(graft_rejection=present.BIOPSY_PROVEN))
+    assert chunking.merge_mentions(study.GraftRejectionMention, mentions).graft_rejection == present.BIOPSY_PROVEN
+    mentions = [study.GraftRejectionMention() for _ in range(2)]
+    assert chunking.merge_mentions(study.GraftRejectionMention, mentions).graft_rejection == present.NONE_OF_THE_ABOVE
+
+def test_enum_without_precedence_is_majority():
+    donor = study.DonorType
+    mentions = [study.DonorTypeMention(donor_type=value)
+                for value in (donor.NOT_MENTIONED, donor.DECEASED, donor.LIVING, donor.LIVING)]
+    assert chunking.merge_mentions(study.DonorTypeMention, mentions).donor_type == donor.LIVING
+
+def test_merge_chunks_offsets():
+    text = 'Intro.\n\nBiopsy proven rejection on day 3. ' * 3
+    chunks = list(chunking.chunk_note(text, max_chars=60, overlap=10))
+    assert chunks[0][0] == 0 and ''.join(c for _, c in chunks).count('Biopsy') >= 3
+
+    def extract(chunk_text, model):
+        mention = study.GraftRejectionMention(has_mention='Biopsy' in chunk_text,
+                                              spans=['Biopsy proven rejection'] if 'Biopsy' in chunk_text else [],
+                                              graft_rejection=study.GraftRejectionPresent.BIOPSY_PROVEN)
+        fields = {name: field.annotation() for name, field in model.model_fields.items()}
+        return model(**(fields | {'graft_rejection_mention': mention}))
+
+    merged, offsets = chunking.annotate_note(text, study.KidneyTransplantLongitudinalAnnotation, extract,
+                                             max_chars=60, overlap=10)
+    assert merged.graft_rejection_mention.graft_rejection == study.GraftRejectionPresent.BIOPSY_PROVEN
+    for span in offsets['graft_rejection_mention']:
+        start, end = map(int, span.split(':'))
+        assert text[start:end] == 'Biopsy proven rejection'
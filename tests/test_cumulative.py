@@ -0,0 +1,25 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import cumulative, dag, filetool
+from conftest import VIEW
+
+KEYS = ['subject_ref', 'column', 'value']
+
+def _sorted(tf_df: pd.DataFrame) -> pd.DataFrame:
+    return tf_df[KEYS + ['count']].sort_values(KEYS).reset_index(drop=True)
+
+def test_asof_at_last_date_equals_count_tf(view_csv):
+    dag.run([dag.make_job('donor')], ['pivot'])
+    pivot_csv = filetool.path_highlights(f'{VIEW}.pivot.csv')
+    changes = cumulative.count_tf_asof(pivot_csv)
+    pd.testing.assert_frame_equal(_sorted(cumulative.asof_tf(changes, changes['date'].max())),
+                                  _sorted(cumulative.count_tf(pivot_csv)))
+
+def test_asof_equals_count_tf_of_earlier_notes(view_csv, tmp_path):
+    dag.run([dag.make_job('donor')], ['pivot'])
+    pivot_df = cumulative.read_pivot(filetool.path_highlights(f'{VIEW}.pivot.csv'))
+    changes = cumulative.count_tf_asof(filetool.path_highlights(f'{VIEW}.pivot.csv'))
+    date = '2020-01-05'
+    earlier_csv = tmp_path / 'earlier.csv'
+    pivot_df[pivot_df['sort_by_date'] <= date].to_csv(earlier_csv, index=False)
+    pd.testing.assert_frame_equal(_sorted(cumulative.asof_tf(changes, date)),
+                                  _sorted(cumulative.count_tf(earlier_csv)))
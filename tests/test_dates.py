@@ -0,0 +1,30 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import dates
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF
+
+def test_cluster_span_is_capped():
+    days = ['2019-03-01', '2019-03-03', '2019-03-05', '2019-03-07', '2019-03-09', '2019-05-01']
+    tf_dates = pd.DataFrame({SUBJECT_REF: 'Patient/1', 'count': [1, 1, 1, 3, 1, 1],
+                             'value': pd.to_datetime(days)})
+    clusters = dates.date_clusters(tf_dates, tolerance_days=3)
+    assert clusters['cluster'].tolist() == [1, 1, 2, 2, 3, 4]
+    span = clusters.groupby('cluster')['value'].agg(lambda v: (v.max() - v.min()).days)
+    assert span.max() <= 3
+    assert clusters['cluster_date'].dt.strftime('%Y-%m-%d').tolist()[2:4] == ['2019-03-07'] * 2
+
+def test_clusters_restart_per_subject():
+    tf_dates = pd.DataFrame({SUBJECT_REF: ['Patient/1', 'Patient/2'], 'count': [1, 1],
+                             'value': pd.to_datetime(['2019-03-01', '2019-03-02'])})
+    assert dates.date_clusters(tf_dates)['cluster'].tolist() == [1, 2]
+
+def test_consensus_keeps_rejected_subjects():
+    tf_df = pd.DataFrame({SUBJECT_REF: ['P/1', 'P/1', 'P/1', 'P/2'],
+                          'count': [3, 1, 2, 4],
+                          'column': 'Transplant Date',
+                          'value': ['2019-03-05', '3/6/2019', 'garbage', 'garbage']})
+    consensus = dates.consensus_dates(tf_df).set_index(SUBJECT_REF)
+    assert list(consensus.index) == ['P/1', 'P/2']
+    assert consensus.loc['P/1', ['date', 'count', 'total', 'clusters', 'rejected']].tolist() == \
+        ['2019-03-05', 4, 4, 1, 2]
+    assert pd.isna(consensus.loc['P/2', 'date'])
+    assert consensus.loc['P/2', ['count', 'total', 'clusters', 'rejected']].tolist() == [0, 0, 0, 4]
@@ -0,0 +1,52 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import ensemble
+from kidney_transplant_llm.postproc.schema import DOCUMENT_REF, NLP_ENSEMBLE
+
+def view(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=[ensemble.ORIGIN_COL, DOCUMENT_REF, ensemble.NAME_COL,
+                                       ensemble.VALUE_COL, ensemble.SPAN_COL])
+
+def winners(out: pd.DataFrame) -> dict:
+    return out.groupby([DOCUMENT_REF, ensemble.NAME_COL])[ensemble.VALUE_COL].agg(set).to_dict()
+
+def test_majority_wins():
+    df = view([['gpt', 'D/1', 'DSA', 'True', '1:5'],
+               ['llama', 'D/1', 'DSA', 'True', '2:6'],
+               ['qwen', 'D/1', 'DSA', 'False', '1:5']])
+    out = ensemble.vote_df(df)
+    assert winners(out) == {('D/1', 'DSA'): {'True'}}
+    assert set(out[ensemble.ORIGIN_COL]) == {NLP_ENSEMBLE}
+    assert out['votes'].tolist() == [2, 2]
+    assert out['span_support'].tolist() == [2, 2]
+
+def test_tie_goes_to_span_support_then_value():
+    df = view([['gpt', 'D/1', 'DSA', 'True', '1:5'],
+               ['gpt', 'D/1', 'DSA', 'True', '9:12'],
+               ['llama', 'D/1', 'DSA', 'False', '1:5'],
+               ['gpt', 'D/2', 'DSA', 'True', '1:5'],
+               ['llama', 'D/2', 'DSA', 'False', '1:5']])
+    out = ensemble.vote_df(df)
+    # D/1: one vote each, True has two spans; D/2: full tie, first value in sort order
+    assert winners(out) == {('D/1', 'DSA'): {'True'}, ('D/2', 'DSA'): {'False'}}
+
+def test_weights_break_ties():
+    df = view([['gpt', 'D/1', 'DSA', 'True', '1:5'],
+               ['llama', 'D/1', 'DSA', 'False', '1:5']])
+    assert winners(ensemble.vote_df(df, {'gpt': 2.0})) == {('D/1', 'DSA'): {'True'}}
+
+def test_missing_models():
+    # llama abstains on D/2, qwen is weighted but absent from every note
+    df = view([['gpt', 'D/1', 'DSA', 'True', '1:5'],
+               ['llama', 'D/1', 'DSA', 'True', '1:5'],
+               ['gpt', 'D/2', 'DSA', 'False', '3:4']])
+    out = ensemble.vote_df(df, {'qwen': 5.0})
+    assert winners(out) == {('D/1', 'DSA'): {'True'}, ('D/2', 'DSA'): {'False'}}
+    assert out.set_index(DOCUMENT_REF)['votes'].to_dict() == {'D/1': 2, 'D/2': 1}
+    assert len(out) == 2
+
+def test_without_span_column():
+    df = view([['gpt', 'D/1', 'DSA', 'True', None],
+               ['llama', 'D/1', 'DSA', 'False', None]]).drop(columns=ensemble.SPAN_COL)
+    out = ensemble.vote_df(df)
+    assert winners(out) == {('D/1', 'DSA'): {'False'}}
+    assert out['span_support'].tolist() == [1]
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import evaluate
+from kidney_transplant_llm.postproc.schema import DOCUMENT_REF
+
+def highlights(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=[DOCUMENT_REF, evaluate.NAME_COL, evaluate.VALUE_COL])
+
+GOLD = highlights([['D/1', 'Donor Type', 'living'],
+                   ['D/2', 'Transplant Date', '2019-03-05']])
+PRED = highlights([['D/1', 'Donor Type', 'Living'],
+                   ['D/2', 'Transplant Date', '2019-03-06'],
+                   ['D/3', 'Donor Type', 'deceased']])
+
+def test_false_positives_on_notes_without_gold():
+    out = evaluate.evaluate_df(GOLD, PRED, n_boot=10).set_index(evaluate.NAME_COL)
+    assert out.loc['Donor Type', ['notes', 'tp', 'fp', 'fn']].tolist() == [3, 1, 1, 0]
+    assert out.loc['Transplant Date', ['tp', 'fp', 'fn']].tolist() == [0, 1, 1]
+    assert out.loc['Donor Type', 'precision'] == 0.5
+
+def test_bootstrap_is_deterministic():
+    rng = np.random.default_rng(0)
+    tp, fp, fn = rng.integers(0, 3, size=(3, 4, 50)).astype('float64')
+    first = evaluate.bootstrap(tp, fp, fn, n_boot=250, seed=7)
+    assert first.shape == (250, 3, 4)
+    np.testing.assert_array_equal(first, evaluate.bootstrap(tp, fp, fn, n_boot=250, seed=7))
+    np.testing.assert_array_equal(first, evaluate.bootstrap(tp, fp, fn, n_boot=250, seed=7, n_jobs=2))
+    assert not np.array_equal(first, evaluate.bootstrap(tp, fp, fn, n_boot=250, seed=8), equal_nan=True)
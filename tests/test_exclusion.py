@@ -0,0 +1,23 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import dag, exclusion, filetool
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF
+from conftest import VIEW, make_view_df
+
+def test_donor_exclusions_apply_to_longitudinal(view_df, view_csv):
+    donor = set(exclusion.excluded_df(view_df)[SUBJECT_REF])
+    assert donor
+
+    job = dag.make_job('longitudinal')
+    longitudinal_df = make_view_df(seed=1)
+    longitudinal_df = longitudinal_df.assign(sublabel_name=longitudinal_df['sublabel_name'].map(
+        {'Donor Type': 'Rx Compliance', 'Hla Mismatch Count': 'DSA', 'Transplant Date': 'Graft Rejection'}))
+    longitudinal_df = longitudinal_df.dropna(subset=['sublabel_name'])
+    longitudinal_df.to_csv(filetool.path_highlights(f'{job.view}.csv'), index=False)
+    dag.run([job, dag.make_job('donor')], ['pivot'])
+
+    for view in (job.view, VIEW):
+        audit_csv = filetool.path_highlights(f'{view}.excluded.csv')
+        assert exclusion.read_excluded(audit_csv) == donor
+    pivot_df = pd.read_csv(filetool.path_highlights(f'{job.view}.pivot.csv'))
+    assert not set(pivot_df[SUBJECT_REF]) & donor
+    assert len(pivot_df)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import features
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF
+
+ARTIFACT = 'irae__highlights_donor_index.pivot.tf.features'
+
+def tf(subjects, values) -> pd.DataFrame:
+    return pd.DataFrame({SUBJECT_REF: subjects, 'column': 'DSA', 'value': values,
+                         'count': range(1, len(subjects) + 1)})
+
+def dense(loaded: dict) -> np.ndarray:
+    matrix = np.zeros(loaded['shape'], dtype='int64')
+    for row in range(loaded['shape'][0]):
+        span = slice(loaded['indptr'][row], loaded['indptr'][row + 1])
+        matrix[row, loaded['indices'][span]] = loaded['data'][span]
+    return matrix
+
+def test_append_matches_save(phi_dir):
+    first = tf(['P/1', 'P/2', 'P/2'], ['True', 'True', 'False'])
+    second = tf(['P/3', 'P/3'], ['False', 'None'])
+    features.save_features(first, ARTIFACT)
+    features.append_features(second, ARTIFACT)
+    appended = features.load_features(ARTIFACT, mmap=False)
+    assert appended['rows'] == ['P/1', 'P/2', 'P/3']
+    assert appended['cols'] == ['DSA=True', 'DSA=False', 'DSA=None']
+    assert dense(appended).tolist() == [[1, 0, 0], [2, 3, 0], [0, 1, 2]]
+
+def test_append_recovers_from_interrupted_append(phi_dir):
+    artifact_dir = features.save_features(tf(['P/1'], ['True']), ARTIFACT)
+    # a crash after the binary and text appends, before meta.json was rewritten
+    for name in [features.INDPTR, features.INDICES, features.DATA]:
+        with open(artifact_dir / name, 'ab') as f:
+            f.write(b'\x07' * 12)
+    features._write_lines(artifact_dir / features.ROWS_TXT, ['P/9'], 'a')
+    features._write_lines(artifact_dir / features.COLS_TXT, ['DSA=junk'], 'a')
+
+    features.append_features(tf(['P/2'], ['False']), ARTIFACT)
+    loaded = features.load_features(ARTIFACT, mmap=False)
+    assert loaded['rows'] == ['P/1', 'P/2']
+    assert loaded['cols'] == ['DSA=True', 'DSA=False']
+    assert loaded['indptr'].tolist() == [0, 1, 2]
+    assert dense(loaded).tolist() == [[1, 0], [0, 1]]
+    assert (artifact_dir / features.DATA).stat().st_size == 4 * 2
+
+def test_empty_tf(phi_dir):
+    empty = tf([], [])
+    features.save_features(empty, ARTIFACT)
+    features.append_features(empty, ARTIFACT)
+    loaded = features.load_features(ARTIFACT)
+    assert loaded['shape'] == (0, 0)
+    assert loaded['indptr'].tolist() == [0]
@@ -0,0 +1,24 @@
+import os
+from pathlib import Path
+import pytest
+from kidney_transplant_llm.postproc import importtime
+
+ROOT = Path(__file__).resolve().parents[1]
+
+@pytest.fixture(autouse=True)
+def repo_on_path(monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')])))
+
+@pytest.mark.parametrize('module', list(importtime.BUDGET_MS))
+def test_import_within_budget(module):
+    report = importtime.measure(module)
+    assert report['ms'] <= importtime.BUDGET_MS[module], f"{module} imports in {report['ms']:.1f} ms"
+
+@pytest.mark.parametrize('module', list(importtime.BUDGET_MS))
+def test_no_heavy_imports(module):
+    report = importtime.measure(module)
+    heavy = sorted({name for name in report['imported'] if name.split('.')[0] in importtime.HEAVY})
+    assert not heavy, f'{module} imports {heavy}'
+
+def test_check_passes():
+    assert importtime.check() == []
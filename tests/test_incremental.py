@@ -0,0 +1,67 @@
+import shutil
+import pandas as pd
+from kidney_transplant_llm.postproc import dag, exclusion, filetool, incremental, store
+from conftest import VIEW, make_view_df
+
+def _full_run(view_df: pd.DataFrame):
+    view_df.to_csv(filetool.path_highlights(f'{VIEW}.csv'), index=False)
+    dag.run([dag.make_job('donor')], ['tf'])
+
+def test_refresh_equals_full_rebuild(phi_dir, view_df, tmp_path):
+    _full_run(view_df)
+    reference = tmp_path / 'full'
+    shutil.copytree(filetool.path_highlights(''), reference)
+    reference_store = tmp_path / 'spans'
+    shutil.copytree(filetool.path_store(f'{VIEW}.spans'), reference_store)
+    for path in filetool.path_highlights('').iterdir():
+        path.unlink()
+
+    _full_run(view_df[view_df['sort_by_date'] <= '2020-01-03'])
+    for until in ['2020-01-06', '2020-01-09']:
+        view_df[view_df['sort_by_date'] <= until].to_csv(filetool.path_highlights(f'{VIEW}.csv'), index=False)
+        incremental.refresh('donor')
+    tf_csv = filetool.path_highlights(f'{VIEW}.pivot.tf.csv')
+    for suffix in ['.excluded.csv', '.pivot.csv', '.pivot.idx.csv', '.pivot.profile.json', '.pivot.tf.csv']:
+        name = f'{VIEW}{suffix}'
+        assert filetool.path_highlights(name).read_bytes() == (reference / name).read_bytes(), name
+    for path in filetool.path_store(f'{VIEW}.spans').iterdir():
+        assert path.read_bytes() == (reference_store / path.name).read_bytes(), path.name
+
+    # nothing new: the counts stay the same
+    incremental.refresh('donor')
+    assert tf_csv.read_bytes() == (reference / tf_csv.name).read_bytes()
+
+def test_refresh_with_only_excluded_subjects(phi_dir, view_df):
+    _full_run(view_df[view_df['sort_by_date'] <= '2020-01-05'])
+    tf_before = filetool.path_highlights(f'{VIEW}.pivot.tf.csv').read_bytes()
+    excluded = pd.read_csv(filetool.path_highlights(f'{VIEW}.excluded.csv'))['subject_ref']
+    later = view_df[(view_df['sort_by_date'] > '2020-01-05') & view_df['subject_ref'].isin(excluded)]
+    pd.concat([view_df[view_df['sort_by_date'] <= '2020-01-05'], later]).to_csv(
+        filetool.path_highlights(f'{VIEW}.csv'), index=False)
+
+    incremental.refresh('donor')
+    assert filetool.path_highlights(f'{VIEW}.pivot.tf.csv').read_bytes() == tf_before
+    mark = incremental.read_watermark(VIEW, dag.make_job('donor').origin)
+    assert mark['sort_by_date'] == later['sort_by_date'].max()
+
+def test_refresh_applies_donor_exclusions(phi_dir, view_df):
+    donor_df = view_df[view_df['sublabel_name'] != exclusion.EXCLUDE_LABEL]
+    donor_df.to_csv(filetool.path_highlights(f'{VIEW}.csv'), index=False)
+    job = dag.make_job('longitudinal')
+    longitudinal_df = make_view_df(seed=1)
+    longitudinal_df = longitudinal_df.assign(sublabel_name=longitudinal_df['sublabel_name'].map(
+        {'Donor Type': 'Rx Compliance', 'Hla Mismatch Count': 'DSA'})).dropna(subset=['sublabel_name'])
+    longitudinal_df.to_csv(filetool.path_highlights(f'{job.view}.csv'), index=False)
+    dag.run([job], ['tf'])
+    assert not exclusion.read_excluded(filetool.path_highlights(f'{job.view}.excluded.csv'))
+
+    # a new donor export flags subjects; the longitudinal view has no new notes
+    view_df.to_csv(filetool.path_highlights(f'{VIEW}.csv'), index=False)
+    incremental.refresh('longitudinal')
+    excluded = exclusion.excluded_df(view_df)['subject_ref']
+    assert len(excluded)
+    for suffix in ['.pivot.csv', '.pivot.tf.csv']:
+        df = pd.read_csv(filetool.path_highlights(f'{job.view}{suffix}'))
+        assert len(df) and not df['subject_ref'].isin(excluded).any()
+    assert set(store.load_df(f'{job.view}.pivot')['subject_ref']) == set(
+        pd.read_csv(filetool.path_highlights(f'{job.view}.pivot.csv'))['subject_ref'])
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import filetool, ledger
+
+NOTES = [f'DocumentReference/{i}' for i in range(50)]
+
+def test_resume_from_index(phi_dir):
+    with ledger.Ledger('run', batch=7) as run:
+        assert run.pending(NOTES, 'gpt', 'donor') == NOTES
+        for note in NOTES[:20]:
+            run.record(note, 'gpt', 'donor')
+    with ledger.Ledger('run') as run:
+        assert run.pending(NOTES, 'gpt', 'donor') == NOTES[20:]
+        assert run.pending(NOTES, 'gpt', 'longitudinal') == NOTES
+        for note in NOTES[20:30]:
+            run.record(note, 'gpt', 'donor')
+    with ledger.Ledger('run') as run:
+        assert run.pending(NOTES, 'gpt', 'donor') == NOTES[30:]
+
+def test_lookup_compares_full_digest(phi_dir):
+    with ledger.Ledger('run') as run:
+        probe = ledger._digest_keys(pd.Series(NOTES[:1]), 'gpt', 'donor')[0]
+        # same leading 8 bytes (the old truncated hash), different digest
+        near = probe[:8] + bytes(b ^ 0xff for b in probe[8:])
+        run.finished = np.array(sorted([near]), dtype='S32')
+        assert not run.is_finished(NOTES[:1], 'gpt', 'donor')[0]
+        run.finished = np.array(sorted([near, probe]), dtype='S32')
+        assert run.is_finished(NOTES[:1], 'gpt', 'donor')[0]
+
+def test_old_hash_index_is_rebuilt(phi_dir):
+    with ledger.Ledger('run') as run:
+        run.record(NOTES[0], 'gpt', 'donor')
+    index_path = filetool.path_run('run.ledger.idx.npz')
+    size = filetool.path_run('run.ledger.jsonl').stat().st_size
+    np.savez(index_path, hashes=np.zeros(1, dtype='uint64'), offset=np.int64(size))
+    with ledger.Ledger('run') as run:
+        assert run.pending(NOTES[:2], 'gpt', 'donor') == NOTES[1:2]
@@ -0,0 +1,28 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import pivot_table
+from kidney_transplant_llm.postproc.schema import SAMPLE_COLS
+
+def test_empty_input_returns_empty_frame(view_df):
+    wide = pivot_table.pivot_highlights_df(view_df.iloc[:0], aggfunc=pivot_table.MAJORITY,
+                                           policies=pivot_table.SUBLABEL_POLICIES)
+    assert wide.empty
+    assert list(wide.columns) == SAMPLE_COLS
+    assert wide.attrs['conflicts'] == {}
+
+def test_policies_match_pivot_table(view_df):
+    fast = pivot_table.pivot_highlights_df(view_df, aggfunc=pivot_table.FIRST)
+    slow = view_df.pivot_table(index=SAMPLE_COLS, columns='sublabel_name', values='sublabel_value',
+                               aggfunc='first').reset_index()
+    slow.columns.name = None
+    pd.testing.assert_frame_equal(fast[slow.columns].astype(str), slow.astype(str))
+
+def test_any_is_boolean_only(view_df):
+    note = view_df.iloc[:1]
+    deceased = pd.concat([note.assign(sublabel_name='Deceased', sublabel_value='2021-05-01'),
+                          note.assign(sublabel_name='Multiple Transplant History', sublabel_value='False'),
+                          note.assign(sublabel_name='Multiple Transplant History', sublabel_value='True')])
+    wide = pivot_table.pivot_highlights_df(deceased, aggfunc=pivot_table.MAJORITY,
+                                           policies={'Deceased': pivot_table.ANY,
+                                                     'Multiple Transplant History': pivot_table.ANY})
+    assert wide.loc[0, 'Deceased'] == '2021-05-01'
+    assert wide.loc[0, 'Multiple Transplant History'] == True
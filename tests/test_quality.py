@@ -0,0 +1,30 @@
+import pytest
+from kidney_transplant_llm.postproc import dag, exclusion, filetool, pivot_table, quality
+from kidney_transplant_llm.postproc.schema import SORT_BY_DATE, SUBJECT_REF
+from conftest import VIEW
+
+def test_make_gates():
+    gates = quality.make_gates([f'{SORT_BY_DATE}=0.5'], min_subjects=7)
+    assert dict(gates.max_null_rate)[SORT_BY_DATE] == 0.5
+    assert dict(gates.max_null_rate)[SUBJECT_REF] == quality.MAX_NULL_RATE[SUBJECT_REF]
+    assert (gates.min_rows, gates.min_subjects) == (quality.MIN_ROWS, 7)
+    with pytest.raises(ValueError):
+        quality.make_gates([SORT_BY_DATE])
+
+def test_profile_covers_full_view(view_df, view_csv):
+    shard = (0, 4)
+    profiler = quality.Profiler(VIEW)
+    exclusion.read_csv_excluding(view_csv, exclude={view_df[SUBJECT_REF].iloc[0]}, shard=shard,
+                                 names=['Donor Type'], profiler=profiler)
+    assert profiler.rows == len(view_df)
+    assert len(profiler.subject_rows) == view_df[SUBJECT_REF].nunique()
+
+def test_gates_fail_and_pass(view_df, phi_dir):
+    view_df.loc[view_df.index[:3], SORT_BY_DATE] = None
+    view_df.to_csv(filetool.path_highlights(f'{VIEW}.csv'), index=False)
+    with pytest.raises(quality.DataQualityError):
+        pivot_table.pivot_highlights_csv(f'{VIEW}.csv')
+    with pytest.raises(RuntimeError):
+        dag.main(['--pipeline', 'donor', '--stage', 'pivot', '--max-null-rate', f'{SORT_BY_DATE}=0.5', '--min-subjects', '1000'])
+    dag.main(['--pipeline', 'donor', '--stage', 'pivot', '--max-null-rate', f'{SORT_BY_DATE}=0.5'])
+    assert filetool.path_highlights(f'{VIEW}.pivot.csv').exists()
@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pandas as pd
+import pytest
+from kidney_transplant_llm.postproc import dag, filetool, review_server, timeline
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF
+from conftest import VIEW
+
+@pytest.fixture
+def server(phi_dir):
+    review_server._views.clear()
+    review_server.patient_timeline.cache_clear()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), review_server.ReviewHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    review_server._views.clear()
+
+def get(url: str):
+    try:
+        with urlopen(url) as response:
+            return response.status, json.load(response)
+    except HTTPError as e:
+        return e.code, json.load(e)
+
+def test_status_codes(server, view_csv):
+    dag.run([dag.make_job('donor')], ['tf'])
+    subject = pd.read_csv(filetool.path_highlights(f'{VIEW}.pivot.csv'))[SUBJECT_REF].iloc[-1]
+    status, body = get(f'{server}/patients/{subject}/timeline?view={VIEW}')
+    assert status == 200 and body
+    assert get(f'{server}/patients/Patient/unknown/timeline?view={VIEW}') == (200, [])
+    assert get(f'{server}/tf?view=no_such_view')[0] == 404
+
+    bad = 'irae__highlights_bad'
+    filetool.path_highlights(f'{bad}.pivot.tf.csv').write_text('a,b\n1,2,3,4\n"unterminated\n')
+    assert get(f'{server}/tf?view={bad}')[0] == 422
+    filetool.path_highlights(f'{bad}.pivot.tf.csv').write_text('a,b\n1,2\n')
+    assert get(f'{server}/tf?view={bad}')[0] == 422
+    assert bad not in get(f'{server}/views')[1]
+
+def test_view_name_is_validated(server, view_csv):
+    for view in ['../..', '..%2F..%2Fetc', '/etc/passwd', 'a/b']:
+        assert get(f'{server}/tf?view={view}')[0] == 400
+
+def test_rebuilt_pivot_is_reloaded(server, view_csv):
+    dag.run([dag.make_job('donor')], ['tf'])
+    pivot_csv = filetool.path_highlights(f'{VIEW}.pivot.csv')
+    subject = pd.read_csv(pivot_csv)[SUBJECT_REF].iloc[0]
+    url = f'{server}/patients/{subject}/timeline?view={VIEW}'
+    before = get(url)[1]
+    assert before
+
+    pivot_df = pd.read_csv(pivot_csv)
+    pivot_df[pivot_df[SUBJECT_REF] == subject].iloc[:1].to_csv(pivot_csv, index=False)
+    timeline.build_index(pivot_csv)
+    later = pivot_csv.stat().st_mtime_ns + 10**9
+    os.utime(pivot_csv, ns=(later, later))
+    assert len(get(url)[1]) == 1
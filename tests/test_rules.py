@@ -0,0 +1,51 @@
+import pytest
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import rules
+
+CMV_DONOR, CMV_RECIPIENT = rules.SEROSTATUS[('donor', 'cmv')], rules.SEROSTATUS[('recipient', 'cmv')]
+EBV_RECIPIENT = rules.SEROSTATUS[('recipient', 'ebv')]
+POS, NEG = study.Serostatus.SEROPOSITIVE, study.Serostatus.SERONEGATIVE
+
+def values(text: str) -> dict:
+    out = dict()
+    for field, rule in rules.extract_rules(text).items():
+        value = next(getattr(rule.mention, name) for name in type(rule.mention).model_fields
+                     if name not in study.SpanAugmentedMention.model_fields)
+        out[field] = (value, rule.confidence)
+    return out
+
+@pytest.mark.parametrize('text, count, confidence', [
+    ('HLA: 2/6 mismatch', '2', rules.HIGH),
+    ('zero antigen mismatch', '0', rules.HIGH),
+    ('5 HLA mismatches', '5', rules.HIGH),
+    ('6/6 match with donor', '0', rules.MEDIUM),
+])
+def test_hla_mismatch(text, count, confidence):
+    found = values(text)
+    assert found[rules.MISMATCH] == (study.DonorHlaMismatchCount(count), confidence)
+    assert found[rules.QUALITY][0] == rules._quality(int(count))
+
+def test_serostatus_explicit_form():
+    found = values('Serologies: CMV D+/R-')
+    assert found == {CMV_DONOR: (POS, rules.HIGH), CMV_RECIPIENT: (NEG, rules.HIGH)}
+    assert rules.extract_rules('Serologies: CMV D+/R-')[CMV_DONOR].mention.spans == ['CMV D+/R-']
+
+def test_negative_results_are_seronegative():
+    # "negative" is a value, not a negated mention; the donor match is masked
+    # so it is not read again as a recipient "CMV IgG negative"
+    found = values('donor CMV IgG negative, EBV IgG neg')
+    assert found == {CMV_DONOR: (NEG, rules.HIGH), EBV_RECIPIENT: (NEG, rules.MEDIUM)}
+
+@pytest.mark.parametrize('text', [
+    'HLA-A2 typing sent, CMV viremia resolved',
+    'no donor CMV serology available',
+    'EBV PCR pending',
+    '',
+])
+def test_no_rule_fires(text):
+    assert rules.find_hits(text) == []
+
+def test_conflicting_values_are_left_out():
+    found = values('CMV D+/R-. Later: donor CMV negative')
+    assert CMV_DONOR not in found
+    assert found[CMV_RECIPIENT] == (NEG, rules.HIGH)
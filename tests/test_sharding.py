@@ -0,0 +1,17 @@
+import shutil
+from kidney_transplant_llm.postproc import dag, filetool, sharding
+from conftest import VIEW
+
+def test_merged_shards_equal_single_node(view_csv, tmp_path):
+    dag.run([dag.make_job('donor')], ['tf'])
+    reference = tmp_path / 'single'
+    shutil.copytree(filetool.path_highlights(''), reference)
+    for suffix in sharding.MERGED_SUFFIXES:
+        filetool.path_highlights(f'{VIEW}{suffix}').unlink()
+
+    n = 3
+    dag.run([dag.make_job('donor', shard=(i, n)) for i in range(n)], ['tf'])
+    sharding.merge_view(VIEW, n)
+    assert sharding.compare_outputs(VIEW, reference) == {f'{VIEW}{suffix}': True
+                                                         for suffix in sharding.MERGED_SUFFIXES}
+    assert sharding.verify_merge(VIEW)
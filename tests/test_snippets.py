@@ -0,0 +1,59 @@
+import pandas as pd
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import snippets
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF, DOCUMENT_REF
+
+CMV = 'CMV D+/R-'
+LIVING = 'living related donor'
+NOTES = {
+    'DocumentReference/1': f'Donor: {LIVING}. Serostatus {CMV}.',
+    'DocumentReference/2': f'Copied forward: {LIVING}. Serostatus {CMV}.',
+    'DocumentReference/3': f'{CMV} noted.',
+}
+
+def at(note: str, text: str) -> str:
+    start = NOTES[note].index(text)
+    return f'{start}:{start + len(text)}'
+
+def test_span_snippets_slice_note_text():
+    highlights = pd.DataFrame({
+        SUBJECT_REF: ['Patient/1', 'Patient/1', 'Patient/2', 'Patient/3'],
+        DOCUMENT_REF: ['DocumentReference/1', 'DocumentReference/2', 'DocumentReference/3', 'DocumentReference/9'],
+        'sublabel_name': ['Donor Serostatus Cmv', 'Donor Type', 'Donor Serostatus Cmv', 'Donor Type'],
+        'span': [at('DocumentReference/1', CMV),
+                 f"[[{at('DocumentReference/2', LIVING).replace(':', ', ')}], "
+                 f"[{at('DocumentReference/2', CMV).replace(':', ', ')}]]",
+                 at('DocumentReference/3', CMV),
+                 '0:5'],
+    })
+    evidence = snippets.span_snippets(highlights, NOTES)
+    # DocumentReference/9 has no text, the span of it is skipped
+    assert evidence[snippets.TEXT_COL].tolist() == [CMV, LIVING, CMV, CMV]
+
+    index = snippets.SnippetIndex.encode(evidence)
+    assert list(index.snippets) == [CMV, LIVING]
+    assert index.notes(CMV) == ['DocumentReference/1', 'DocumentReference/2', 'DocumentReference/3']
+    assert index.notes(LIVING) == ['DocumentReference/2']
+    assert index.notes('12:40') == []
+    counts = index.counts()
+    assert counts[snippets.TEXT_COL].tolist() == [CMV, LIVING]
+    assert counts['notes'].tolist() == [3, 1]
+
+def test_mention_snippets_round_trip(phi_dir):
+    model = study.KidneyTransplantDonorGroupAnnotation
+    mentions = {name: field.annotation() for name, field in model.model_fields.items()}
+    mentions['donor_type_mention'] = study.DonorTypeMention(has_mention=True, spans=[LIVING])
+    mentions['donor_serostatus_cmv_mention'] = study.SerostatusDonorCMVMention(has_mention=True, spans=[CMV, CMV])
+    annotation = model(**mentions)
+    evidence = snippets.mention_snippets([('Patient/1', 'DocumentReference/1', annotation),
+                                          ('Patient/2', 'DocumentReference/3', annotation)])
+    index = snippets.SnippetIndex.encode(evidence)
+    assert sorted(index.snippets) == sorted([CMV, LIVING])
+    assert len(index.rows(CMV)) == 4
+
+    index.save('test')
+    loaded = snippets.SnippetIndex.load('test')
+    assert loaded.notes(CMV) == index.notes(CMV) == ['DocumentReference/1', 'DocumentReference/3']
+    decoded = loaded.decode().astype(str)
+    pd.testing.assert_frame_equal(decoded.sort_values(list(decoded.columns), ignore_index=True),
+                                  evidence.astype(str).sort_values(list(decoded.columns), ignore_index=True))
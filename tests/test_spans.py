@@ -0,0 +1,34 @@
+import pandas as pd
+from kidney_transplant_llm.postproc import spans
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF, DOCUMENT_REF
+
+def highlights() -> pd.DataFrame:
+    return pd.DataFrame({
+        SUBJECT_REF: ['Patient/1', 'Patient/1', 'Patient/1', 'Patient/2', 'Patient/2'],
+        DOCUMENT_REF: ['Doc/1', 'Doc/1', 'Doc/1', 'Doc/2', 'Doc/2'],
+        'sublabel_name': ['Donor Type', 'Donor Relationship', 'Transplant Date', 'Donor Type', 'Donor Relationship'],
+        spans.SPAN_COL: ['10:40', '[[30, 50], [60, 70]]', None, '5-9', '9:20'],
+    })
+
+def test_parse_spans():
+    parsed = spans.parse_spans(pd.Series(['12:40', '[[12, 40], [51, 60]]', None, 'none', '7-8']))
+    assert parsed.values.tolist() == [[0, 12, 40], [1, 12, 40], [1, 51, 60], [4, 7, 8]]
+    assert (parsed.dtypes == 'int32').all()
+
+def test_spans_df_is_compact():
+    df = spans.spans_df(highlights())
+    assert len(df) == 5
+    for col in [SUBJECT_REF, DOCUMENT_REF, 'sublabel_name']:
+        assert isinstance(df[col].dtype, pd.CategoricalDtype)
+    assert df['start'].dtype == 'int32' and df['end'].dtype == 'int32'
+    assert df[[DOCUMENT_REF, 'start']].astype(str).values.tolist() == [
+        ['Doc/1', '10'], ['Doc/1', '30'], ['Doc/1', '60'], ['Doc/2', '5'], ['Doc/2', '9']]
+
+def test_overlaps_and_contains():
+    df = spans.spans_df(highlights())
+    # Doc/1: 10-40 overlaps 30-50; Doc/2: 5-9 ends where 9-20 starts
+    assert spans.overlaps(df, 'Donor Type', 'Donor Relationship').to_dict() == {'Doc/1': True, 'Doc/2': False}
+    assert spans.contains(df, 'Donor Relationship', 'Donor Type').to_dict() == {'Doc/1': False, 'Doc/2': False}
+    inner = pd.concat([highlights(), highlights().iloc[[0]].assign(sublabel_name='Hla Match Quality', span='15:20')])
+    assert spans.contains(spans.spans_df(inner), 'Donor Type', 'Hla Match Quality').to_dict() == {'Doc/1': True}
+    assert spans.overlaps(df, 'Donor Type', 'Cancer').empty
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm.postproc import store
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF
+
+ARTIFACT = 'irae__highlights_donor_index.pivot'
+
+def test_round_trip(phi_dir):
+    df = pd.DataFrame({SUBJECT_REF: ['P/1', 'P/2', 'P/3'],
+                       'DSA': [True, False, True],
+                       'count': [1, 2, 3],
+                       'score': [0.5, np.nan, 1.5],
+                       'Donor Type': ['living', None, 'living']})
+    store.save_df(df, ARTIFACT)
+    assert store.exists(ARTIFACT)
+    loaded = store.load_df(ARTIFACT, mmap=False)
+    pd.testing.assert_frame_equal(loaded, df, check_dtype=False, check_categorical=False)
+    assert loaded['DSA'].dtype == bool
+    assert loaded['count'].dtype == 'int64'
+    assert isinstance(loaded[SUBJECT_REF].dtype, pd.CategoricalDtype)
+    mapped = store.load_df(ARTIFACT, columns=['count'])
+    assert mapped.columns.tolist() == ['count']
+    assert mapped['count'].tolist() == [1, 2, 3]
+
+def test_bool_with_missing_values(phi_dir):
+    # ANY policy: a subject without any mention has no value
+    df = pd.DataFrame({'DSA': [True, np.nan, False]}, dtype=object)
+    store.save_df(df, ARTIFACT)
+    loaded = store.load_df(ARTIFACT)['DSA']
+    assert loaded.dtype == 'boolean'
+    assert loaded.tolist() == [True, pd.NA, False]
+
+def test_csv_round_trip(phi_dir, tmp_path):
+    csv = tmp_path / f'{ARTIFACT}.csv'
+    csv.write_text('subject_ref,DSA\nP/1,True\nP/2,\nP/3,False\n')
+    store.csv_to_store(csv)
+    loaded = store.load_df(ARTIFACT)
+    assert loaded[SUBJECT_REF].tolist() == ['P/1', 'P/2', 'P/3']
+    assert loaded['DSA'].tolist() == [True, pd.NA, False]
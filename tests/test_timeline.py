@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from kidney_transplant_llm.postproc import pivot_table, timeline
+from kidney_transplant_llm.postproc.schema import SUBJECT_REF, SORT_BY_DATE
+
+@pytest.fixture
+def pivot_df(view_df) -> pd.DataFrame:
+    return pivot_table.pivot_highlights_df(view_df, aggfunc=pivot_table.MAJORITY,
+                                           policies=pivot_table.SUBLABEL_POLICIES)
+
+def test_lookup_matches_pivot(pivot_df, tmp_path):
+    pivot_csv = tmp_path / 'view.pivot.csv'
+    pivot_df.to_csv(pivot_csv, index=False)
+    index_df = pd.read_csv(timeline.build_index(pivot_csv))
+    assert index_df['row_stop'].iloc[-1] == len(pivot_df)
+    assert index_df['byte_stop'].iloc[-1] == pivot_csv.stat().st_size
+
+    full = pd.read_csv(pivot_csv)
+    for subject in full[SUBJECT_REF].unique():
+        expected = full[full[SUBJECT_REF] == subject].sort_values(SORT_BY_DATE, kind='stable', ignore_index=True)
+        # types are guessed per block, e.g. an int column is float where the file has blanks
+        pd.testing.assert_frame_equal(timeline.lookup(pivot_csv, subject), expected, check_dtype=False)
+    assert timeline.lookup(pivot_csv, 'Patient/unknown').empty
+
+def test_empty_and_unsorted(pivot_df, tmp_path):
+    pivot_csv = tmp_path / 'view.pivot.csv'
+    pivot_df.iloc[:0].to_csv(pivot_csv, index=False)
+    assert pd.read_csv(timeline.build_index(pivot_csv)).empty
+
+    pd.concat([pivot_df, pivot_df.iloc[:1]]).to_csv(pivot_csv, index=False)
+    with pytest.raises(ValueError):
+        timeline.build_index(pivot_csv)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import usage
+
+DONOR = study.KidneyTransplantDonorGroupAnnotation
+
+def test_empty_run(phi_dir):
+    recorder = usage.UsageRecorder('empty')
+    summary = recorder.summary_df()
+    assert summary.empty
+    assert 'latency_p99' in summary.columns
+    assert recorder.save().exists()
+
+def test_percentiles_and_cost():
+    recorder = usage.UsageRecorder('run')
+    for latency in range(1, 101):
+        with recorder.measure(DONOR, 'gpt') as call:
+            call.prompt_tokens, call.completion_tokens = 1000, 100
+        recorder.calls[-1].latency = float(latency)
+    with pytest.raises(RuntimeError):
+        with recorder.measure(DONOR, 'other'):
+            raise RuntimeError('timeout')
+
+    summary = recorder.summary_df(prices={'gpt': (2.0, 10.0)}).set_index('origin')
+    gpt = summary.loc['gpt']
+    assert (gpt['calls'], gpt['errors']) == (100, 0)
+    expected = np.percentile(np.arange(1, 101), usage.PERCENTILES)
+    assert [gpt[f'latency_p{p}'] for p in usage.PERCENTILES] == pytest.approx(expected)
+    assert gpt['cost_usd'] == pytest.approx(100 * (1000 * 2.0 + 100 * 10.0) / 1e6)
+    assert gpt['fields'] == len(DONOR.model_fields)
+    assert summary.loc['other', 'errors'] == 1
+    assert pd.isna(summary.loc['other', 'cost_usd'])
+
+def test_track_retries():
+    recorder = usage.UsageRecorder('run')
+    attempts = iter([ValueError('bad json'), {'usage': {'prompt_tokens': 7, 'completion_tokens': 3}}])
+
+    def extract():
+        result = next(attempts)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    recorder.track(extract, DONOR, 'gpt')
+    call = recorder.calls_df().iloc[0]
+    assert (call['retries'], call['prompt_tokens'], call['completion_tokens'], call['ok']) == (1, 7, 3, True)
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from kidney_transplant_llm import pydantic_study_variables as study
+from kidney_transplant_llm.postproc import filetool, vocab
+
+def test_label_vocab():
+    assert vocab.label_vocab(study.DonorTypeMention)[-3:] == ['LIVING', 'DECEASED', 'NOT_MENTIONED']
+    assert 'true' in vocab.label_vocab(study.MultipleTransplantHistoryMention)
+    # deceased_date is free text
+    assert vocab.label_vocab(study.DeceasedMention) is None
+    assert 'Transplant Date' not in vocab.display_vocab()
+
+def test_oov_is_case_insensitive_and_numeric():
+    df = pd.DataFrame({
+        'sublabel_name': ['Multiple Transplant History'] * 5 + ['Hla Mismatch Count'] * 4
+                         + ['Donor Type'] * 2 + ['Transplant Date'],
+        'sublabel_value': ['true', 'FALSE', 'True', '1.0', 'maybe',
+                           '0.0', '2', 'two', '7',
+                           'living', 'alive',
+                           'anything'],
+    })
+    oov = vocab.oov_mask(df)
+    np.testing.assert_array_equal(oov, [False, False, False, False, True,
+                                        False, False, False, True,
+                                        False, True,
+                                        False])
+
+def test_validate_csv(phi_dir):
+    df = pd.DataFrame({'origin': ['a', 'a', 'b'],
+                       'sublabel_name': ['Donor Type', 'Donor Type', 'Donor Type'],
+                       'sublabel_value': ['LIVING', 'unknown', 'deceased']})
+    df.to_csv(filetool.path_highlights('view.csv'), index=False)
+    report = pd.read_csv(vocab.validate_csv('view.csv'))
+    assert report[['origin', 'rows', 'oov']].values.tolist() == [['a', 2, 1], ['b', 1, 0]]